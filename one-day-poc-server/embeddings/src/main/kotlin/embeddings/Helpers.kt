@@ -1,5 +1,6 @@
 package embeddings
 
+import kotlinx.serialization.SerialName
 import kotlinx.serialization.Serializable
 
 /**
@@ -13,6 +14,7 @@ internal object EmbeddingConstants {
     const val EMBED_URL = "$EMBEDDING_SERVICE_URL/embed"
     const val EMBED_AND_STORE_URL = "$EMBEDDING_SERVICE_URL/new"
     const val SEMANTIC_SEARCH_URL = "$EMBEDDING_SERVICE_URL/search"
+    const val RETRIEVE_URL = "$EMBEDDING_SERVICE_URL/retrieve"
 }
 
 /**
@@ -23,11 +25,13 @@ internal object EmbeddingConstants {
  *
  * @property status The status of the embedding request ("success" or error code)
  * @property embedding The generated embedding as a serialized string, or null if failed
+ * @property encoding How the embedding was encoded; always "json" unless a compact encoding was requested
  */
 @Serializable
 data class TemplateEmbedResponse(
     val status: String,
     val embedding: List<Float> = emptyList(),
+    val encoding: String = "json",
 )
 
 /**
@@ -54,12 +58,16 @@ data class StoreTemplateResponse(
  * based on semantic similarity.
  *
  * @property status The status of the search request ("success" or error code)
- * @property matches A list of template identifiers matching the search criteria
+ * @property matches A list of template identifiers matching the search criteria, best match first
+ * @property scores The fused relevance score of each entry in [matches]
+ * @property timedOut The retrievers ("semantic", "keyword") that did not answer in time and are missing from [matches]
  */
 @Serializable
 data class TemplateSearchResponse(
     val status: String,
     val matches: List<String> = emptyList(),
+    val scores: List<Double> = emptyList(),
+    @SerialName("timed_out") val timedOut: List<String> = emptyList(),
 )
 
 /**
@@ -76,3 +84,19 @@ internal data class SearchData(
     val embedding: List<Float>,
     val query: String,
 )
+
+/**
+ * Represents a request for combined embedding and search.
+ *
+ * The embedding service embeds the query itself, so no embedding vector
+ * has to be sent back and forth.
+ *
+ * @property query The text query to find matching templates for
+ * @property filters Facets of the JSON-LD metadata (e.g. "framework") mapped to the values a template must have
+ * one of; templates that do not match are not considered. Left out of the request when empty.
+ */
+@Serializable
+internal data class RetrieveData(
+    val query: String,
+    val filters: Map<String, List<String>> = emptyMap(),
+)
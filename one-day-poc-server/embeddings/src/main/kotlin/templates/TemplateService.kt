@@ -1,6 +1,7 @@
 package templates
 
 import embeddings.EmbeddingConstants
+import embeddings.RetrieveData
 import embeddings.SearchData
 import embeddings.StoreTemplateResponse
 import embeddings.TemplateEmbedResponse
@@ -132,4 +133,35 @@ object TemplateService {
             }
         return searchResponse
     }
+
+    /**
+     * Finds templates matching a text query in a single request.
+     *
+     * The embedding service embeds the query and runs the semantic and keyword
+     * searches itself, which saves the separate [embed] round-trip before [search].
+     *
+     * @param query The text query to match templates against
+     * @param filters Facet values the matching templates must have, e.g. mapOf("framework" to listOf("React"))
+     * @return Search response containing matching template identifiers
+     * @throws IllegalStateException If the response from the embedding service cannot be parsed
+     */
+    suspend fun retrieve(
+        query: String,
+        filters: Map<String, List<String>> = emptyMap(),
+    ): TemplateSearchResponse {
+        val payload = RetrieveData(query, filters)
+        val response =
+            httpClient
+                .post(EmbeddingConstants.RETRIEVE_URL) {
+                    header(HttpHeaders.ContentType, "application/json")
+                    setBody(Json.encodeToString(payload))
+                }
+
+        val responseText = response.bodyAsText()
+        val searchResponse =
+            runCatching { Json.decodeFromString<TemplateSearchResponse>(responseText) }.getOrElse {
+                error(EXCEPTION_COULD_NOT_STORE_TEMPLATE)
+            }
+        return searchResponse
+    }
 }
@@ -0,0 +1,99 @@
+"""
+Measures recall@k, per-query latency and memory of the approximate and reduced-precision index types
+against the exact flat baseline.
+
+Usage: python -m benchmarks.ann_recall [--vectors N] [--queries Q] [--top-k K] [--types hnsw,ivf_flat,...]
+                                       [--templates PATH]
+Vectors are synthetic: unit-normalized points drawn around random centres, so that neighbourhoods are
+clustered the way template embeddings are. With --templates, the templates at PATH (a directory of JSON-LD
+files or a JSONL stream, as for ingest) are embedded instead and queried with slightly perturbed copies.
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from information_retrieval.data_handler import VECTOR_DIMENSION
+from information_retrieval.vector_search.index_factory import create_index, train
+
+
+def cluster_means(centres: int, rng) -> np.ndarray:
+    return rng.standard_normal((centres, VECTOR_DIMENSION)).astype(np.float32)
+
+
+def clustered_vectors(n: int, means: np.ndarray, rng) -> np.ndarray:
+    vectors = means[rng.integers(0, len(means), n)] + 0.3 * rng.standard_normal((n, VECTOR_DIMENSION)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def template_vectors(path: str, queries: int, rng) -> tuple[np.ndarray, np.ndarray]:
+    # Imported here so that synthetic runs need neither the model nor the keyword index.
+    from information_retrieval.ingest import read_records
+    from information_retrieval.vector_search.embedder import embed_batch
+    vectors = np.array(embed_batch([text for _, text in read_records(path)]), dtype=np.float32)
+    picked = vectors[rng.integers(0, len(vectors), queries)]
+    noisy = picked + 0.05 * rng.standard_normal(picked.shape).astype(np.float32)
+    return vectors, noisy / np.linalg.norm(noisy, axis=1, keepdims=True)
+
+
+def bytes_per_vector(index) -> float:
+    return len(faiss.serialize_index(index)) / max(index.ntotal, 1)
+
+
+def timed_search(index, queries: np.ndarray, top_k: int):
+    """Searches one query at a time, as the service does, returning ids and per-query latencies in ms."""
+    ids, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, found = index.search(query.reshape(1, -1), top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append(found[0])
+    return np.array(ids), np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--types", default="hnsw,ivf_flat,ivf_pq,sq_fp16,sq_int8,binary")
+    parser.add_argument("--templates")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.templates:
+        vectors, queries = template_vectors(args.templates, args.queries, rng)
+        args.top_k = min(args.top_k, len(vectors))
+    else:
+        # Queries are drawn around the same centres as the vectors, so that they land in populated neighbourhoods.
+        means = cluster_means(max(args.vectors // 100, 10), rng)
+        vectors = clustered_vectors(args.vectors, means, rng)
+        queries = clustered_vectors(args.queries, means, rng)
+
+    ids = np.arange(len(vectors), dtype=np.int64)
+    flat = create_index(VECTOR_DIMENSION, "flat")
+    flat.add_with_ids(vectors, ids)
+    truth, flat_latencies = timed_search(flat, queries, args.top_k)
+
+    print(f"{'index':<10} {'build s':>8} {f'recall@{args.top_k}':>10} {'mean ms':>8} {'p99 ms':>8} {'bytes/vec':>10}")
+    print(f"{'flat':<10} {0:>8.2f} {1:>10.3f} {flat_latencies.mean():>8.3f} {np.percentile(flat_latencies, 99):>8.3f} "
+          f"{bytes_per_vector(flat):>10.0f}")
+    for index_type in args.types.split(","):
+        start = time.perf_counter()
+        index = create_index(VECTOR_DIMENSION, index_type)
+        if not train(index, vectors):
+            print(f"{index_type:<10} skipped: not enough vectors to train")
+            continue
+        index.add_with_ids(vectors, ids)
+        build = time.perf_counter() - start
+
+        found, latencies = timed_search(index, queries, args.top_k)
+        recall = np.mean([len(set(f) & set(t)) / args.top_k for f, t in zip(found, truth)])
+        print(f"{index_type:<10} {build:>8.2f} {recall:>10.3f} {latencies.mean():>8.3f} {np.percentile(latencies, 99):>8.3f} "
+              f"{bytes_per_vector(index):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Synthetic template corpus for benchmarks: JSON-LD annotations shaped like the real ones (with the facet fields
+filled in), embedding-like vectors clustered by the kind of component, and keyword queries drawn from the same
+vocabulary. Everything is derived from a seed, so a corpus can be regenerated exactly instead of being stored.
+
+Usage: python -m benchmarks.corpus N OUTPUT [--seed S]
+Writes N templates to OUTPUT as JSONL, in the format `python -m information_retrieval.ingest` reads.
+"""
+import argparse
+import json
+import random
+
+import numpy as np
+
+from information_retrieval.data_handler import VECTOR_DIMENSION
+
+COMPONENTS = ["login form", "signup form", "dashboard", "chat window", "file upload", "expense chart",
+              "profile page", "settings panel", "checkout flow", "calendar", "kanban board", "search bar",
+              "data table", "landing page", "notification centre", "image gallery"]
+FEATURES = ["dark mode", "OAuth", "pagination", "drag and drop", "live updates", "mobile layout", "accessibility",
+            "form validation", "infinite scroll", "keyboard shortcuts", "offline support", "internationalisation",
+            "charts", "animations", "two-factor authentication", "CSV export"]
+CATEGORIES = ["authentication", "analytics", "communication", "commerce", "productivity", "media", "administration"]
+FRAMEWORKS = ["react", "vue", "angular", "svelte", "solid", "next.js"]
+LANGUAGES = ["typescript", "javascript"]
+VECTOR_BLOCK = 64  # rows of vectors() drawn from one seed
+
+
+def template(i: int, rng: random.Random) -> tuple[str, dict]:
+    component = COMPONENTS[i % len(COMPONENTS)]
+    features = rng.sample(FEATURES, 3)
+    name = f"{component.title().replace(' ', '')}{i}"
+    return name, {
+        "@context": "https://schema.org",
+        "@type": "SoftwareSourceCode",
+        "name": name,
+        "description": f"A {component} with {features[0]}, {features[1]} and {features[2]}.",
+        "applicationCategory": rng.choice(CATEGORIES),
+        "framework": rng.choice(FRAMEWORKS),
+        "programmingLanguage": rng.choice(LANGUAGES),
+        "keywords": [component, *features],
+    }
+
+
+def templates(n: int, seed: int = 0):
+    """Yields n (name, JSON-LD metadata) pairs."""
+    rng = random.Random(seed)
+    for i in range(n):
+        yield template(i, rng)
+
+
+def vectors(start: int, count: int, seed: int = 0) -> np.ndarray:
+    """
+    Unit vectors for templates start..start+count, drawn around one centre per kind of component, so that
+    templates of the same kind are neighbours. Any slice can be generated on its own, and holds the same vectors
+    as the same rows of a larger slice: the noise of every VECTOR_BLOCK rows comes from its own seed.
+    """
+    if count <= 0:
+        return np.empty((0, VECTOR_DIMENSION), dtype=np.float32)
+    centres = np.random.default_rng(seed).standard_normal((len(COMPONENTS), VECTOR_DIMENSION)).astype(np.float32)
+    first, last = start // VECTOR_BLOCK, (start + count - 1) // VECTOR_BLOCK
+    noise = np.concatenate([np.random.default_rng([seed, block]).standard_normal((VECTOR_BLOCK, VECTOR_DIMENSION))
+                            for block in range(first, last + 1)])
+    offset = start - first * VECTOR_BLOCK
+    positions = np.arange(start, start + count) % len(COMPONENTS)
+    drawn = centres[positions] + 0.3 * noise[offset:offset + count].astype(np.float32)
+    return drawn / np.linalg.norm(drawn, axis=1, keepdims=True)
+
+
+def queries(n: int, seed: int = 0) -> list[str]:
+    """Keyword queries of the kind users type: a component, sometimes with a feature."""
+    rng = random.Random(seed + 1)
+    return [f"{rng.choice(COMPONENTS)} {rng.choice(FEATURES)}" if rng.random() < 0.7 else rng.choice(COMPONENTS)
+            for _ in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("templates", type=int)
+    parser.add_argument("output")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.output, "w") as f:
+        for name, data in templates(args.templates, args.seed):
+            f.write(json.dumps({"name": name, "text": json.dumps(data)}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compares the memory allocated and time taken per call by the embedding post-processing path (model output to
+the vector handed to the index, or to the JSON list for /embed) before and after it was kept as float32 arrays.
+Before, every embedding was turned into lists whether or not it was returned as JSON.
+The model itself is not run: both paths start from the same encoded batch, so only the conversions are measured.
+
+Usage: python -m benchmarks.embedding_allocations [--calls N] [--batch-size B]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from information_retrieval.data_handler import VECTOR_DIMENSION
+from information_retrieval.vector_search.embedder import normalize
+
+
+def list_normalize(embedding: list[float]) -> list[float]:
+    """The former embedder.normalize: list in, list out, via a float64 array."""
+    embedding = np.array(embedding)
+    norm = np.linalg.norm(embedding)
+    return (embedding / norm).tolist() if norm != 0 else embedding.tolist()
+
+
+def list_path(encoded: np.ndarray):
+    embeddings = [list_normalize(vector.tolist()) for vector in encoded]
+    vectors = [np.array(embedding) for embedding in embeddings]  # as /new wrapped it again before storing
+    return vectors, embeddings
+
+
+def array_path(encoded: np.ndarray):
+    return normalize(encoded)  # what /new and /retrieve use
+
+
+def array_json_path(encoded: np.ndarray):
+    return normalize(encoded).tolist()  # /embed builds the list only at the JSON boundary
+
+
+def measure(label: str, path, batch: np.ndarray, calls: int):
+    tracemalloc.start()
+    peaks = []
+    for _ in range(calls):
+        encoded = batch.copy()  # the model returns a fresh array on every call
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        path(encoded)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        path(batch.copy())
+    elapsed = (time.perf_counter() - start) / calls
+    print(f"{label:<24} {np.mean(peaks) / 1024:>12.1f} {elapsed * 1e6:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=1)
+    args = parser.parse_args()
+
+    batch = np.random.default_rng(0).standard_normal((args.batch_size, VECTOR_DIMENSION)).astype(np.float32)
+    print(f"{'path':<24} {'peak KiB':>12} {'us/call':>10}")
+    measure("lists (before)", list_path, batch, args.calls)
+    measure("float32 arrays", array_path, batch, args.calls)
+    measure("float32 arrays + JSON", array_json_path, batch, args.calls)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Compares the embedding backends on CPU: per-prompt latency when prompts are encoded one at a time, batch
+throughput, and the lowest cosine similarity of each backend's embeddings to PyTorch's.
+The embedding cache is bypassed, so every prompt goes through the model.
+
+Usage: python -m benchmarks.embedding_backends [--backends torch,onnx,int8] [--prompts N] [--batch-size B]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.embedding_throughput import sample_prompts
+from information_retrieval.vector_search.embedder import BACKENDS, load_model, normalize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--prompts", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    prompts = sample_prompts(args.prompts)
+    reference = None
+    print(f"{'backend':<8} {'load s':>8} {'p50 ms':>8} {'p99 ms':>8} {'batch/s':>10} {'min cos':>8}")
+    for backend in args.backends.split(","):
+        start = time.perf_counter()
+        model = load_model(backend)
+        load = time.perf_counter() - start
+        model.encode(prompts[0])  # warm-up
+
+        latencies = []
+        for prompt in prompts:
+            start = time.perf_counter()
+            model.encode(prompt)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        embeddings = normalize(model.encode(prompts, batch_size=args.batch_size))
+        throughput = len(prompts) / (time.perf_counter() - start)
+
+        if reference is None:
+            reference = embeddings  # the first backend listed is the one the others are compared with
+        similarity = np.sum(reference * embeddings, axis=1).min()
+        print(f"{backend:<8} {load:>8.2f} {np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 99):>8.2f} "
+              f"{throughput:>10.1f} {similarity:>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
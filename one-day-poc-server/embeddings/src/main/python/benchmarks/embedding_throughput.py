@@ -0,0 +1,62 @@
+"""
+Compares embedding throughput (requests/s) for one-text-per-call embedding against batched embedding.
+The embedding cache is disabled, as every run embeds the same prompts and would otherwise only measure the cache.
+
+Usage: python -m benchmarks.embedding_throughput [--requests N] [--clients C] [--window-ms W] [--batch-size B]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from information_retrieval.vector_search import embedder as emb
+from information_retrieval.vector_search.batcher import MicroBatcher
+from information_retrieval.vector_search.embedding_cache import EmbeddingCache
+
+
+def sample_prompts(n: int) -> list[str]:
+    subjects = ["login form", "dashboard", "chat window", "file upload", "expense chart", "profile page"]
+    features = ["dark mode", "OAuth", "pagination", "drag and drop", "live updates", "mobile layout"]
+    return [f"A {subjects[i % len(subjects)]} with {features[(i // len(subjects)) % len(features)]} #{i}"
+            for i in range(n)]
+
+
+def measure(label: str, run, n: int) -> float:
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    throughput = n / elapsed
+    print(f"{label:<40} {throughput:>10.1f} req/s ({elapsed:.2f}s)")
+    return throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    prompts = sample_prompts(args.requests)
+    emb.cache = EmbeddingCache(max_entries=0)
+    emb.embed(prompts[0])  # warm-up
+
+    single = measure("sequential embed()", lambda: [emb.embed(p) for p in prompts], len(prompts))
+    measure("embed_batch()", lambda: emb.embed_batch(prompts, batch_size=args.batch_size), len(prompts))
+
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        concurrent = measure(f"{args.clients} clients, embed()",
+                             lambda: list(pool.map(emb.embed, prompts)), len(prompts))
+
+    batcher = MicroBatcher(lambda texts: emb.embed_batch(texts, batch_size=args.batch_size),
+                           window_ms=args.window_ms, max_batch_size=args.batch_size)
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        batched = measure(f"{args.clients} clients, micro-batched ({args.window_ms}ms)",
+                          lambda: list(pool.map(batcher.embed, prompts)), len(prompts))
+
+    print(f"Micro-batching speed-up: {batched / single:.1f}x over sequential, "
+          f"{batched / concurrent:.1f}x over unbatched concurrent calls")
+
+
+if __name__ == "__main__":
+    main()
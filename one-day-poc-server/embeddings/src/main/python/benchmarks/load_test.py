@@ -0,0 +1,86 @@
+"""
+Load-tests the production server: for each worker count, starts gunicorn, waits for /ready and reports the
+throughput and latency of concurrent /retrieve requests.
+
+Usage: python -m benchmarks.load_test [--workers 1,2,4] [--requests N] [--clients C] [--port P]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.embedding_throughput import sample_prompts
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def post(url: str, payload: dict) -> dict:
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def wait_until_ready(url: str, server: subprocess.Popen, timeout: float = 300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode} before becoming ready")
+        try:
+            with urllib.request.urlopen(f"{url}/ready") as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"Server at {url} was not ready within {timeout}s")
+
+
+def run_load(url: str, prompts: list[str], clients: int) -> tuple[float, np.ndarray]:
+    def timed(prompt):
+        start = time.perf_counter()
+        post(f"{url}/retrieve", {"query": prompt})
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = np.array(list(pool.map(timed, prompts)))
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--port", type=int, default=7100)
+    args = parser.parse_args()
+
+    url = f"http://127.0.0.1:{args.port}"
+    prompts = sample_prompts(args.requests)
+    print(f"{'workers':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for workers in (int(count) for count in args.workers.split(",")):
+        env = dict(os.environ, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(args.threads), PORT=str(args.port))
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+                                   "information_retrieval.wsgi:app"], cwd=SERVICE_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_ready(url, server)
+            run_load(url, prompts[:args.clients * workers], args.clients)  # lets every worker answer once
+            elapsed, latencies = run_load(url, prompts, args.clients)
+            print(f"{workers:>8} {len(prompts) / elapsed:>10.1f} {np.percentile(latencies, 50) * 1000:>10.1f} "
+                  f"{np.percentile(latencies, 99) * 1000:>10.1f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Benchmarks the retrieval service end to end on synthetic corpora of increasing size and writes the results as
+JSON, so that runs can be compared to catch regressions.
+
+For each scale it measures, in a fresh temporary data directory:
+- ingest throughput, one template per store_embedding/store_jsonld call and in batches through
+  store_embeddings/store_jsonld_batch,
+- save_data and load_data times and the size of the files,
+- the process's memory footprint once the corpus is loaded,
+- semantic_search and keyword_search latency percentiles,
+- /search throughput and latency with concurrent clients, with the result cache disabled and then with
+  every query repeated from the cache.
+
+Usage: python -m benchmarks.retrieval_suite [--scales 1k,100k,1m] [--queries Q] [--clients C] [--output FILE]
+Runs offline: embeddings come from benchmarks.corpus rather than the model. Progress goes to stderr and the
+JSON report to stdout, or to FILE with --output. The default scales are 1k and 100k; 1m needs several GB of
+memory and takes a while to index.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+import faiss
+import numpy as np
+
+from benchmarks import corpus
+from information_retrieval import data_handler as dh, embedding_service as es, facets
+from information_retrieval.keyword_search import pyserini_indexer as pi
+from information_retrieval.result_cache import ResultCache
+from information_retrieval.vector_search import index_factory, vector_store as vs
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def log(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+def parse_scale(scale: str) -> int:
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    scale = scale.strip().lower()
+    return int(float(scale[:-1]) * multipliers[scale[-1]]) if scale[-1] in multipliers else int(scale)
+
+
+def percentiles(seconds) -> dict:
+    milliseconds = np.asarray(seconds) * 1000
+    return {f"p{p}_ms": round(float(np.percentile(milliseconds, p)), 3) for p in (50, 95, 99)}
+
+
+def rss_mb() -> float:
+    """Current resident set size, read from /proc where available, or else the peak."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10  # bytes on macOS, KiB elsewhere
+
+
+def directory_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files) / 2**20
+
+
+def isolate(directory: str):
+    """Points every file the service reads and writes into `directory` and starts from empty indexes."""
+    dh.use_directory(directory)
+    dh.LUCENE_INDEX_DIR = pi.LUCENE_INDEX_DIR = os.path.join(directory, "jsonld_index")
+    pi.searcher_manager.invalidate()
+    pi.searcher_manager = pi.SearcherManager(pi.LUCENE_INDEX_DIR)
+    facets.FACETS_FILE = os.path.join(directory, "facets.json")
+    facets.table, facets._loaded_version = {}, None
+    vs.index, vs.store = dh.load_data()
+    vs.drain_changes()
+
+
+def ingest(n: int, single: int, batch_size: int, seed: int) -> dict:
+    documents = corpus.templates(n, seed)
+    single = min(single, n)
+    vectors = corpus.vectors(0, single, seed)
+    start = time.perf_counter()
+    for vector, (name, data) in zip(vectors, documents):
+        vs.store_embedding(name, vector)
+        pi.store_jsonld(name, data)
+    single_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for offset in range(single, n, batch_size):
+        batch = [next(documents) for _ in range(min(batch_size, n - offset))]
+        vs.store_embeddings([name for name, _ in batch], corpus.vectors(offset, len(batch), seed))
+        pi.store_jsonld_batch(batch)
+        log(f"  ingested {offset + len(batch)}/{n}")
+    batch_seconds = time.perf_counter() - start
+    vs.drain_changes()
+    return {
+        "single_templates": single,
+        "single_per_s": round(single / single_seconds, 1) if single else None,
+        "batched_templates": n - single,
+        "batched_per_s": round((n - single) / batch_seconds, 1) if n > single else None,
+        "batch_size": batch_size,
+    }
+
+
+def persistence() -> dict:
+    start = time.perf_counter()
+    dh.save_data(vs.index, vs.store)
+    save_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    vs.index, vs.store = dh.load_data()
+    load_seconds = time.perf_counter() - start
+    return {
+        "save_data_s": round(save_seconds, 3),
+        "load_data_s": round(load_seconds, 3),
+        "index_file_mb": round(os.path.getsize(dh.FAISS_FILE) / 2**20, 2),
+        "mappings_file_mb": round(os.path.getsize(dh.MAPPINGS_FILE) / 2**20, 2),
+        "lucene_index_mb": round(directory_mb(pi.LUCENE_INDEX_DIR), 2),
+    }
+
+
+def search_queries(n: int, queries: int, seed: int) -> tuple[np.ndarray, list[str]]:
+    """Embeddings near stored templates, perturbed so that they are not exact copies, and keyword queries."""
+    rng = np.random.default_rng(seed + 2)
+    positions = rng.integers(0, n, queries)
+    embeddings = np.stack([corpus.vectors(int(position), 1, seed)[0] for position in positions])
+    embeddings += 0.05 * rng.standard_normal(embeddings.shape).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings, corpus.queries(queries, seed)
+
+
+def retriever_latency(embeddings: np.ndarray, texts: list[str], top_k: int) -> dict:
+    def timed(search, queries) -> dict:
+        search(queries[0])  # warm-up, e.g. opening the Lucene searcher
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            search(query)
+            latencies.append(time.perf_counter() - start)
+        return percentiles(latencies)
+
+    return {
+        "semantic_search": timed(lambda embedding: vs.semantic_search(embedding, top_k=top_k), embeddings),
+        "keyword_search": timed(lambda text: pi.keyword_search(text, top_k=top_k), texts),
+    }
+
+
+def search_throughput(embeddings: np.ndarray, texts: list[str], top_k: int, clients: int) -> dict:
+    es.first_request, es.loaded_version = False, dh.data_version()
+    es.app.config["TESTING"] = True
+    payloads = [{"embedding": embedding.tolist(), "query": text, "top_k": top_k}
+                for embedding, text in zip(embeddings, texts)]
+
+    def run() -> dict:
+        def timed(payload):
+            start = time.perf_counter()
+            response = es.app.test_client().post("/search", json=payload).get_json()
+            if response["status"] != "success":
+                raise RuntimeError(f"/search failed: {response}")
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            latencies = list(pool.map(timed, payloads))
+        return {"requests_per_s": round(len(payloads) / (time.perf_counter() - start), 1), **percentiles(latencies)}
+
+    es.search_cache = ResultCache(max_entries=0)
+    uncached = run()
+    es.search_cache = ResultCache(max_entries=len(payloads))
+    run()  # fills the cache
+    cached = run()
+    return {"clients": clients, "uncached": uncached, "cached": cached}
+
+
+def run_scale(n: int, args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="retrieval-bench-") as directory:
+        isolate(directory)
+        log(f"{n} templates")
+        result = {"templates": n}
+        result["ingest"] = ingest(n, args.single, args.batch_size, args.seed)
+        result["persistence"] = persistence()
+        result["memory"] = {"rss_mb": round(rss_mb(), 1), "peak_rss_mb": round(peak_rss_mb(), 1),
+                            "index_vectors": int(vs.index.ntotal)}
+        embeddings, texts = search_queries(n, args.queries, args.seed)
+        result.update(retriever_latency(embeddings, texts, args.top_k))
+        result["search_endpoint"] = search_throughput(embeddings, texts, args.top_k, args.clients)
+        pi.searcher_manager.invalidate()  # closes the searcher before its directory is removed
+        return result
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=SERVICE_DIR, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "faiss": faiss.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "index_type": index_factory.INDEX_TYPE,
+        "persistence_mode": dh.PERSISTENCE_MODE,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="1k,100k")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--single", type=int, default=100, help="templates stored one call at a time")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    report = {
+        "benchmark": "retrieval_suite",
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment(),
+        "parameters": {key: value for key, value in vars(args).items() if key != "output"},
+    }
+    with redirect_stdout(sys.stderr):  # the service logs with print, which would interleave with the report
+        report["results"] = [run_scale(parse_scale(scale), args) for scale in args.scales.split(",")]
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
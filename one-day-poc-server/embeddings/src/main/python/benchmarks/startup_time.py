@@ -0,0 +1,71 @@
+"""
+Breaks service startup down into its components, each timed in turn in a fresh interpreter, then times the
+service's own warm-up (which loads the components side by side) in another fresh interpreter.
+
+Usage: python -m benchmarks.startup_time [--runs N]
+Set EMBED_MODEL_DIR to measure loading the model from a local copy instead of by name.
+"""
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(timings: dict, label: str, step):
+    start = time.perf_counter()
+    result = step()
+    timings[label] = time.perf_counter() - start
+    return result
+
+
+def components() -> dict:
+    timings = {}
+    es = timed(timings, "import service", lambda: importlib.import_module("information_retrieval.embedding_service"))
+    timed(timings, "load faiss index", es.load_data)
+    timed(timings, "import sentence_transformers", lambda: importlib.import_module("sentence_transformers"))
+    timed(timings, "load model", es.emb.get_model)
+    timed(timings, "first embedding", lambda: es.emb.embed("warm-up"))
+    timed(timings, "start JVM (pyserini)", es.pi.load_lucene)
+    return timings
+
+
+def warm_up() -> dict:
+    timings = {}
+    es = timed(timings, "import service", lambda: importlib.import_module("information_retrieval.embedding_service"))
+    timed(timings, "warm_up()", es.warm_up)
+    return timings
+
+
+def run_stage(stage: str) -> dict:
+    output = subprocess.run([sys.executable, "-m", "benchmarks.startup_time", "--stage", stage], cwd=SERVICE_DIR,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--stage", choices=["components", "warm-up"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        print(json.dumps(components() if args.stage == "components" else warm_up()))
+        return
+
+    for stage in ("components", "warm-up"):
+        runs = [run_stage(stage) for _ in range(args.runs)]
+        print(f"{stage} (median of {args.runs} runs)")
+        for label in runs[0]:
+            median = sorted(run[label] for run in runs)[len(runs) // 2]
+            print(f"  {label:<32} {median:>8.2f}s")
+        total = sorted(sum(run.values()) for run in runs)[len(runs) // 2]
+        print(f"  {'total':<32} {total:>8.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""
+Gunicorn settings for the embedding service: gunicorn -c gunicorn.conf.py information_retrieval.wsgi:app
+
+Every worker loads its own model and index copy (set INDEX_MMAP to share the index pages between them) and
+picks up writes made by the other workers from the persisted files. Templates queued by an asynchronous /new
+are indexed by the worker that took the upload, which writes the status of their jobs to a file in JOBS_DIR for
+the other workers to answer /jobs from.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '7000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+# Loading the model and index can take a while; workers are only sent requests once it is done.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+# Not preloaded: the JVM that pyserini starts on import does not survive being forked into the workers.
+preload_app = False
+
+
+def worker_exit(server, worker):
+    from information_retrieval.embedding_service import shutdown
+    shutdown()
@@ -1,9 +1,8 @@
 import atexit
 
-from information_retrieval.data_handler import save_data
-from information_retrieval.vector_search import vector_store as vs
-from information_retrieval.embedding_service import app
+from information_retrieval.embedding_service import app, shutdown, warm_up
 
 if __name__ == '__main__':
-    atexit.register(save_data, vs.index, vs.store)
-    app.run(host="0.0.0.0", port=7000)
\ No newline at end of file
+    atexit.register(shutdown)
+    warm_up()
+    app.run(host="0.0.0.0", port=7000)
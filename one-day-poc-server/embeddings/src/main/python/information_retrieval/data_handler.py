@@ -1,49 +1,371 @@
+import fcntl
 import faiss
+import numpy as np
 import pickle
 import os
 import pathlib
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
 
+from information_retrieval import metrics
+from information_retrieval.name_table import NameTable, write_name_table
+from information_retrieval.vector_search.index_factory import configure, create_index, train, with_id_map, without_ids
 
 BASE_DIR = str(pathlib.Path(__file__).parent.parent.absolute())
 
 
 FAISS_FILE = os.path.join(BASE_DIR, "faiss.index")
 MAPPINGS_FILE = os.path.join(BASE_DIR, "mappings.pkl")
+NAMES_FILE = os.path.join(BASE_DIR, "mappings.names")
 LUCENE_INDEX_DIR = os.path.join(BASE_DIR, "jsonld_index")
 VECTOR_DIMENSION = 384
 
+# With INDEX_MMAP the index is opened read-only and memory-mapped where FAISS supports it, and the mappings
+# are kept in a NameTable file instead of a pickle, so worker processes share pages instead of holding copies.
+# The first insert switches the process to a private in-memory copy of the index.
+INDEX_MMAP = os.environ.get("INDEX_MMAP", "false").lower() in ("1", "true", "yes")
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+# "snapshot" rewrites the index and mappings on every insert; "wal" appends inserts to a write-ahead log
+# and folds the log into a new snapshot in the background once it grows past WAL_COMPACT_THRESHOLD records.
+PERSISTENCE_MODE = os.environ.get("PERSISTENCE_MODE", "snapshot")
+WAL_FILE = os.path.join(BASE_DIR, "faiss.wal")
+WAL_COMPACTING_FILE = WAL_FILE + ".compacting"
+WAL_COMPACT_THRESHOLD = int(os.environ.get("WAL_COMPACT_THRESHOLD", "1000"))
+
+# Each log record is: crc32 of the rest of the record, id, name length, name bytes, float32 vector bytes.
+# A delete record has a name length of WAL_DELETE and nothing after it.
+WAL_HEADER = struct.Struct("<Iqi")
+WAL_DELETE = -1
+
+# Processes serving from the same files (gunicorn workers) take this lock exclusively to write and shared to reload.
+LOCK_FILE = os.path.join(BASE_DIR, "faiss.lock")
+
+_wal_lock = threading.Lock()
+_wal_records = 0
+_compaction = None
+_mapped_index = None
+
+def use_directory(directory: str):
+    """Keeps the index, mappings, write-ahead log and lock file in `directory`, e.g. for one shard of the index."""
+    global FAISS_FILE, MAPPINGS_FILE, NAMES_FILE, WAL_FILE, WAL_COMPACTING_FILE, LOCK_FILE
+    os.makedirs(directory, exist_ok=True)
+    FAISS_FILE = os.path.join(directory, "faiss.index")
+    MAPPINGS_FILE = os.path.join(directory, "mappings.pkl")
+    NAMES_FILE = os.path.join(directory, "mappings.names")
+    WAL_FILE = os.path.join(directory, "faiss.wal")
+    WAL_COMPACTING_FILE = WAL_FILE + ".compacting"
+    LOCK_FILE = os.path.join(directory, "faiss.lock")
+
 def load_data():
     """
     Retrieve persisted data from disk. These will be embeddings and corresponding mappings.
     If the data is missing or invalid (e.g., files exist but are empty or contain null),
     new objects will be created.
+    Any inserts recorded in the write-ahead log since the last snapshot are replayed on top.
     """
+    global _mapped_index
+    _mapped_index = None
     try:
-        index = faiss.read_index(FAISS_FILE)
+        if INDEX_MMAP:
+            index = _mapped_index = faiss.read_index(FAISS_FILE, MMAP_FLAGS)
+        else:
+            index = faiss.read_index(FAISS_FILE)
         if index is None:
-            index = faiss.IndexFlatIP(VECTOR_DIMENSION)
+            index = create_index(VECTOR_DIMENSION)
     except Exception as e:
         print(f"Could not load FAISS index from {FAISS_FILE} ({e}). Creating new index.")
-        index = faiss.IndexFlatIP(VECTOR_DIMENSION)
+        index = create_index(VECTOR_DIMENSION)
+    index = with_id_map(index)
+    if index is not _mapped_index:
+        _mapped_index = None  # an index persisted without ids has been converted into an in-memory copy
+    configure(index)
 
     try:
-        with open(MAPPINGS_FILE, "rb") as f:
-            vector_store = pickle.load(f)
+        if INDEX_MMAP and os.path.exists(NAMES_FILE):
+            vector_store = NameTable(NAMES_FILE)
+        else:
+            with open(MAPPINGS_FILE, "rb") as f:
+                vector_store = pickle.load(f)
         if vector_store is None:
             vector_store = {}
     except Exception as e:
         print(f"Could not load mapping from {MAPPINGS_FILE} ({e}). Creating new mapping.")
         vector_store = {}
 
+    index = replay_log(index, vector_store)
     os.makedirs(LUCENE_INDEX_DIR, exist_ok=True)
 
     return index, vector_store
 
+@contextmanager
+def data_lock(exclusive: bool = False):
+    """Holds a lock on the persisted data across processes: exclusive for writers, shared for readers."""
+    with open(LOCK_FILE, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def data_version() -> tuple:
+    """Identifies the persisted state by file sizes and modification times; any write by any process changes it."""
+    return _file_versions(FAISS_FILE, MAPPINGS_FILE, NAMES_FILE, WAL_FILE)
+
+def snapshot_version() -> tuple:
+    """Like data_version, but only changes when a snapshot is written, not when records are appended to the log."""
+    return _file_versions(FAISS_FILE, MAPPINGS_FILE, NAMES_FILE)
+
+def _file_versions(*paths: str) -> tuple:
+    version = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            version.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            version.append(None)
+    return tuple(version)
+
+def log_position():
+    """Identifies the write-ahead log file and its current end, or None if there is no log."""
+    try:
+        stat = os.stat(WAL_FILE)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size
+
+def read_log_since(position):
+    """
+    Read the records appended to the write-ahead log since `position` (from log_position), returning them with the
+    position after the last whole record. Returns None if the log has been set aside or cut since, in which case
+    the files must be loaded again.
+    """
+    global _wal_records
+    current = log_position()
+    if current is None:
+        return None if position is not None else ([], None)
+    if position is None:
+        if os.path.exists(WAL_COMPACTING_FILE):
+            return None
+        position = (current[0], 0)
+    if position[0] != current[0] or position[1] > current[1]:
+        return None
+    records, end = read_log(WAL_FILE, position[1])
+    _wal_records += len(records)
+    return records, (current[0], end)
+
 def save_data(index, vector_store):
     """
     Save data into disk for persistence.
     """
+    if INDEX_MMAP:
+        # Files that are memory-mapped must be replaced rather than overwritten in place.
+        write_snapshot(index, vector_store)
+        return
     faiss.write_index(index, FAISS_FILE)
     with open(MAPPINGS_FILE, "wb") as f:
         pickle.dump(vector_store, f)
     print(f"Saved FAISS index to {FAISS_FILE}, mappings to {MAPPINGS_FILE}, and Lucene index is maintained at {LUCENE_INDEX_DIR}.")
+
+def make_writable(index):
+    """
+    Return an index that can be added to. A memory-mapped index is a read-only view of FAISS_FILE, so it is
+    swapped for an in-memory copy read from the same file (FAISS cannot clone memory-mapped inverted lists).
+    """
+    global _mapped_index
+    if index is None or index is not _mapped_index:
+        return index
+    _mapped_index = None
+    return faiss.read_index(FAISS_FILE)
+
+def persist(index, vector_store, changes: list):
+    """
+    Persist the changes made since the last call, given as (id, name, vector) inserts and (id, None, None) deletes.
+    In snapshot mode the whole index is rewritten; in WAL mode only the new records are appended to the log.
+    """
+    with metrics.stage("save_data"):
+        if PERSISTENCE_MODE != "wal":
+            save_data(index, vector_store)
+            return
+        if append_to_log(changes) >= WAL_COMPACT_THRESHOLD:
+            compact(index, vector_store)
+
+def append_to_log(changes: list) -> int:
+    """Append inserts and deletes to the write-ahead log and flush them to disk. Returns the number of records in the log."""
+    global _wal_records
+    if not changes:
+        return _wal_records
+    payload = bytearray()
+    for idx, name, vector in changes:
+        if name is None:
+            body = struct.pack("<qi", idx, WAL_DELETE)
+        else:
+            encoded = name.encode("utf-8")
+            body = struct.pack("<qi", idx, len(encoded)) + encoded + np.asarray(vector, dtype=np.float32).tobytes()
+        payload += struct.pack("<I", zlib.crc32(body)) + body
+    with _wal_lock:
+        with open(WAL_FILE, "ab") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        _wal_records += len(changes)
+        return _wal_records
+
+def read_log(path: str, start: int = 0) -> tuple[list, int]:
+    """
+    Read (id, name, vector) inserts and (id, None, None) deletes from a log file, from the `start` offset on.
+    Reading stops at a truncated or corrupt tail; the returned offset is the end of the valid prefix.
+    """
+    if not os.path.exists(path):
+        return [], 0
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read()
+    records, offset, vector_size = [], 0, VECTOR_DIMENSION * 4
+    while offset + WAL_HEADER.size <= len(data):
+        crc, idx, name_length = WAL_HEADER.unpack_from(data, offset)
+        if name_length == WAL_DELETE:
+            end = offset + WAL_HEADER.size
+            if zlib.crc32(data[offset + 4:end]) != crc:
+                break
+            records.append((idx, None, None))
+            offset = end
+            continue
+        end = offset + WAL_HEADER.size + name_length + vector_size
+        if name_length < 0 or end > len(data) or zlib.crc32(data[offset + 4:end]) != crc:
+            break
+        name_start = offset + WAL_HEADER.size
+        name = data[name_start:name_start + name_length].decode("utf-8")
+        vector = np.frombuffer(data, dtype=np.float32, count=VECTOR_DIMENSION, offset=name_start + name_length)
+        records.append((idx, name, vector))
+        offset = end
+    return records, start + offset
+
+def replay_log(index, vector_store):
+    """
+    Re-apply logged inserts and deletes that are missing from the loaded snapshot, returning the (possibly copied)
+    index. The last record of an id wins: an insert is only added to the index if its id is not there yet, unless
+    the logs also delete that id before inserting it again, in which case the indexed vector is replaced. So replay
+    is idempotent even if a crash happened halfway through writing a snapshot.
+    A torn record at the end of a log (from a crash mid-append) is cut off so later appends stay readable.
+    """
+    global _wal_records
+    replayed = 0
+    latest, reinserted = {}, set()  # id -> (name, vector), or None when deleted; ids deleted and then inserted
+    for path in (WAL_COMPACTING_FILE, WAL_FILE):
+        records, valid_length = read_log(path)
+        if os.path.exists(path) and os.path.getsize(path) > valid_length:
+            print(f"Truncating incomplete records at byte {valid_length} of {path}.")
+            os.truncate(path, valid_length)
+        for idx, name, vector in records:
+            if name is not None and idx in latest and latest[idx] is None:
+                reinserted.add(idx)
+            latest[idx] = None if name is None else (name, vector)
+        replayed += len(records)
+
+    indexed = set(faiss.vector_to_array(index.id_map).tolist())
+    stale = indexed & ({idx for idx, record in latest.items() if record is None} | reinserted)
+    if stale:
+        index = without_ids(index, stale)
+        indexed -= stale
+    added = {idx: record for idx, record in latest.items() if record is not None and idx not in indexed}
+    if added:
+        index = make_writable(index)
+        vectors = np.stack([vector for _, vector in added.values()])
+        if not train(index, vectors):
+            # Too few to train on: they wait in a flat index, as in vector_store, until enough have been stored.
+            index = faiss.IndexIDMap2(faiss.IndexFlat(index.d, index.metric_type))
+        index.add_with_ids(vectors, np.fromiter(added, dtype=np.int64))
+    for idx, record in latest.items():
+        if record is None:
+            vector_store.pop(idx, None)
+        else:
+            vector_store[idx] = record[0]
+    _wal_records = replayed
+    if replayed:
+        print(f"Replayed {replayed} records from the write-ahead log.")
+    return index
+
+def write_snapshot(index, vector_store):
+    """Atomically replace the persisted index and mappings: each file is written aside, synced and renamed."""
+    write_mappings = (NAMES_FILE, lambda p: write_name_table(p, vector_store)) if INDEX_MMAP \
+        else (MAPPINGS_FILE, lambda p: _pickle_to(p, vector_store))
+    for path, write in (write_mappings, (FAISS_FILE, lambda p: faiss.write_index(index, p))):
+        tmp = path + ".tmp"
+        write(tmp)
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+def _pickle_to(path: str, obj):
+    with open(path, "wb") as f:
+        pickle.dump(obj, f)
+
+def compact(index, vector_store, background: bool = True):
+    """
+    Fold the write-ahead log into a new snapshot. The caller holds data_lock exclusively.
+    The current log is set aside first, so inserts arriving during compaction go to a fresh log;
+    the set-aside log is only deleted once the snapshot containing its records is on disk.
+    A background compaction takes data_lock itself to write the snapshot, and gives up if another process has
+    written a snapshot or set aside more of the log in the meantime: its snapshot would then be older than the
+    files, and the set-aside log would hold records it does not contain. The log is folded in by the next one.
+    """
+    global _wal_records, _compaction
+    with _wal_lock:
+        if background and _compaction is not None and _compaction.is_alive():
+            return
+        if os.path.exists(WAL_FILE):
+            if os.path.exists(WAL_COMPACTING_FILE):
+                # A previous compaction did not finish, so its log is still needed until this one completes.
+                with open(WAL_FILE, "rb") as log, open(WAL_COMPACTING_FILE, "ab") as aside:
+                    aside.write(log.read())
+                    aside.flush()
+                    os.fsync(aside.fileno())
+                os.remove(WAL_FILE)
+            else:
+                os.replace(WAL_FILE, WAL_COMPACTING_FILE)
+        _wal_records = 0
+        snapshot_index, snapshot_store = faiss.clone_index(index), dict(vector_store)
+        expected = _compaction_version()
+
+    def run():
+        with metrics.stage("wal_compaction"):
+            write_snapshot(snapshot_index, snapshot_store)
+        if os.path.exists(WAL_COMPACTING_FILE):
+            os.remove(WAL_COMPACTING_FILE)
+        print(f"Compacted write-ahead log into snapshot of {snapshot_index.ntotal} vectors.")
+
+    def run_locked():
+        with data_lock(exclusive=True):
+            if _compaction_version() != expected:
+                print("Skipped compacting the write-ahead log, as another process has written the files since.")
+                return
+            run()
+
+    if not background:
+        run()
+        return
+    _compaction = threading.Thread(target=run_locked, name="wal-compaction", daemon=True)
+    _compaction.start()
+
+def _compaction_version() -> tuple:
+    """Identifies the snapshot files and the set-aside log."""
+    try:
+        stat = os.stat(WAL_COMPACTING_FILE)
+        aside = (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        aside = None
+    return data_version()[:3] + (aside,)
+
+def checkpoint(index, vector_store):
+    """
+    Persist everything before shutdown: a synchronous compaction in WAL mode, a plain save otherwise.
+    The caller holds data_lock exclusively, so a background compaction still waiting for it will find the new
+    snapshot and give up.
+    """
+    if PERSISTENCE_MODE != "wal":
+        save_data(index, vector_store)
+        return
+    compact(index, vector_store, background=False)
@@ -1,23 +1,213 @@
+import contextvars
 import json
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import numpy as np
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 
-from information_retrieval.data_handler import load_data, save_data
+from information_retrieval import compression, facets, ingest, metrics
+from information_retrieval.fusion import reciprocal_rank_fusion
+from information_retrieval.ingest_queue import IngestQueue
+from information_retrieval.result_cache import ResultCache, result_key
+from information_retrieval.data_handler import (BASE_DIR, checkpoint, data_lock, data_version, load_data,
+                                                log_position, persist, read_log_since, snapshot_version)
 from information_retrieval.keyword_search import pyserini_indexer as pi
-from information_retrieval.vector_search import embedder as emb, vector_store as vs
+from information_retrieval.vector_search import chunker, codec, embedder as emb, shards, vector_store as vs
+from information_retrieval.vector_search.batcher import MicroBatcher
+
+EMBED_BATCH_WINDOW_MS = float(os.environ.get("EMBED_BATCH_WINDOW_MS", "0"))
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "32"))
+SEARCH_TIMEOUT_MS = float(os.environ.get("SEARCH_TIMEOUT_MS", "2000"))
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", "8"))
+# Encoding of the embeddings returned by /embed and /embed/batch when a request does not choose one.
+EMBED_ENCODING = os.environ.get("EMBED_ENCODING", "json")
+# Fused results of recent searches are reused until the data changes or they are SEARCH_CACHE_TTL_S old (0: no limit).
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL_S = float(os.environ.get("SEARCH_CACHE_TTL_S", "300"))
+# Every response carries a Server-Timing header with its stage timings; otherwise only those of requests sending
+# an X-Trace-Timing header do.
+TRACE_TIMINGS = os.environ.get("TRACE_TIMINGS", "false").lower() in ("1", "true", "yes")
+# /new queues templates for a background worker and answers straight away when a request sets "async" (or when
+# INGEST_ASYNC makes that the default). Templates queued within INGEST_WINDOW_MS are indexed together.
+INGEST_ASYNC = os.environ.get("INGEST_ASYNC", "false").lower() in ("1", "true", "yes")
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "1000"))
+INGEST_WINDOW_MS = float(os.environ.get("INGEST_WINDOW_MS", "50"))
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "64"))
+# Every process keeps the status of the jobs it queued in a file here, so that any worker can answer /jobs.
+JOBS_DIR = os.environ.get("JOBS_DIR", os.path.join(BASE_DIR, "jobs"))
 
 app = Flask(__name__)
 CORS(app)
+app.wsgi_app = compression.GzipRequests(app.wsgi_app)
+
+# Concurrent /embed calls are merged into batched forward passes when a batching window is configured.
+batcher = MicroBatcher(lambda texts: emb.embed_batch(texts, batch_size=EMBED_BATCH_SIZE),
+                       window_ms=EMBED_BATCH_WINDOW_MS,
+                       max_batch_size=EMBED_BATCH_SIZE) if EMBED_BATCH_WINDOW_MS > 0 else None
+
+# Semantic and keyword retrieval for a query run side by side on these long-lived threads.
+search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="retriever")
+
+search_cache = ResultCache(max_entries=SEARCH_CACHE_SIZE, ttl_seconds=SEARCH_CACHE_TTL_S)
+
+REQUEST_SECONDS = metrics.Histogram("retrieval_request_seconds", "Time spent serving requests.", ("route",))
+REQUESTS = metrics.Counter("retrieval_requests_total", "Requests served.", ("route",))
+ERRORS = metrics.Counter("retrieval_errors_total", "Requests answered with an error or that raised.", ("route",))
+metrics.Gauge("retrieval_index_vectors", "Vectors in the FAISS index, including those of deleted templates.",
+              read=lambda: vs.index.ntotal if vs.index is not None else 0)
+metrics.Gauge("retrieval_index_templates", "Templates in the vector store, whatever their number of chunks.",
+              read=vs.template_count)
+metrics.Gauge("retrieval_ingest_queue_pending", "Templates waiting to be indexed in the background.",
+              read=lambda: ingest_queue.stats()["pending"])
+metrics.Counter("retrieval_cache_hits_total", "Cache lookups that hit.", ("cache",),
+                read=lambda: {("embedding",): emb.cache.hits, ("search",): search_cache.hits})
+metrics.Counter("retrieval_cache_misses_total", "Cache lookups that missed.", ("cache",),
+                read=lambda: {("embedding",): emb.cache.misses, ("search",): search_cache.misses})
 
 first_request = True
-@app.before_request
-def startup_once():
+ready = False
+loaded_version = None  # data_version() of the files vs.index and vs.store were last loaded from or written to
+loaded_snapshot = None  # snapshot_version() of those files
+loaded_log = None  # log_position() up to which the write-ahead log has been applied
+
+def load_index():
+    """Loads the persisted index and mappings. The caller holds data_lock."""
     global first_request
-    if first_request:
+    with vs.write_lock, metrics.stage("load_index"):
+        mark_persisted()
         vs.index, vs.store = load_data()
-        first_request = False
+        vs.generation += 1
+    first_request = False
+
+def reload_if_stale():
+    """
+    Catches up with what another process (a worker, the ingest CLI) has written since. Records appended to the
+    write-ahead log are applied from where this process left off; the files are only loaded again when a new snapshot
+    has been written. The caller holds data_lock.
+    """
+    global loaded_version, loaded_log
+    if first_request or snapshot_version() != loaded_snapshot:
+        load_index()
+        return
+    version = data_version()
+    if version == loaded_version:
+        return
+    tail = read_log_since(loaded_log)
+    if tail is None:
+        load_index()
+        return
+    with metrics.stage("apply_log"):
+        vs.apply_records(tail[0])
+    loaded_version, loaded_log = version, tail[1]
+
+def mark_persisted():
+    """Records that the files now match this process's index after it wrote them. The caller holds data_lock."""
+    global loaded_version, loaded_snapshot, loaded_log
+    loaded_version, loaded_snapshot, loaded_log = data_version(), snapshot_version(), log_position()
+
+def persist_vectors():
+    """Persists the changes to the local index; shards persist the vectors they hold themselves. The caller holds data_lock."""
+    if not shards.SHARD_URLS:
+        persist(vs.index, vs.store, vs.drain_changes())
+        mark_persisted()
+
+def ingest_queued(records) -> tuple[list[str], list[str]]:
+    """
+    Indexes a batch of (name, annotation) pairs from the ingest queue, as /new/batch does. The batch is embedded
+    before the data lock is taken, so other requests and workers only wait for the index writes.
+    """
+    documents, embedded, rejected = ingest.embed_records(records, batch_size=EMBED_BATCH_SIZE)
+    with data_lock(exclusive=True):
+        reload_if_stale()
+        stored, failed = ingest.store_embedded(documents, embedded)
+        mark_persisted()
+    return stored, rejected + failed
+
+ingest_queue = IngestQueue(ingest_queued, max_pending=INGEST_QUEUE_SIZE, window_ms=INGEST_WINDOW_MS,
+                           max_batch_size=INGEST_BATCH_SIZE, jobs_dir=JOBS_DIR)
+
+def warm_up():
+    """
+    Loads the index, runs the model once and starts the keyword searcher's JVM, so that no request pays for any
+    of them. The index and the model load on background threads while the JVM starts on this one (the thread
+    that starts it stays attached to it).
+    """
+    global ready
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="warm-up") as pool:
+        loading = [pool.submit(_load_index_locked), pool.submit(emb.embed, "warm-up")]
+        pi.load_lucene()
+        for future in loading:
+            future.result()
+    ready = True
+
+def _load_index_locked():
+    with data_lock():
+        load_index()
+
+def shutdown():
+    """
+    Persists the in-memory index and the embedding cache on exit. The index is skipped if it was never loaded,
+    or if another process has written the files since, as they are then newer than this copy.
+    """
+    if not ingest_queue.join(timeout=60):
+        print("Templates were still waiting to be indexed on shutdown; they are lost.")
+    with data_lock(exclusive=True):
+        if vs.index is not None and data_version() == loaded_version:
+            checkpoint(vs.index, vs.store)
+        emb.save_cache()
+
+@app.before_request
+def start_request():
+    g.started = time.perf_counter()
+    g.trace_token = metrics.start_trace()
+
+@app.after_request
+def finish_request(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUEST_SECONDS.observe(time.perf_counter() - g.started, route=route)
+    REQUESTS.inc(route=route)
+    failed = response.status_code >= 400
+    if not failed and response.is_json:
+        failed = (response.get_json(silent=True) or {}).get("status") == "error"
+    if failed:
+        ERRORS.inc(route=route)
+    trace = metrics.end_trace(g.pop("trace_token"))
+    if TRACE_TIMINGS or "X-Trace-Timing" in request.headers:
+        response.headers["Server-Timing"] = metrics.server_timing(trace)
+    return compression.compress_response(response, request.headers.get("Accept-Encoding", ""))
+
+@app.teardown_request
+def end_failed_request(error):
+    """
+    Counts requests that raised without a response, and ends their trace, as finish_request is not called for them.
+    One that raised and was answered with a 500 has been counted by finish_request, which took its trace token.
+    """
+    token = g.pop("trace_token", None)
+    if token is None:
+        return
+    metrics.end_trace(token)
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUESTS.inc(route=route)
+    if error is not None:
+        ERRORS.inc(route=route)
+
+@app.before_request
+def startup_once():
+    # The lock is only taken when there is something to reload, so requests do not queue up behind writers
+    # while the files they would read have not changed.
+    if first_request or data_version() != loaded_version:
+        with data_lock():
+            reload_if_stale()
+
+@app.route('/ready', methods=['GET'])
+def ready_route():
+    if not ready:
+        return jsonify({"status": "warming up"}), 503
+    return jsonify({"status": "ready"})
 
 @app.route('/embed', methods=['POST'])
 def embed_route():
@@ -27,11 +217,51 @@ def embed_route():
             "status": "error",
             "message": "No prompt provided"
         })
+    encoding = response_encoding(data)
+    if encoding not in codec.ENCODINGS:
+        return jsonify({"status": "error", "message": f"Unknown encoding: {encoding}"})
     text = data["text"]
-    embedding = emb.embed(text)
-    if not embedding:
+    embedding = batcher.embed(text) if batcher else emb.embed(text)
+    if embedding is None:
         return jsonify({"status": "error", "message": f"Error embedding: {text}"})
-    return jsonify({"status": "success", "embedding": embedding})
+    if wants_raw():
+        return raw_embeddings(np.asarray(embedding), encoding)
+    return jsonify({"status": "success", "embedding": codec.encode(embedding, encoding), "encoding": encoding})
+
+@app.route('/embed/batch', methods=['POST'])
+def embed_batch_route():
+    data = request.json
+    if not "texts" in data or not isinstance(data["texts"], list):
+        return jsonify({"status": "error", "message": "No prompts provided"})
+    encoding = response_encoding(data)
+    if encoding not in codec.ENCODINGS:
+        return jsonify({"status": "error", "message": f"Unknown encoding: {encoding}"})
+
+    embeddings = emb.embed_batch(data["texts"], batch_size=EMBED_BATCH_SIZE)
+    failed = [i for i, embedding in enumerate(embeddings or []) if embedding is None]
+    if embeddings is None or failed:
+        return jsonify({"status": "error", "message": f"Error embedding prompts at positions: {failed}"})
+    if wants_raw():
+        return raw_embeddings(np.stack(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32), encoding)
+    return jsonify({"status": "success", "embeddings": [codec.encode(embedding, encoding) for embedding in embeddings],
+                    "encoding": encoding})
+
+def wants_raw() -> bool:
+    """Whether the client's Accept header prefers embeddings as raw bytes over JSON."""
+    best = request.accept_mimetypes.best_match(["application/json", codec.RAW_CONTENT_TYPE])
+    return best == codec.RAW_CONTENT_TYPE
+
+def response_encoding(data: dict) -> str:
+    """The encoding requested for the returned embeddings; raw bytes cannot be "json", so they default to float32."""
+    encoding = data.get("encoding", EMBED_ENCODING)
+    return "float32" if encoding == "json" and wants_raw() else encoding
+
+def raw_embeddings(embeddings: np.ndarray, encoding: str):
+    """A response whose body is the packed embeddings; their shape and encoding are given in headers."""
+    response = Response(codec.to_bytes(embeddings, encoding), content_type=codec.RAW_CONTENT_TYPE)
+    response.headers["X-Embedding-Encoding"] = encoding
+    response.headers["X-Embedding-Shape"] = ",".join(str(size) for size in embeddings.shape)
+    return response
 
 @app.route('/new', methods=['POST'])
 def new_template_route():
@@ -41,26 +271,197 @@ def new_template_route():
 
     jsonld = data["text"]
     name = data["name"]
-    embedding = emb.embed(jsonld)
-    vector_success = vs.store_embedding(name, vector = np.array(embedding))
-    keyword_success = pi.store_jsonld(name, json.loads(jsonld))
-    if not vector_success or not keyword_success:
-        return jsonify({"status": "error", "message": f"Failed to store template: Vector DB: {vector_success}, Keyword DB: {keyword_success}"})
+    try:
+        document = jsonld if isinstance(jsonld, dict) else json.loads(jsonld)
+    except (TypeError, ValueError):
+        document = None
+    if not isinstance(document, dict):
+        return jsonify({"status": "error", "message": "The template annotation is not a JSON object"})
 
-    save_data(vs.index, vs.store)
+    if data.get("async", INGEST_ASYNC):
+        try:
+            job_id = ingest_queue.submit(name, document)
+        except queue.Full as e:
+            return jsonify({"status": "error", "message": f"Too many templates waiting to be indexed: {e}"}), 503
+        return jsonify({"status": "accepted", "job": job_id,
+                        "message": "The template will be searchable once its job is done"}), 202
+
+    # The annotation is embedded chunk by chunk, so that none of it is cut off by the model's input limit.
+    embedded = chunker.embed_documents([(name, document)], batch_size=EMBED_BATCH_SIZE)
+    with data_lock(exclusive=True):
+        reload_if_stale()
+        store_chunk_embeddings = shards.store_chunk_embeddings if shards.SHARD_URLS else vs.store_chunk_embeddings
+        vector_success = embedded is not None and store_chunk_embeddings(*embedded)
+        keyword_success = pi.store_jsonld(name, document)
+        if not vector_success or not keyword_success:
+            return jsonify({"status": "error", "message": f"Failed to store template: Vector DB: {vector_success}, Keyword DB: {keyword_success}"})
+
+        persist_vectors()
 
     return jsonify({"status": "success", "message": "New template stored successfully!"})
 
+@app.route('/new/batch', methods=['POST'])
+def new_templates_batch_route():
+    data = request.json
+    templates = data.get("templates")
+    if not isinstance(templates, list) or not templates:
+        return jsonify({"status": "error", "message": "No templates provided"})
+    if not all(isinstance(template, dict) and "name" in template and "text" in template for template in templates):
+        return jsonify({"status": "error", "message": "Every template needs a name and a text"})
+
+    # Embedded before the lock is taken, like /new, so that other requests only wait for the index writes.
+    records = [(template["name"], template["text"]) for template in templates]
+    documents, embedded, rejected = ingest.embed_records(records, batch_size=EMBED_BATCH_SIZE)
+    with data_lock(exclusive=True):
+        reload_if_stale()
+        stored, failed = ingest.store_embedded(documents, embedded)
+        mark_persisted()
+    rejected += failed
+    if rejected:
+        return jsonify({"status": "error", "message": f"Failed to store templates: {rejected}", "stored": stored})
+
+    return jsonify({"status": "success", "message": f"{len(stored)} templates stored successfully!"})
+
+@app.route('/delete', methods=['POST'])
+def delete_template_route():
+    data = request.json
+    if not "name" in data:
+        return jsonify({"status": "error", "message": "No template name provided"})
+
+    name = data["name"]
+    with data_lock(exclusive=True):
+        reload_if_stale()
+        removed = (shards.delete_embeddings if shards.SHARD_URLS else vs.delete_embeddings)([name])
+        keyword_success = pi.delete_documents([name])
+        persist_vectors()
+    if not keyword_success:
+        return jsonify({"status": "error", "message": f"Failed to delete template '{name}' from the keyword index"})
+    if not removed:
+        return jsonify({"status": "error", "message": f"No template named '{name}'"})
+    return jsonify({"status": "success", "message": f"Template '{name}' deleted successfully!"})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_route(job_id):
+    """Status of a template queued by /new, for polling until it is "done" or "failed"."""
+    job = ingest_queue.status(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": f"No job '{job_id}'"}), 404
+    return jsonify({"status": "success", "job": job})
+
+@app.route('/stats', methods=['GET'])
+def stats_route():
+    return jsonify({"status": "success", "embedding_cache": emb.cache.stats(), "search_cache": search_cache.stats(),
+                    "ingest_queue": ingest_queue.stats()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.route('/search', methods=['POST'])
 def search_route():
+    with metrics.stage("decode"):
+        # A raw body is the packed embedding itself, and the other fields come in the query string.
+        raw = request.mimetype == codec.RAW_CONTENT_TYPE
+        data = raw_search_fields() if raw else request.json
+        if not data.get("embedding"):
+            return jsonify({"status": "error", "message": "No embedding provided for semantic search!"})
+        if not "query" in data:
+            return jsonify({"status": "error", "message": "No query provided for keyword search!"})
+
+        try:
+            if raw:
+                embedding = codec.from_bytes(data["embedding"], data.get("encoding", "float32"))
+            else:
+                embedding = codec.decode(data["embedding"], data.get("encoding", "json"))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": f"Invalid embedding: {e}"})
+        try:
+            filters = facets.validate(data.get("filters"))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": f"Invalid filters: {e}"})
+
+    fused, timed_out = hybrid_search(embedding, data["query"], top_k=data.get("top_k", 5), filters=filters)
+    return search_response(fused, timed_out)
+
+def raw_search_fields() -> dict:
+    """
+    The fields of a /search request sent as raw bytes: "query", "top_k", "encoding" and "filters" (as JSON) from
+    the query string, and the body as "embedding".
+    """
+    data = request.args.to_dict()
+    data["embedding"] = request.get_data()
+    data["top_k"] = request.args.get("top_k", 5, type=int)
+    if "filters" in data:
+        try:
+            data["filters"] = json.loads(data["filters"])
+        except ValueError:
+            pass  # left for facets.validate to reject
+    return data
+
+@app.route('/retrieve', methods=['POST'])
+def retrieve_route():
+    """Embeds the query and runs the hybrid search in one call, so the embedding never leaves the service."""
     data = request.json
-    if not "embedding" in data:
-        return jsonify({"status": "error", "message": "No embedding provided for semantic search!"})
     if not "query" in data:
-        return jsonify({"status": "error", "message": "No query provided for keyword search!"})
+        return jsonify({"status": "error", "message": "No query provided for retrieval!"})
+
+    try:
+        filters = facets.validate(data.get("filters"))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Invalid filters: {e}"})
+
+    query = data["query"]
+    embedding = batcher.embed(query) if batcher else emb.embed(query)
+    if embedding is None:
+        return jsonify({"status": "error", "message": f"Error embedding: {query}"})
+    fused, timed_out = hybrid_search(embedding, query, top_k=data.get("top_k", 5), filters=filters)
+    return search_response(fused, timed_out)
+
+def hybrid_search(embedding, query: str, top_k: int = 5,
+                  filters: dict = None) -> tuple[list[tuple[str, float]], list[str]]:
+    """
+    Runs the semantic and keyword retrievers concurrently and fuses their rankings into at most top_k
+    (template id, score) pairs, best first. Both retrievers only consider templates matching the facet filters.
+    A retriever that has not answered within SEARCH_TIMEOUT_MS is left out; the names of those retrievers are
+    returned alongside the matches.
+    Complete results are cached until either index changes, which bumps its generation.
+    """
+    key = result_key(query, embedding, top_k, filters)
+    # Read first, so that results racing a write are stored as stale. Every write commits to the keyword index,
+    # so its latest commit also covers writes to the shards made by other processes.
+    generation = (vs.generation, shards.generation, pi.generation, pi.index_version())
+    cached = search_cache.get(key, generation)
+    if cached is not None:
+        return cached, []
+
+    allowed = facets.matching(filters) if filters else None
+    # The retrievers run in copies of this context, so that the stages they time are added to the request's trace.
+    futures = {
+        "semantic": search_pool.submit(contextvars.copy_context().run,
+                                       shards.semantic_search if shards.SHARD_URLS else vs.semantic_search,
+                                       embedding, top_k=top_k, allowed=allowed),
+        "keyword": search_pool.submit(contextvars.copy_context().run,
+                                      pi.keyword_search, query, top_k=top_k, allowed=allowed),
+    }
+    done, _ = wait(futures.values(), timeout=SEARCH_TIMEOUT_MS / 1000)
+    rankings, timed_out = {}, []
+    for name, future in futures.items():
+        if future in done:
+            rankings[name] = future.result()
+        else:
+            future.cancel()
+            timed_out.append(name)
+            print(f"The {name} retriever did not answer within {SEARCH_TIMEOUT_MS}ms.")
+    with metrics.stage("merge"):
+        fused = reciprocal_rank_fusion(rankings, top_k)
+    if not timed_out:
+        search_cache.put(key, generation, fused)
+    return fused, timed_out
 
-    top_k = data.get("top_k", 5)
-    vector_results = vs.semantic_search(data["embedding"], top_k=top_k)
-    keyword_results = pi.keyword_search(data["query"], top_k=top_k)
-    results = list(set(vector_results + keyword_results))
-    return jsonify({"status": "success", "matches": results})
+def search_response(fused: list[tuple[str, float]], timed_out: list[str]):
+    return jsonify({
+        "status": "success",
+        "matches": [doc_id for doc_id, _ in fused],
+        "scores": [score for _, score in fused],
+        "timed_out": timed_out,
+    })
@@ -0,0 +1,122 @@
+"""
+Structured attributes (facets) of the stored templates, taken from selected fields of their JSON-LD metadata,
+so that searches can be restricted to e.g. one framework or category.
+
+Filters map a facet to a value or a list of values: a template matches if, for every facet in the filter, it has
+at least one of the values. Values are compared case-insensitively. The facets are written to FACETS_FILE by the
+process storing the metadata and reloaded by the others when the file changes.
+"""
+import json
+import os
+import threading
+
+from information_retrieval.data_handler import BASE_DIR
+
+FACETS_FILE = os.path.join(BASE_DIR, "facets.json")
+# JSON-LD fields indexed as facets. Objects contribute their "name", lists each of their entries.
+FACET_FIELDS = [field.strip() for field in
+                os.environ.get("FACET_FIELDS", "applicationCategory,framework,programmingLanguage,keywords").split(",")]
+
+table = {}  # template name -> {facet: [values]}
+_loaded_version = None
+_lock = threading.Lock()
+
+
+def extract(data: dict) -> dict:
+    """Returns the facet values of a template's JSON-LD metadata, lower-cased."""
+    facets = {}
+    for field in FACET_FIELDS:
+        values = data.get(field)
+        values = values if isinstance(values, list) else [values]
+        values = [value.get("name") if isinstance(value, dict) else value for value in values]
+        values = [value.strip().lower() for value in values if isinstance(value, str) and value.strip()]
+        if values:
+            facets[field] = values
+    return facets
+
+
+def validate(filters) -> dict:
+    """
+    Checks a filter from a request and returns it with every value as a lower-cased list.
+    Raises ValueError for anything but a mapping of known facets to strings or lists of strings.
+    """
+    if filters is None:
+        return {}
+    if not isinstance(filters, dict):
+        raise ValueError("filters must map facets to values")
+    normalized = {}
+    for field, values in filters.items():
+        if field not in FACET_FIELDS:
+            raise ValueError(f"Unknown facet '{field}', expected one of: {', '.join(FACET_FIELDS)}")
+        values = values if isinstance(values, list) else [values]
+        if not values or not all(isinstance(value, str) for value in values):
+            raise ValueError(f"Facet '{field}' must be filtered by a string or a list of strings")
+        normalized[field] = [value.strip().lower() for value in values]
+    return normalized
+
+
+def matching(filters: dict) -> set[str]:
+    """Names of the templates matching a validated filter."""
+    refresh()
+    return {name for name, facets in table.items()
+            if all(set(values) & set(facets.get(field, ())) for field, values in filters.items())}
+
+
+def update(documents):
+    """Records the facets of (name, JSON-LD metadata) pairs and writes the table out."""
+    global table
+    refresh()
+    with _lock:
+        updated = dict(table)
+        for name, data in documents:
+            updated[name] = extract(data)
+        table = updated
+        _save()
+
+
+def remove(names):
+    """Forgets the facets of the given templates and writes the table out."""
+    global table
+    refresh()
+    removed = set(names)
+    with _lock:
+        table = {name: facets for name, facets in table.items() if name not in removed}
+        _save()
+
+
+def refresh():
+    """Reloads the table if another process has written the file since it was last read or written here."""
+    global table, _loaded_version
+    version = _version()
+    if version == _loaded_version:
+        return
+    with _lock:
+        try:
+            with open(FACETS_FILE) as f:
+                table = json.load(f)
+        except FileNotFoundError:
+            table = {}
+        except ValueError as e:
+            print(f"Ignoring unreadable facets file {FACETS_FILE}: {e}")
+            table = {}
+        _loaded_version = version
+
+
+def _save():
+    """Atomically writes the table. The caller holds _lock."""
+    global _loaded_version
+    tmp_path = f"{FACETS_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(table, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, FACETS_FILE)
+    _loaded_version = _version()
+
+
+def _version():
+    try:
+        stat = os.stat(FACETS_FILE)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
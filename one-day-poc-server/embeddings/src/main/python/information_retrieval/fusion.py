@@ -0,0 +1,35 @@
+"""
+Reciprocal rank fusion of the ranked template ids returned by the individual retrievers.
+
+Each retriever contributes weight / (FUSION_K + rank) for every id it returns (rank starting at 1), so only the
+order of each list matters and BM25 and cosine scores never have to be put on the same scale.
+"""
+import os
+
+FUSION_K = float(os.environ.get("FUSION_K", "60"))
+RETRIEVER_WEIGHTS = {
+    "semantic": float(os.environ.get("SEMANTIC_WEIGHT", "1.0")),
+    "keyword": float(os.environ.get("KEYWORD_WEIGHT", "1.0")),
+}
+
+
+def reciprocal_rank_fusion(rankings: dict[str, list[str]], top_k: int, weights: dict[str, float] = None,
+                           k: float = None) -> list[tuple[str, float]]:
+    """
+    Fuses ranked id lists, keyed by retriever name, into at most top_k (id, score) pairs, best first.
+    Retrievers without a configured weight count with weight 1; repeated ids within a list count once.
+    """
+    weights = RETRIEVER_WEIGHTS if weights is None else weights
+    k = FUSION_K if k is None else k
+    scores = {}
+    for retriever, ranking in rankings.items():
+        weight = weights.get(retriever, 1.0)
+        seen = set()
+        for rank, doc_id in enumerate(ranking, start=1):
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return fused[:top_k]
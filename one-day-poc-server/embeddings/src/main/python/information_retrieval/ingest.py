@@ -0,0 +1,107 @@
+"""
+Bulk ingestion of templates into the vector and keyword indexes.
+
+Usage: python -m information_retrieval.ingest PATH
+PATH is either a directory of `<name>.jsonld` files or a JSONL file (`-` for stdin) whose lines are
+objects of the form {"name": ..., "text": ...}, where "text" holds the JSON-LD annotation.
+"""
+import json
+import os
+import pathlib
+import sys
+
+from information_retrieval.data_handler import data_lock, load_data, persist
+from information_retrieval.keyword_search import pyserini_indexer as pi
+from information_retrieval.vector_search import chunker, shards, vector_store as vs
+
+ANNOTATION_EXTENSION = ".jsonld"
+
+
+def read_records(path: str):
+    """Yields (name, text) pairs from a directory of JSON-LD files or a JSONL stream."""
+    if os.path.isdir(path):
+        for file in sorted(pathlib.Path(path).glob(f"*{ANNOTATION_EXTENSION}")):
+            yield file.stem, file.read_text()
+        return
+
+    stream = sys.stdin if path == "-" else open(path)
+    with stream:
+        for line in stream:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield record["name"], record["text"]
+
+
+def bulk_ingest(records, batch_size: int = 32) -> tuple[list[str], list[str]]:
+    """
+    Embeds and indexes (name, text) pairs in a single pass: the chunks of the texts are batch-embedded, the
+    vectors are added to the index in one call, the metadata is indexed in one Lucene session and the data is
+    persisted once.
+    Returns the names that were stored and the names that were rejected.
+    """
+    documents, embedded, rejected = embed_records(records, batch_size=batch_size)
+    stored, failed = store_embedded(documents, embedded)
+    return stored, rejected + failed
+
+
+def embed_records(records, batch_size: int = 32):
+    """
+    The first half of bulk_ingest, which needs no lock on the data: parses the annotations of (name, text) pairs
+    and batch-embeds their chunks. Returns the (name, metadata) pairs of the valid records, their chunk
+    embeddings (None if embedding failed) and the names of the records whose annotation is not a JSON object.
+    """
+    documents, rejected = [], []
+    for name, text in records:
+        try:
+            data = text if isinstance(text, dict) else json.loads(text)
+        except (TypeError, ValueError):
+            data = None
+        if not isinstance(data, dict):
+            print(f"Skipping '{name}': annotation is not a JSON object.")
+            rejected.append(name)
+            continue
+        documents.append((name, data))
+
+    if not documents:
+        return [], None, rejected
+    return documents, chunker.embed_documents(documents, batch_size=batch_size), rejected
+
+
+def store_embedded(documents, embedded) -> tuple[list[str], list[str]]:
+    """
+    The second half of bulk_ingest, run while holding the data lock: adds the embeddings from embed_records to the
+    vector index, the metadata to the keyword index, and persists the vectors.
+    Returns the names that were stored and the names that failed.
+    """
+    names = [name for name, _ in documents]
+    if not names:
+        return [], []
+    store_chunk_embeddings = shards.store_chunk_embeddings if shards.SHARD_URLS else vs.store_chunk_embeddings
+    if embedded is None or not store_chunk_embeddings(*embedded):
+        print("Failed to store embeddings in the vector index.")
+        return [], names
+    if not pi.store_jsonld_batch(documents):
+        print("Failed to index annotations in the keyword index.")
+        return [], names
+
+    if not shards.SHARD_URLS:  # shards persist the vectors they hold themselves
+        persist(vs.index, vs.store, vs.drain_changes())
+    return names, []
+
+
+def main():
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+
+    # Holding the lock keeps running servers from reloading the files halfway through the write.
+    with data_lock(exclusive=True):
+        vs.index, vs.store = load_data()
+        stored, rejected = bulk_ingest(read_records(sys.argv[1]))
+    print(f"Ingested {len(stored)} templates ({len(rejected)} rejected).")
+    sys.exit(1 if rejected else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+# Job files not written for this long are left by processes that have exited, and are removed.
+JOB_FILE_RETENTION_S = 7 * 24 * 3600
+
+
+class IngestQueue:
+    """
+    Indexes templates on a background thread, so that uploads do not wait for the embedding model, the index
+    writes and the persistence. Templates queued within a short window are indexed together in one call, i.e.
+    one batched embedding pass, one Lucene commit and one write of the files.
+
+    Every queued template gets a job whose status goes from "queued" to "indexing" to "done" or "failed".
+    The latest `max_jobs` jobs are kept for polling. With a `jobs_dir`, every process writes its jobs to its own
+    file there whenever one changes, and the status of a job queued by another process (e.g. another gunicorn
+    worker) is read from that process's file, which the job id names.
+    """
+
+    def __init__(self, ingest_batch, max_pending: int = 1000, window_ms: float = 50.0, max_batch_size: int = 64,
+                 max_jobs: int = 1000, jobs_dir: str = None, owner: str = None):
+        self.ingest_batch = ingest_batch  # (name, annotation) pairs -> (stored names, rejected names)
+        self.max_pending = max_pending
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.max_jobs = max_jobs
+        self.jobs_dir = jobs_dir
+        self.jobs = OrderedDict()
+        self._pending = []
+        self._indexing = 0
+        self._ids = itertools.count(1)
+        self._owner = owner or f"{os.getpid():x}"
+        self._cleaned = False  # whether job files of exited processes have been looked for
+        self._condition = threading.Condition()
+        self._worker = None
+
+    def submit(self, name: str, annotation) -> str:
+        """Queues a template for indexing and returns the id of its job. Raises queue.Full when the queue is full."""
+        with self._condition:
+            if len(self._pending) >= self.max_pending:
+                raise queue.Full(f"{len(self._pending)} templates are already waiting to be indexed")
+            job_id = f"{self._owner}-{next(self._ids)}"
+            self.jobs[job_id] = {"job": job_id, "name": name, "status": "queued", "submitted": time.time()}
+            self._evict()
+            self._save()
+            self._pending.append((job_id, name, annotation))
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="ingest-queue", daemon=True)
+                self._worker.start()
+            self._condition.notify_all()
+        return job_id
+
+    def status(self, job_id: str) -> dict | None:
+        """A copy of the job's status, or None if there is no such job (any more)."""
+        owner = job_id.rpartition("-")[0]
+        if owner == self._owner:
+            with self._condition:
+                job = self.jobs.get(job_id)
+                return dict(job) if job is not None else None
+        if self.jobs_dir is None or not owner.isalnum():  # not a file name of another process's jobs
+            return None
+        try:
+            with open(os.path.join(self.jobs_dir, f"{owner}.json")) as f:
+                return json.load(f).get(job_id)
+        except (OSError, ValueError):
+            return None
+
+    def join(self, timeout: float = None) -> bool:
+        """Waits until every queued template has been indexed. Returns False if the timeout ran out first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending or self._indexing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def stats(self) -> dict:
+        with self._condition:
+            counts = {"queued": 0, "indexing": 0, "done": 0, "failed": 0}
+            for job in self.jobs.values():
+                counts[job["status"]] += 1
+            return {"pending": len(self._pending), "max_pending": self.max_pending, "jobs": counts}
+
+    def _evict(self):
+        """Forgets the oldest finished jobs beyond max_jobs; unfinished ones are kept."""
+        excess = len(self.jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] in ("done", "failed")]
+        for job_id in finished[:excess]:
+            del self.jobs[job_id]
+
+    def _save(self):
+        """Atomically writes this process's jobs to its file in jobs_dir. The caller holds _condition."""
+        if self.jobs_dir is None:
+            return
+        if not self._cleaned:
+            os.makedirs(self.jobs_dir, exist_ok=True)
+            self._remove_old_files()
+            self._cleaned = True
+        path = os.path.join(self.jobs_dir, f"{self._owner}.json")
+        try:
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(self.jobs, f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            print(f"Could not write the ingest jobs to {path}: {e}")
+
+    def _remove_old_files(self):
+        """Removes the job files of processes that have not written them for JOB_FILE_RETENTION_S."""
+        cutoff = time.time() - JOB_FILE_RETENTION_S
+        for file in os.scandir(self.jobs_dir):
+            try:
+                if file.name.endswith(".json") and file.stat().st_mtime < cutoff:
+                    os.remove(file.path)
+            except OSError:
+                pass
+
+    def _next_batch(self) -> list:
+        """Waits for the first pending template, then collects more until the window closes or the batch is full."""
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            deadline = time.monotonic() + self.window
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            self._indexing += 1
+            for job_id, _, _ in batch:
+                self.jobs[job_id]["status"] = "indexing"
+            self._save()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            # A template uploaded again before it was indexed is indexed once, from its latest annotation.
+            latest = {name: annotation for _, name, annotation in batch}
+            try:
+                stored, rejected = self.ingest_batch(list(latest.items()))
+                outcomes = {name: ("done", None) for name in stored}
+                outcomes.update({name: ("failed", "The template could not be indexed") for name in rejected})
+            except Exception as e:
+                print(f"Indexing a batch of {len(latest)} templates failed: {e}")
+                outcomes = {name: ("failed", str(e)) for name in latest}
+            with self._condition:
+                for job_id, name, _ in batch:
+                    status, message = outcomes.get(name, ("failed", "The template could not be indexed"))
+                    self.jobs[job_id].update(status=status, finished=time.time())
+                    if message:
+                        self.jobs[job_id]["message"] = message
+                self._indexing -= 1
+                self._evict()
+                self._save()
+                self._condition.notify_all()
@@ -1,59 +1,272 @@
 import json
 import os
-from pyserini.index.lucene import LuceneIndexer
-from pyserini.search.lucene import LuceneSearcher
+import shutil
+import threading
+from contextlib import contextmanager
+from information_retrieval import facets, metrics
 from information_retrieval.data_handler import LUCENE_INDEX_DIR
 
 JSONL_FILE = "jsonld_docs.jsonl"
+# Segments are rewritten without their deleted documents once these make up more than this share of the index.
+DELETES_MERGE_RATIO = float(os.environ.get("LUCENE_DELETES_MERGE_RATIO", "0.2"))
+
+# Importing Pyserini starts a JVM, which takes seconds, so it is deferred until the keyword index is first used
+# (or warm_up asks for it). load_lucene fills these in.
+LuceneSearcher = get_lucene_analyzer = None
+JFile = JFSDirectory = JIndexWriter = JIndexWriterConfig = JOpenMode = JTerm = None
+JDocumentGenerator = JJsonDocument = None
+JArrayList = JBagOfWordsQueryGenerator = JBooleanQueryBuilder = JBytesRef = JOccur = JTermInSetQuery = None
+_lucene_loaded = False
+_lucene_lock = threading.Lock()
+
+
+def load_lucene():
+    """Imports Pyserini and the Lucene classes used directly, starting the JVM. Later calls return immediately."""
+    global LuceneSearcher, get_lucene_analyzer, _lucene_loaded
+    global JFile, JFSDirectory, JIndexWriter, JIndexWriterConfig, JOpenMode, JTerm
+    global JDocumentGenerator, JJsonDocument
+    global JArrayList, JBagOfWordsQueryGenerator, JBooleanQueryBuilder, JBytesRef, JOccur, JTermInSetQuery
+    if _lucene_loaded and LuceneSearcher is not None:
+        return
+    with _lucene_lock:
+        from pyserini.analysis import get_lucene_analyzer as analyzer
+        from pyserini.pyclass import autoclass
+        from pyserini.search.lucene import LuceneSearcher as searcher
+
+        # The searcher is kept if already set (e.g. replaced in tests).
+        LuceneSearcher = LuceneSearcher or searcher
+        get_lucene_analyzer = analyzer
+        JFile = autoclass("java.io.File")
+        JFSDirectory = autoclass("org.apache.lucene.store.FSDirectory")
+        JIndexWriter = autoclass("org.apache.lucene.index.IndexWriter")
+        JIndexWriterConfig = autoclass("org.apache.lucene.index.IndexWriterConfig")
+        JOpenMode = autoclass("org.apache.lucene.index.IndexWriterConfig$OpenMode")
+        JTerm = autoclass("org.apache.lucene.index.Term")
+        # What Pyserini's LuceneIndexer (Anserini's SimpleIndexer) turns a document into, so that ours match.
+        JDocumentGenerator = autoclass("io.anserini.index.generator.DefaultLuceneDocumentGenerator")
+        JJsonDocument = autoclass("io.anserini.collection.JsonCollection$Document")
+        JArrayList = autoclass("java.util.ArrayList")
+        JBagOfWordsQueryGenerator = autoclass("io.anserini.search.query.BagOfWordsQueryGenerator")
+        JBooleanQueryBuilder = autoclass("org.apache.lucene.search.BooleanQuery$Builder")
+        JBytesRef = autoclass("org.apache.lucene.util.BytesRef")
+        JOccur = autoclass("org.apache.lucene.search.BooleanClause$Occur")
+        JTermInSetQuery = autoclass("org.apache.lucene.search.TermInSetQuery")
+        _lucene_loaded = True
+
+
+class SearcherManager:
+    """
+    Shares a single LuceneSearcher between threads and reopens it only when a new commit appears in the index.
+    As with Lucene's own SearcherManager, callers acquire the current searcher and release it when done; a
+    searcher that has been replaced is closed once its last user releases it.
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self._lock = threading.Lock()
+        self._searcher = None
+        self._commit = None
+        self._refs = {}
+
+    def _latest_commit(self):
+        """Identifies the latest commit point by its segments file, or None if there is no index."""
+        try:
+            segments = [f for f in os.listdir(self.index_dir) if f.startswith("segments_")]
+        except FileNotFoundError:
+            return None
+        if not segments:
+            return None
+        latest = max(segments, key=lambda f: int(f.split("_")[1], 36))
+        return latest, os.stat(os.path.join(self.index_dir, latest)).st_mtime_ns
+
+    def acquire(self):
+        """Returns the current searcher, reopening the index if it has been committed to since it was opened."""
+        with self._lock:
+            commit = self._latest_commit()
+            if commit is None:
+                return None
+            if self._searcher is None or commit != self._commit:
+                load_lucene()
+                with metrics.stage("lucene_open"):
+                    searcher = LuceneSearcher(self.index_dir)
+                self._retire()
+                self._searcher, self._commit = searcher, commit
+                self._refs[searcher] = 0
+            self._refs[self._searcher] += 1
+            return self._searcher
+
+    def release(self, searcher):
+        """Hands a searcher back, closing it if it has been replaced and nobody else is using it."""
+        with self._lock:
+            self._refs[searcher] -= 1
+            if self._refs[searcher] == 0 and searcher is not self._searcher:
+                del self._refs[searcher]
+                searcher.close()
+
+    def invalidate(self):
+        """Forces the next acquire to reopen the index, e.g. after it has been rebuilt from scratch."""
+        with self._lock:
+            self._retire()
+
+    @contextmanager
+    def searcher(self):
+        searcher = self.acquire()
+        try:
+            yield searcher
+        finally:
+            if searcher is not None:
+                self.release(searcher)
+
+    def _retire(self):
+        old = self._searcher
+        self._searcher, self._commit = None, None
+        if old is not None and self._refs.get(old) == 0:
+            del self._refs[old]
+            old.close()
+
+
+searcher_manager = SearcherManager(LUCENE_INDEX_DIR)
+generation = 0  # bumped whenever this process commits to the index, so that cached search results can be told apart
 
 def store_jsonld(name:str, data: dict) -> bool:
     """Stores JSON-LD metadata and indexes it with Pyserini."""
-    if not isinstance(data, dict):
+    if not store_jsonld_batch([(name, data)]):
+        return False
+
+    print(f"Saved document '{name}' to Lucene index at {LUCENE_INDEX_DIR}")
+    return True
+
+
+def store_jsonld_batch(documents: list[tuple[str, dict]]) -> bool:
+    """
+    Indexes a batch of (name, JSON-LD metadata) pairs in a single Lucene commit.
+    Documents already indexed under the same names are replaced in that same commit, so searches never miss them.
+    """
+    if not all(isinstance(data, dict) for _, data in documents):
         return False
 
     os.makedirs(LUCENE_INDEX_DIR, exist_ok=True)
+    _reset_invalid_index()
+    latest = dict(documents)  # the last metadata given for a name wins
+    if not latest:
+        return True
+    try:
+        writer = _open_writer()
+    except Exception as e:
+        print(f"Error opening the Lucene index for indexing: {e}")
+        return False
+    try:
+        generator = JDocumentGenerator()
+        for name, data in latest.items():
+            document = generator.createDocument(JJsonDocument.fromFields(name, json.dumps(data)))
+            writer.updateDocument(JTerm("id", name), document)
+        _merge_deletes(writer)
+        writer.commit()
+    finally:
+        writer.close()
+    _committed()
+    facets.update(latest.items())
+    return True
 
-    existing_docs = []
-    if os.path.exists(LUCENE_INDEX_DIR) and os.listdir(LUCENE_INDEX_DIR):
-        try:
-            searcher = LuceneSearcher(LUCENE_INDEX_DIR)
-            searcher.close()
-        except Exception as e:
-            print(f"Error with existing index: {e}. Creating a new one.")
-            for item in os.listdir(LUCENE_INDEX_DIR):
-                item_path = os.path.join(LUCENE_INDEX_DIR, item)
-                if os.path.isfile(item_path):
-                    os.remove(item_path)
-                elif os.path.isdir(item_path):
-                    import shutil
-                    shutil.rmtree(item_path)
-
-    indexer = LuceneIndexer(LUCENE_INDEX_DIR)
-    indexer.add_doc_dict({
-        "id": name,
-        "contents": json.dumps(data),
-    })
-
-    indexer.close()
 
-    print(f"Saved document '{name}' to Lucene index at {LUCENE_INDEX_DIR}")
+def delete_documents(names: list[str]) -> bool:
+    """Deletes the documents indexed under the given names in one commit. Names that are not indexed are ignored."""
+    if not names or not os.path.isdir(LUCENE_INDEX_DIR) or not os.listdir(LUCENE_INDEX_DIR):
+        return True
+    try:
+        writer = _open_writer()
+    except Exception as e:
+        print(f"Error opening the Lucene index for deletion: {e}")
+        return False
+    try:
+        writer.deleteDocuments([JTerm("id", name) for name in names])
+        _merge_deletes(writer)
+        writer.commit()
+    finally:
+        writer.close()
+    _committed()
+    facets.remove(names)
     return True
 
 
-def keyword_search(query: str, top_k: int = 5):
-    """Performs a keyword-based search using Pyserini (BM25 ranking)."""
+def _open_writer():
+    """Opens a writer on LUCENE_INDEX_DIR, creating the index if there is none, analysing text as searches do."""
+    load_lucene()
+    config = JIndexWriterConfig(get_lucene_analyzer()).setOpenMode(JOpenMode.CREATE_OR_APPEND)
+    return JIndexWriter(JFSDirectory.open(JFile(LUCENE_INDEX_DIR).toPath()), config)
+
+
+def _merge_deletes(writer):
+    """Rewrites the segments without their deleted documents once these exceed DELETES_MERGE_RATIO of the index."""
+    stats = writer.getDocStats()
+    if stats.maxDoc and (stats.maxDoc - stats.numDocs) / stats.maxDoc > DELETES_MERGE_RATIO:
+        writer.forceMergeDeletes()
+
+
+def index_version():
+    """Identifies the latest commit to the index, whichever process made it, or None if there is no index."""
+    return searcher_manager._latest_commit()
+
+
+def _committed():
+    global generation
+    searcher_manager.invalidate()
+    generation += 1
+
+
+def _reset_invalid_index():
+    """Empties the index directory if it holds an index that cannot be opened."""
+    if not os.listdir(LUCENE_INDEX_DIR):
+        return
+    try:
+        with searcher_manager.searcher() as searcher:
+            if searcher is None:
+                raise ValueError("no commit found")
+    except Exception as e:
+        print(f"Error with existing index: {e}. Creating a new one.")
+        searcher_manager.invalidate()
+        for item in os.listdir(LUCENE_INDEX_DIR):
+            item_path = os.path.join(LUCENE_INDEX_DIR, item)
+            if os.path.isfile(item_path):
+                os.remove(item_path)
+            elif os.path.isdir(item_path):
+                shutil.rmtree(item_path)
+
+
+def keyword_search(query: str, top_k: int = 5, allowed: set[str] = None):
+    """
+    Performs a keyword-based search using Pyserini (BM25 ranking).
+    If `allowed` names are given, only their documents are considered, through a Lucene filter clause.
+    """
     if not os.path.exists(LUCENE_INDEX_DIR) or not os.listdir(LUCENE_INDEX_DIR):
         return []
+    if allowed is not None and not allowed:
+        return []
 
     try:
-        searcher = LuceneSearcher(LUCENE_INDEX_DIR)
-        hits = searcher.search(query, k=top_k)
+        with searcher_manager.searcher() as searcher:
+            if searcher is None:
+                return []
+            with metrics.stage("lucene_search"):
+                hits = searcher.search(query if allowed is None else filtered_query(query, allowed), k=top_k)
 
-        results = []
-        for hit in hits:
-            results.append(hit.docid)
+            results = []
+            for hit in hits:
+                results.append(hit.docid)
 
         return results
     except Exception as e:
         print(f"Error during keyword search: {e}")
         return []
+
+
+def filtered_query(query: str, names):
+    """Builds the BM25 query Pyserini runs for a query string, restricted to documents with the given ids."""
+    load_lucene()
+    ids = JArrayList()
+    for name in names:
+        ids.add(JBytesRef(name))
+    return (JBooleanQueryBuilder()
+            .add(JBagOfWordsQueryGenerator().buildQuery("contents", get_lucene_analyzer(), query), JOccur.MUST)
+            .add(JTermInSetQuery("id", ids), JOccur.FILTER)
+            .build())
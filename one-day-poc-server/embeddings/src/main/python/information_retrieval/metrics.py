@@ -0,0 +1,153 @@
+"""
+Counters, gauges and latency histograms rendered in the Prometheus text format by the /metrics route.
+
+Code paths time themselves with `stage(name)`; every stage feeds the retrieval_stage_seconds histogram and, while a
+trace is active (see `start_trace`), the trace of the request being served, which the service can return in a
+Server-Timing header. Metrics are kept per process, so every gunicorn worker reports its own series.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the latency histogram buckets.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+registry = []
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+class Metric:
+    """
+    A named family of samples, one per combination of label values. A metric given a `read` function is
+    collected by calling it when rendered: it returns a value, or a dict from label value tuples to values.
+    """
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), read=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._read = read
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def value(self, **labels):
+        return self.samples().get(self._key(labels), 0)
+
+    def samples(self) -> dict:
+        if self._read is not None:
+            read = self._read()
+            return read if isinstance(read, dict) else {(): read}
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in self.samples().items()]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observations = self._values.get(key, ((0,) * len(self.buckets), 0.0, 0))
+            counts = tuple(count + (value <= bound) for count, bound in zip(counts, self.buckets))
+            self._values[key] = (counts, total + value, observations + 1)
+
+    def value(self, **labels) -> int:
+        """The number of observations made with these labels."""
+        sample = self.samples().get(self._key(labels))
+        return 0 if sample is None else sample[2]
+
+    def render(self) -> list[str]:
+        lines = []
+        bucket_labels = self.labelnames + ("le",)
+        for key, (counts, total, observations) in self.samples().items():
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(bucket_labels, key + (_number(bound),))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(bucket_labels, key + ('+Inf',))} {observations}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {observations}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("retrieval_stage_seconds", "Time spent in each stage of serving a request.", ("stage",))
+
+
+@contextmanager
+def stage(name: str):
+    """Times the enclosed block as the given stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        trace = _trace.get()
+        if trace is not None:
+            trace[name] = trace.get(name, 0.0) + elapsed
+
+
+def start_trace():
+    """Starts collecting the stages timed in this context. Returns a token for `end_trace`."""
+    return _trace.set({})
+
+
+def end_trace(token) -> dict:
+    """Stops the trace started with `token` and returns its stage timings in seconds."""
+    trace = _trace.get()
+    _trace.reset(token)
+    return trace or {}
+
+
+def server_timing(trace: dict) -> str:
+    """Formats stage timings as a Server-Timing header value, in milliseconds."""
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in trace.items())
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
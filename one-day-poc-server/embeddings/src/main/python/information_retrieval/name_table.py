@@ -0,0 +1,101 @@
+import mmap
+import os
+import struct
+from collections.abc import MutableMapping
+
+import numpy as np
+
+# Layout: magic, count, sorted int64 ids, count + 1 int64 offsets into a blob of concatenated UTF-8 names.
+MAGIC = b"PITNAMES"
+HEADER = struct.Struct("<8sq")
+
+
+class NameTable(MutableMapping):
+    """
+    Id -> name mapping backed by a memory-mapped file, so every process opening the same file shares its pages
+    and opening it costs the same regardless of its size.
+    The file itself is never modified: writes go to an in-memory overlay and deletions are remembered
+    separately until the table is written out again with write_name_table.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a name table")
+        self._ids = np.frombuffer(self._buffer, dtype="<i8", count=count, offset=HEADER.size)
+        self._offsets = np.frombuffer(self._buffer, dtype="<i8", count=count + 1, offset=HEADER.size + 8 * count)
+        self._blob = HEADER.size + 8 * (2 * count + 1)
+        self._overlay = {}
+        self._deleted = set()
+        self._added = 0  # overlay keys that are not in the file
+
+    def _position(self, key):
+        position = int(np.searchsorted(self._ids, key))
+        if position < len(self._ids) and self._ids[position] == key:
+            return position
+        return None
+
+    def __getitem__(self, key):
+        if key in self._overlay:
+            return self._overlay[key]
+        position = self._position(key) if key not in self._deleted else None
+        if position is None:
+            raise KeyError(key)
+        start, end = self._offsets[position], self._offsets[position + 1]
+        return self._buffer[self._blob + start:self._blob + end].decode("utf-8")
+
+    def __contains__(self, key):
+        if key in self._overlay:
+            return True
+        return key not in self._deleted and self._position(key) is not None
+
+    def __setitem__(self, key, name):
+        key = int(key)
+        if key not in self._overlay and self._position(key) is None:
+            self._added += 1
+        self._deleted.discard(key)
+        self._overlay[key] = name
+
+    def __delitem__(self, key):
+        key = int(key)
+        in_file = self._position(key) is not None
+        if key in self._overlay:
+            del self._overlay[key]
+            if in_file:
+                self._deleted.add(key)
+            else:
+                self._added -= 1
+        elif in_file and key not in self._deleted:
+            self._deleted.add(key)
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for key in self._ids:
+            key = int(key)
+            if key not in self._deleted and key not in self._overlay:
+                yield key
+        yield from self._overlay
+
+    def __len__(self):
+        return len(self._ids) - len(self._deleted) + self._added
+
+    def __reduce__(self):
+        return dict, (dict(self.items()),)
+
+
+def write_name_table(path: str, mapping):
+    """Writes an id -> name mapping in the NameTable file layout."""
+    ids = np.array(sorted(int(key) for key in mapping), dtype="<i8")
+    encoded = [mapping[int(key)].encode("utf-8") for key in ids]
+    offsets = np.zeros(len(ids) + 1, dtype="<i8")
+    offsets[1:] = np.cumsum([len(name) for name in encoded])
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(ids)))
+        f.write(ids.tobytes())
+        f.write(offsets.tobytes())
+        f.write(b"".join(encoded))
+        f.flush()
+        os.fsync(f.fileno())
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def result_key(query: str, embedding, top_k: int, filters: dict = None) -> str:
+    """
+    Hashes the parameters of a search. The embedding is quantized to int8 first, so that embeddings of the same
+    text that differ only by floating-point noise share a key.
+    """
+    quantized = np.rint(np.asarray(embedding, dtype=np.float32) * 127).astype(np.int8)
+    digest = hashlib.sha256()
+    digest.update(query.encode("utf-8"))
+    digest.update(quantized.tobytes())
+    digest.update(json.dumps([top_k, filters or {}], sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of search results with an optional time to live (0 keeps entries until they are evicted).
+    Each entry remembers the generation of the data it was computed from; a lookup at any other generation misses
+    and drops it, so bumping the generation invalidates every entry at once.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0  # misses on entries from an older generation
+        self.expired = 0  # misses on entries older than the time to live
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, generation):
+        """Returns the results cached under the key at this generation, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_generation, stored_at = entry
+                if stored_generation != generation:
+                    self.stale += 1
+                    entry = None
+                elif self.ttl_seconds and self._clock() - stored_at > self.ttl_seconds:
+                    self.expired += 1
+                    entry = None
+                if entry is None:
+                    del self._entries[key]
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, generation, value):
+        """Caches results computed at the given generation, evicting the least recently used beyond max_entries."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, generation, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.stale = self.expired = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "expired": self.expired,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,107 @@
+"""
+One shard of the sharded vector index: a process holding the vectors of part of the templates in its own FAISS
+index and data files. The embedding service reads and writes it through information_retrieval.vector_search.shards.
+
+Usage: python -m information_retrieval.shard SHARD [--port PORT] [--data-dir DIR]
+The shard keeps its files in DIR (default: shards/SHARD beside the service's own files) and listens on PORT
+(default: 7101 + SHARD), so a set of shards can run side by side on one machine:
+    python -m information_retrieval.shard 0 &
+    python -m information_retrieval.shard 1 &
+    SHARD_URLS=http://localhost:7101,http://localhost:7102 python -m information_retrieval
+A shard serves requests on threads of a single process; it does not reload files written by other processes.
+"""
+import argparse
+import atexit
+import os
+
+import numpy as np
+from flask import Flask, Response, jsonify, request
+
+from information_retrieval import data_handler as dh, metrics
+from information_retrieval.vector_search import codec, vector_store as vs
+
+app = Flask(__name__)
+
+shard_id = None
+ready = False
+
+@app.route('/ready', methods=['GET'])
+def ready_route():
+    if not ready:
+        return jsonify({"status": "warming up"}), 503
+    return jsonify({"status": "ready", "shard": shard_id, "templates": vs.template_count()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.route('/shard/search', methods=['POST'])
+def search_route():
+    data = request.json
+    try:
+        embedding = codec.decode(data["embedding"], data.get("encoding", "json"))
+    except (KeyError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Invalid embedding: {e}"})
+    allowed = set(data["allowed"]) if "allowed" in data else None
+    matches = vs.scored_search(embedding, data.get("top_k", 5), allowed=allowed)
+    return jsonify({"status": "success", "matches": [name for name, _ in matches],
+                    "scores": [score for _, score in matches]})
+
+@app.route('/shard/store', methods=['POST'])
+def store_route():
+    data = request.json
+    names = data.get("names")
+    if not isinstance(names, list) or len(names) != len(data.get("embeddings") or []):
+        return jsonify({"status": "error", "message": "Every name needs an embedding"})
+    try:
+        vectors = np.stack([codec.decode(embedding, data.get("encoding", "json")) for embedding in data["embeddings"]])
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Invalid embedding: {e}"})
+
+    with dh.data_lock(exclusive=True):
+        store_embeddings = vs.store_chunk_embeddings if data.get("chunks") else vs.store_embeddings
+        if not store_embeddings(names, vectors):
+            return jsonify({"status": "error", "message": "Failed to store embeddings"})
+        dh.persist(vs.index, vs.store, vs.drain_changes())
+    return jsonify({"status": "success", "stored": len(names)})
+
+@app.route('/shard/delete', methods=['POST'])
+def delete_route():
+    names = request.json.get("names")
+    if not isinstance(names, list):
+        return jsonify({"status": "error", "message": "No template names provided"})
+
+    with dh.data_lock(exclusive=True):
+        removed = vs.delete_embeddings(names)
+        dh.persist(vs.index, vs.store, vs.drain_changes())
+    return jsonify({"status": "success", "removed": removed})
+
+def load(shard: int, data_dir: str = None):
+    """Points the data files at the shard's directory and loads its index."""
+    global shard_id, ready
+    shard_id = shard
+    dh.use_directory(data_dir or os.path.join(dh.BASE_DIR, "shards", str(shard)))
+    with dh.data_lock():
+        vs.index, vs.store = dh.load_data()
+    ready = True
+
+def shutdown():
+    """Persists the shard's index on exit."""
+    with dh.data_lock(exclusive=True):
+        if vs.index is not None:
+            dh.checkpoint(vs.index, vs.store)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("shard", type=int)
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--data-dir")
+    args = parser.parse_args()
+
+    load(args.shard, args.data_dir)
+    atexit.register(shutdown)
+    app.run(host="0.0.0.0", port=args.port or 7101 + args.shard, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
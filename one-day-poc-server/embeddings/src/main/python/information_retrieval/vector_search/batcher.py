@@ -0,0 +1,61 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Merges concurrent embedding requests that arrive within a short window into a single batched call.
+    A request waits at most `window_ms` (plus the time of one batched forward pass) before it is answered.
+    """
+
+    def __init__(self, encode_batch, window_ms: float = 5.0, max_batch_size: int = 32):
+        self.encode_batch = encode_batch
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._condition = threading.Condition()
+        self._worker = None
+
+    def submit(self, text) -> Future:
+        """Queues a text for the next batch and returns a future resolving to its embedding."""
+        future = Future()
+        with self._condition:
+            self._pending.append((text, future))
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+            self._condition.notify()
+        return future
+
+    def embed(self, text, timeout: float = None):
+        """Embeds a single text, blocking until the batch containing it has been encoded."""
+        return self.submit(text).result(timeout=timeout)
+
+    def _next_batch(self) -> list:
+        """Waits for the first pending request, then collects more until the window closes or the batch is full."""
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            deadline = time.monotonic() + self.window
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = self.encode_batch(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
@@ -0,0 +1,80 @@
+"""
+Splits JSON-LD annotations into chunks that the embedding model sees in full (it ignores everything past its
+first 256 tokens) and embeds them in bounded batches, so a template is stored as one vector per chunk.
+
+A document is walked field by field, and every value becomes a "path: value" line, e.g. "author.name: Ada".
+Consecutive lines are packed into chunks of up to CHUNK_WORDS words; a line longer than that on its own is split
+into windows of CHUNK_WORDS words overlapping by CHUNK_OVERLAP, each prefixed with its path. Words stand in for
+model tokens: at the default of 128, chunks of ordinary text stay under the limit.
+At most MAX_CHUNKS chunks are kept per document, and only one batch of chunk texts is held at a time.
+"""
+import json
+import os
+from itertools import islice
+
+import numpy as np
+
+from information_retrieval.vector_search import embedder as emb
+
+CHUNK_WORDS = int(os.environ.get("CHUNK_WORDS", "128"))  # 0 embeds each document as a single text
+CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "16"))
+MAX_CHUNKS = int(os.environ.get("MAX_CHUNKS", "64"))
+
+SKIPPED_FIELDS = {"@context"}  # the same in every template
+
+
+def fields(data, path: str = ""):
+    """Yields (path, text) pairs for the values of a JSON-LD document, in document order."""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key not in SKIPPED_FIELDS:
+                yield from fields(value, f"{path}.{key}" if path else key)
+    elif isinstance(data, list):
+        for item in data:
+            yield from fields(item, path)
+    elif data is not None and str(data).strip():
+        yield path, str(data)
+
+
+def chunks(data):
+    """Yields the chunk texts of a parsed JSON-LD document; at least one, even for an empty document."""
+    if CHUNK_WORDS <= 0:
+        yield json.dumps(data)
+        return
+    packed, words, emitted = [], 0, False
+    for path, text in fields(data):
+        line = f"{path}: {text}" if path else text
+        count = len(line.split())
+        if packed and words + count > CHUNK_WORDS:
+            yield "\n".join(packed)
+            packed, words, emitted = [], 0, True
+        if count <= CHUNK_WORDS:
+            packed.append(line)
+            words += count
+            continue
+        prefix, tokens = f"{path}: " if path else "", text.split()
+        step = max(CHUNK_WORDS - CHUNK_OVERLAP, 1)
+        for start in range(0, max(len(tokens) - CHUNK_OVERLAP, 1), step):
+            yield prefix + " ".join(tokens[start:start + CHUNK_WORDS])
+            emitted = True
+    if packed or not emitted:
+        yield "\n".join(packed) if packed else json.dumps(data)
+
+
+def embed_documents(documents, batch_size: int = 32):
+    """
+    Embeds the chunks of (name, JSON-LD metadata) pairs, in batches that can span documents.
+    Returns the template name of every chunk and a (chunks, dimension) array of their embeddings, or None if
+    any chunk could not be embedded.
+    """
+    pending = ((name, text) for name, data in documents for text in islice(chunks(data), MAX_CHUNKS))
+    names, embedded = [], []
+    while batch := list(islice(pending, batch_size)):
+        embeddings = emb.embed_batch([text for _, text in batch], batch_size=batch_size)
+        if embeddings is None or any(embedding is None for embedding in embeddings):
+            return None
+        names.extend(name for name, _ in batch)
+        embedded.append(np.stack(embeddings))
+    if not embedded:
+        return [], np.empty((0, 0), dtype=np.float32)
+    return names, np.concatenate(embedded)
@@ -0,0 +1,60 @@
+import base64
+
+import numpy as np
+
+# Compact wire encodings of an embedding: base64 of its little-endian components. int8 stores round(127 * v),
+# which only suits the unit-normalised embeddings the embedder produces (every component is within [-1, 1]).
+# "json" keeps the plain list of floats.
+ENCODINGS = ("json", "float32", "float16", "int8")
+INT8_SCALE = 127.0
+
+# Request and response bodies of this content type are the packed components themselves, without base64 or JSON;
+# a batch is its embeddings one after the other.
+RAW_CONTENT_TYPE = "application/octet-stream"
+RAW_DTYPES = {"float32": "<f4", "float16": "<f2", "int8": np.int8}
+
+
+def encode(embedding, encoding: str = "json"):
+    """Encodes an embedding as a list of floats ("json") or a base64 string in the given encoding."""
+    if encoding == "json":
+        return np.asarray(embedding).tolist()
+    return base64.b64encode(to_bytes(embedding, encoding)).decode("ascii")
+
+
+def decode(encoded, encoding: str = "json") -> np.ndarray:
+    """Decodes an embedding produced by encode into a float32 vector."""
+    if encoding == "json":
+        return np.asarray(encoded, dtype=np.float32)
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}', expected one of: {', '.join(ENCODINGS)}")
+    return from_bytes(base64.b64decode(encoded, validate=True), encoding)
+
+
+def to_bytes(embeddings, encoding: str = "float32") -> bytes:
+    """Packs one embedding, or the rows of a 2-D array of them, into little-endian bytes in the given encoding."""
+    if encoding not in RAW_DTYPES:
+        raise ValueError(f"Unknown encoding '{encoding}', expected one of: {', '.join(RAW_DTYPES)}")
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if encoding == "int8":
+        return np.clip(np.rint(vectors * INT8_SCALE), -127, 127).astype(np.int8).tobytes()
+    return vectors.astype(RAW_DTYPES[encoding]).tobytes()
+
+
+def from_bytes(raw: bytes, encoding: str = "float32", dimension: int = None) -> np.ndarray:
+    """
+    Unpacks bytes produced by to_bytes into a float32 vector, or into rows of `dimension` components when given.
+    Raises ValueError if the bytes do not hold a whole number of components or rows.
+    """
+    if encoding not in RAW_DTYPES:
+        raise ValueError(f"Unknown encoding '{encoding}', expected one of: {', '.join(RAW_DTYPES)}")
+    dtype = np.dtype(RAW_DTYPES[encoding])
+    if len(raw) % dtype.itemsize:
+        raise ValueError(f"{len(raw)} bytes are not a whole number of {encoding} components")
+    vectors = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+    if encoding == "int8":
+        vectors /= INT8_SCALE
+    if dimension is not None:
+        if dimension <= 0 or vectors.size % dimension:
+            raise ValueError(f"{vectors.size} components are not a whole number of rows of {dimension}")
+        vectors = vectors.reshape(-1, dimension)
+    return vectors
@@ -1,17 +1,135 @@
-from sentence_transformers import SentenceTransformer
+import os
+import shutil
+import threading
+
 import numpy as np
 
-model = SentenceTransformer('all-MiniLM-L6-v2')
+from information_retrieval import metrics
+from information_retrieval.vector_search.embedding_cache import EmbeddingCache
+
+EMBED_MODEL = os.environ.get("EMBED_MODEL", "all-MiniLM-L6-v2")
+# Inference backend: "torch" (PyTorch), "onnx" (ONNX Runtime, needs optimum[onnxruntime]) or "int8" (PyTorch with
+# int8 dynamically quantized linear layers). test_embedder checks that the latter two agree with PyTorch.
+EMBED_BACKEND = os.environ.get("EMBED_BACKEND", "torch")
+BACKENDS = ("torch", "onnx", "int8")
+# Local copy of the model, saved there on first load and loaded from there afterwards without contacting the Hub.
+EMBED_MODEL_DIR = os.environ.get("EMBED_MODEL_DIR")
+EMBED_CACHE_SIZE = int(os.environ.get("EMBED_CACHE_SIZE", "4096"))
+EMBED_CACHE_FILE = os.environ.get("EMBED_CACHE_FILE")  # unset: the cache only lives as long as the process
+
+# sentence_transformers imports torch, so neither is imported until the model is first needed.
+model = None
+_model_lock = threading.Lock()
+cache = EmbeddingCache(EMBED_CACHE_SIZE, namespace=f"{EMBED_MODEL}:{EMBED_BACKEND}")
+if EMBED_CACHE_FILE:
+    cache.load(EMBED_CACHE_FILE)
+
+def get_model():
+    """Returns the sentence transformer, loading it on first use."""
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                model = load_model()
+                cache.lowercase = lowercases(model)
+    return model
+
+
+def lowercases(loaded) -> bool:
+    """Whether the model's tokenizer lower-cases its input (uncased models), so that case never changes an embedding."""
+    return bool(getattr(getattr(loaded, "tokenizer", None), "do_lower_case", False))
+
+
+def load_model(backend: str = None):
+    """
+    Loads the model for the given (or configured) backend, from EMBED_MODEL_DIR if it has been saved there,
+    otherwise by name, saving it if configured.
+    """
+    backend = backend or EMBED_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of: {', '.join(BACKENDS)}")
+    from sentence_transformers import SentenceTransformer
+    options = {"backend": "onnx"} if backend == "onnx" else {}
+
+    if EMBED_MODEL_DIR and os.path.isdir(EMBED_MODEL_DIR):
+        loaded = SentenceTransformer(EMBED_MODEL_DIR, **options)
+    else:
+        loaded = SentenceTransformer(EMBED_MODEL, **options)
+        if EMBED_MODEL_DIR:
+            # Saved next to its final place and renamed, so that other workers never load a partial copy.
+            tmp_dir = f"{EMBED_MODEL_DIR}.{os.getpid()}.tmp"
+            loaded.save(tmp_dir)
+            try:
+                os.rename(tmp_dir, EMBED_MODEL_DIR)
+            except OSError:
+                shutil.rmtree(tmp_dir, ignore_errors=True)  # another process saved it first
+    return quantize(loaded) if backend == "int8" else loaded
+
+
+def quantize(loaded):
+    """Replaces the model's linear layers with int8 dynamically quantized ones, which run faster on CPU."""
+    import torch
+    return torch.ao.quantization.quantize_dynamic(loaded, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+# Embeddings are float32 ndarrays from the model to the index; they become lists only when returned as JSON.
+# Returned arrays are read-only, since the cache hands the same array to every caller.
 
 def embed(text: str):
     """Converts input text into vector embeddings using a huggingface sentence transformer."""
     if not isinstance(text, str):
         return None
-    return normalize(model.encode(text).tolist())
+    embedding = cache.get(text)
+    if embedding is None:
+        with metrics.stage("embed"):
+            embedding = _frozen(normalize(get_model().encode(text)))
+        cache.put(text, embedding)
+    return embedding
+
+
+def embed_batch(texts: list, batch_size: int = 32):
+    """
+    Converts a list of texts into vector embeddings with batched forward passes.
+    Entries that are not strings map to None, so callers can match results to inputs by position.
+    Cached texts are not re-encoded.
+    """
+    if not isinstance(texts, list):
+        return None
+    embeddings = [None] * len(texts)
+    missing = []
+    for i, text in enumerate(texts):
+        if isinstance(text, str):
+            embeddings[i] = cache.get(text)
+            if embeddings[i] is None:
+                missing.append(i)
+    if not missing:
+        return embeddings
+    with metrics.stage("embed"):
+        encoded = _frozen(normalize(get_model().encode([texts[i] for i in missing], batch_size=batch_size)))
+    for i, vector in zip(missing, encoded):
+        embeddings[i] = vector  # a row view of the batch, not a copy
+        cache.put(texts[i], vector)
+    return embeddings
+
+
+def save_cache():
+    """Writes the embedding cache to EMBED_CACHE_FILE, if one is configured, so it survives restarts."""
+    if EMBED_CACHE_FILE:
+        cache.save(EMBED_CACHE_FILE)
+
+
+def normalize(embeddings) -> np.ndarray:
+    """
+    Scales a vector, or every row of a matrix, to unit L2 norm as float32. Zero vectors are left unchanged.
+    Float32 input is normalised in place.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    embeddings /= norms
+    return embeddings
 
 
-def normalize(embedding: list[float]) -> list[float]:
-    """Normalize the embedding vectors so that they sum up to 1 (or very close to)."""
-    embedding = np.array(embedding)
-    norm = np.linalg.norm(embedding)
-    return (embedding / norm).tolist() if norm != 0 else embedding.tolist()
\ No newline at end of file
+def _frozen(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
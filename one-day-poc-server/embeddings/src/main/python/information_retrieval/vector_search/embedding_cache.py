@@ -0,0 +1,124 @@
+import hashlib
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def cache_key(text: str, lowercase: bool = False) -> str:
+    """
+    Hashes a text after normalising it the way the model's tokenizer would anyway: Unicode NFC and collapsed
+    whitespace, and lower case for uncased models. Texts with the same key get the same embedding.
+    """
+    normalized = unicodedata.normalize("NFC", text)
+    if lowercase:
+        normalized = normalized.lower()
+    return hashlib.sha256(" ".join(normalized.split()).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of embeddings keyed by normalised-text hash, with hit and miss counters.
+    A max_entries of 0 disables the cache: every lookup misses and nothing is stored.
+    The namespace names the model (and backend) the embeddings come from; a saved cache is only loaded back into
+    a cache with the same namespace.
+    """
+
+    def __init__(self, max_entries: int = 4096, namespace: str = "", lowercase: bool = False):
+        self.max_entries = max_entries
+        self.namespace = namespace
+        self.lowercase = lowercase  # whether the model's tokenizer lower-cases texts, so case can be left out of keys
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str):
+        """Returns the cached embedding for the text (a read-only float32 array), or None on a miss."""
+        key = cache_key(text, self.lowercase)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, text: str, embedding):
+        """Caches an embedding, evicting the least recently used entries beyond max_entries."""
+        if self.max_entries <= 0 or embedding is None:
+            return
+        key = cache_key(text, self.lowercase)
+        embedding = _read_only(embedding)
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def save(self, path: str):
+        """Writes the cached entries, least recently used first, so that loading restores the LRU order."""
+        with self._lock:
+            keys = list(self._entries)
+            vectors = np.array([self._entries[key] for key in keys], dtype=np.float32)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, keys=np.array(keys, dtype="U64"), vectors=vectors, namespace=np.array(self.namespace),
+                     lowercase=np.array(self.lowercase))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> bool:
+        """
+        Loads entries written by save, along with whether their keys were lower-cased. Returns False if there is no
+        readable cache file, or it was written for another namespace (its embeddings came from another model).
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                keys, vectors = data["keys"], data["vectors"]
+                namespace, lowercase = str(data["namespace"]), bool(data["lowercase"])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable embedding cache {path}: {e}")
+            return False
+        if namespace != self.namespace:
+            print(f"Ignoring embedding cache {path}, written for '{namespace}' rather than '{self.namespace}'.")
+            return False
+        with self._lock:
+            self.lowercase = lowercase
+            for key, vector in zip(keys.tolist(), _read_only(vectors)):
+                self._entries[key] = vector
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+
+def _read_only(embedding) -> np.ndarray:
+    """Returns the embedding as a float32 array that cannot be modified, copying only if it has to."""
+    embedding = np.asarray(embedding, dtype=np.float32)
+    if embedding.flags.writeable:
+        embedding = embedding.copy()
+        embedding.flags.writeable = False
+    return embedding
@@ -0,0 +1,208 @@
+"""
+Builds the FAISS index used by the vector store from configuration.
+
+INDEX_TYPE selects one of:
+- flat:     exact brute-force search (default).
+- hnsw:     graph-based search; no training needed. Tuned with HNSW_M and HNSW_EF_SEARCH.
+- ivf_flat: inverted lists over IVF_NLIST clusters; must be trained. Tuned with IVF_NPROBE.
+- ivf_pq:   inverted lists with product-quantized codes (PQ_M bytes per vector); must be trained.
+- sq_fp16:  exact search over float16 vectors (half the memory of flat).
+- sq_int8:  exact search over int8 scalar-quantized vectors (a quarter of the memory); must be trained on
+            SQ_TRAINING_POINTS vectors.
+- binary:   Hamming search over sign bits of randomly rotated vectors, reranked on float16 copies of the
+            best BINARY_RERANK_FACTOR * k candidates. Returns L2 distances rather than inner products,
+            which rank unit vectors the same way.
+
+Every type is wrapped in an IndexIDMap2, so vectors are added and looked up by explicit template ids.
+Vectors stored before there are enough to train an index are kept in a flat one until there are.
+
+An existing index can be rebuilt into another type with:
+    python -m information_retrieval.vector_search.index_factory migrate INDEX_TYPE
+"""
+import os
+import sys
+
+import faiss
+import numpy as np
+
+INDEX_TYPE = os.environ.get("INDEX_TYPE", "flat")
+HNSW_M = int(os.environ.get("HNSW_M", "32"))
+HNSW_EF_SEARCH = int(os.environ.get("HNSW_EF_SEARCH", "64"))
+IVF_NLIST = int(os.environ.get("IVF_NLIST", "256"))
+IVF_NPROBE = int(os.environ.get("IVF_NPROBE", "16"))
+PQ_M = int(os.environ.get("PQ_M", "48"))
+BINARY_RERANK_FACTOR = int(os.environ.get("BINARY_RERANK_FACTOR", "32"))
+# SQ8 learns the value range of each dimension from its training vectors, widened by SQ_RANGE_MARGIN of it on
+# either side so that vectors added later rarely fall outside. A few vectors give a range too narrow to encode
+# most others distinctly, so it is only trained once SQ_TRAINING_POINTS vectors have been stored.
+SQ_TRAINING_POINTS = int(os.environ.get("SQ_TRAINING_POINTS", "256"))
+SQ_RANGE_MARGIN = float(os.environ.get("SQ_RANGE_MARGIN", "0.2"))
+
+FACTORY_STRINGS = {
+    "hnsw": "HNSW{hnsw_m},Flat",
+    "ivf_flat": "IVF{nlist},Flat",
+    "ivf_pq": "IVF{nlist},PQ{pq_m}",
+    "sq_fp16": "SQfp16",
+    "sq_int8": "SQ8",
+}
+PQ_CENTROIDS = 256
+
+
+def create_index(dimension: int, index_type: str = None):
+    """Creates an empty, id-mapped inner-product index of the given (or configured) type."""
+    index_type = index_type or INDEX_TYPE
+    if index_type == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+    if index_type == "binary":
+        # FAISS has no inner-product binary index, so this is built by hand rather than from a factory string.
+        codes = faiss.IndexLSH(dimension, dimension, True, False)
+        rerank = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+        return configure(faiss.IndexIDMap2(faiss.IndexRefine(codes, rerank)))
+    if index_type not in FACTORY_STRINGS:
+        raise ValueError(f"Unknown index type '{index_type}', "
+                         f"expected one of: flat, binary, {', '.join(FACTORY_STRINGS)}")
+
+    factory = FACTORY_STRINGS[index_type].format(hnsw_m=HNSW_M, nlist=IVF_NLIST, pq_m=PQ_M)
+    index = faiss.index_factory(dimension, f"IDMap2,{factory}", faiss.METRIC_INNER_PRODUCT)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        # Keeps vectors reconstructable by position, which migrating to another type relies on.
+        ivf.set_direct_map_type(faiss.DirectMap.Array)
+    quantizer = faiss.downcast_index(faiss.downcast_index(index).index)
+    if isinstance(quantizer, faiss.IndexScalarQuantizer):
+        quantizer.sq.rangestat_arg = SQ_RANGE_MARGIN
+    configure(index)
+    return index
+
+
+def with_id_map(index):
+    """
+    Returns the index as an IndexIDMap2. Indexes persisted before ids were explicit used positions as ids,
+    so their vectors are moved into an id-mapped index of the same type with ids 0..ntotal-1.
+    """
+    if isinstance(index, faiss.IndexIDMap2):
+        return index
+    mapped = faiss.IndexIDMap2(_empty_copy(index))
+    if index.ntotal:
+        mapped.add_with_ids(_reconstruct_all(index), np.arange(index.ntotal, dtype=np.int64))
+    return mapped
+
+
+def without_ids(index, ids):
+    """
+    Returns a copy of an id-mapped index without the given ids, keeping its type and training.
+    Used for index types that cannot remove vectors in place (HNSW, and IVF behind an id map).
+    """
+    vectors = _reconstruct_all(faiss.downcast_index(index.index))
+    all_ids = faiss.vector_to_array(index.id_map)
+    keep = ~np.isin(all_ids, np.fromiter(ids, dtype=np.int64))
+    compacted = _empty_copy(index)
+    compacted.add_with_ids(vectors[keep], all_ids[keep])
+    return compacted
+
+
+def _empty_copy(index):
+    copy = faiss.clone_index(index)
+    copy.reset()
+    return copy
+
+
+def _reconstruct_all(index) -> np.ndarray:
+    """Returns every vector of an index that is not id-mapped, in position order."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+    if not index.ntotal:
+        return np.zeros((0, index.d), dtype=np.float32)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def configure(index):
+    """Applies the configured search-time parameters (nprobe, efSearch, rerank factor) that the index supports."""
+    parameters = faiss.ParameterSpace()
+    for name, value in (("nprobe", IVF_NPROBE), ("efSearch", HNSW_EF_SEARCH), ("k_factor_rf", BINARY_RERANK_FACTOR)):
+        try:
+            parameters.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass
+    return index
+
+
+def search_among(index, queries: np.ndarray, k: int, ids) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Searches an id-mapped index considering only the given ids, through an id selector applied inside the search.
+    Binary codes cannot be searched with a selector, so their float16 copies are searched exhaustively instead.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexRefine):
+        all_ids = faiss.vector_to_array(index.id_map)
+        selector = faiss.IDSelectorBatch(np.flatnonzero(np.isin(all_ids, ids)))
+        distances, found = inner.refine_index.search(queries, k, params=faiss.SearchParameters(sel=selector))
+        return distances, np.where(found >= 0, all_ids[found], -1)
+
+    selector = faiss.IDSelectorBatch(ids)
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    elif isinstance(inner, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    return index.search(queries, k, params=params)
+
+
+def min_training_points(index) -> int:
+    """Number of vectors needed to train the index (0 if it needs no training)."""
+    if index.is_trained:
+        return 0
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+        # Binary codes only need a random rotation; a scalar quantizer needs a sample of the value ranges.
+        return SQ_TRAINING_POINTS if isinstance(inner, faiss.IndexScalarQuantizer) else 1
+    ivf = faiss.downcast_index(ivf)
+    return max(ivf.nlist, PQ_CENTROIDS) if isinstance(ivf, faiss.IndexIVFPQ) else ivf.nlist
+
+
+def train(index, vectors: np.ndarray) -> bool:
+    """Trains the index on the given vectors if it needs training. Returns False if there are too few."""
+    if index.is_trained:
+        return True
+    if len(vectors) < min_training_points(index):
+        return False
+    index.train(np.asarray(vectors, dtype=np.float32))
+    return True
+
+
+def rebuild(index, index_type: str):
+    """Rebuilds an index into the given type, keeping every vector at the same id."""
+    return rebuild_into(index, create_index(index.d, index_type))
+
+
+def rebuild_into(index, rebuilt):
+    """Trains the empty index `rebuilt` on the vectors of `index` if it needs training, and adds them at the same ids."""
+    index = with_id_map(index)
+    vectors = _reconstruct_all(faiss.downcast_index(index.index))
+    if not train(rebuilt, vectors):
+        raise ValueError(f"Training the index needs at least {min_training_points(rebuilt)} vectors, "
+                         f"the index has {index.ntotal}")
+    rebuilt.add_with_ids(vectors, faiss.vector_to_array(index.id_map))
+    return rebuilt
+
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] != "migrate":
+        print(__doc__)
+        sys.exit(1)
+
+    from information_retrieval.data_handler import checkpoint, data_lock, load_data
+    with data_lock(exclusive=True):
+        index, store = load_data()
+        rebuilt = rebuild(index, sys.argv[2])
+        checkpoint(rebuilt, store)
+    print(f"Rebuilt {index.ntotal} vectors into {type(faiss.downcast_index(rebuilt.index)).__name__}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Client side of the sharded vector index. With SHARD_URLS set, template vectors are not kept in this process but
+partitioned across the shard processes at those URLs (see information_retrieval.shard): each template lives on the
+shard picked by a hash of its name, writes go to the shards holding their templates, and searches go to every
+shard at once and have their per-shard top-k merged by score.
+
+The position of a URL in SHARD_URLS decides which templates its shard holds, so the list must not be reordered or
+resized while the shards hold data. A write spanning several shards is not atomic: if one of them fails, the
+others keep what they stored.
+"""
+import json
+import os
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from information_retrieval import metrics
+from information_retrieval.vector_search import codec
+
+SHARD_URLS = [url.strip().rstrip("/") for url in os.environ.get("SHARD_URLS", "").split(",") if url.strip()]
+SHARD_TIMEOUT_MS = float(os.environ.get("SHARD_TIMEOUT_MS", "2000"))
+SHARD_WRITE_TIMEOUT_S = float(os.environ.get("SHARD_WRITE_TIMEOUT_S", "60"))
+
+# Room for a few concurrent searches, each of which sends one request per shard.
+shard_pool = ThreadPoolExecutor(max_workers=8 * max(len(SHARD_URLS), 1), thread_name_prefix="shard")
+generation = 0  # bumped whenever this process writes to the shards, so that cached search results can be told apart
+
+
+def shard_of(name: str) -> int:
+    """The shard holding the template with this name."""
+    return zlib.crc32(name.encode("utf-8")) % len(SHARD_URLS)
+
+
+def partition(names) -> dict[int, list[int]]:
+    """Groups the positions of the names by the shard holding them."""
+    groups = {}
+    for position, name in enumerate(names):
+        groups.setdefault(shard_of(name), []).append(position)
+    return groups
+
+
+def semantic_search(embedding, top_k: int, allowed: set[str] = None) -> list[str]:
+    """
+    Returns the names of the top_k nearest templates across all shards. Only the shards holding `allowed` names
+    are asked, each for its own. Shards that fail or do not answer within SHARD_TIMEOUT_MS are left out.
+    """
+    with metrics.stage("shard_search"):
+        query = {"embedding": codec.encode(embedding, "float32"), "encoding": "float32", "top_k": top_k}
+        if allowed is None:
+            payloads = {shard: query for shard in range(len(SHARD_URLS))}
+        else:
+            allowed = list(allowed)
+            payloads = {shard: {**query, "allowed": [allowed[position] for position in positions]}
+                        for shard, positions in partition(allowed).items()}
+        responses = _scatter("/shard/search", payloads, SHARD_TIMEOUT_MS / 1000)
+        scored = [(name, score) for response in responses.values()
+                  for name, score in zip(response["matches"], response["scores"])]
+        scored.sort(key=lambda match: match[1], reverse=True)
+        return [name for name, _ in scored[:top_k]]
+
+
+def store_embeddings(names: list[str], vectors: np.ndarray) -> bool:
+    """Stores each embedding on the shard holding its name. Returns False if any shard failed."""
+    return _store(names, vectors, chunks=False)
+
+
+def store_chunk_embeddings(names: list[str], vectors: np.ndarray) -> bool:
+    """As vector_store.store_chunk_embeddings, on the shards holding the templates. Returns False if any failed."""
+    return _store(names, vectors, chunks=True)
+
+
+def _store(names: list[str], vectors: np.ndarray, chunks: bool) -> bool:
+    global generation
+    if len(names) != len(vectors):
+        return False
+    if not names:
+        return True
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(names), -1)
+    payloads = {shard: {"names": [names[position] for position in positions],
+                        "embeddings": [codec.encode(vectors[position], "float32") for position in positions],
+                        "encoding": "float32", "chunks": chunks}
+                for shard, positions in partition(names).items()}
+    responses = _scatter("/shard/store", payloads, SHARD_WRITE_TIMEOUT_S)
+    generation += 1
+    return len(responses) == len(payloads)
+
+
+def delete_embeddings(names: list[str]) -> int:
+    """Removes the embeddings stored under the given names from their shards. Returns how many were removed."""
+    global generation
+    payloads = {shard: {"names": [names[position] for position in positions]}
+                for shard, positions in partition(names).items()}
+    responses = _scatter("/shard/delete", payloads, SHARD_WRITE_TIMEOUT_S)
+    generation += 1
+    return sum(response["removed"] for response in responses.values())
+
+
+def _scatter(path: str, payloads: dict[int, dict], timeout: float) -> dict[int, dict]:
+    """Posts to the given shards in parallel. Returns the successful responses by shard; failures are logged."""
+    futures = {shard: shard_pool.submit(_post, f"{SHARD_URLS[shard]}{path}", payload, timeout)
+               for shard, payload in payloads.items()}
+    responses = {}
+    for shard, future in futures.items():
+        try:
+            response = future.result()
+        except Exception as e:
+            print(f"Shard {shard} at {SHARD_URLS[shard]} failed on {path}: {e}")
+            continue
+        if response.get("status") != "success":
+            print(f"Shard {shard} at {SHARD_URLS[shard]} failed on {path}: {response.get('message')}")
+            continue
+        responses[shard] = response
+    return responses
+
+
+def _post(url: str, payload: dict, timeout: float) -> dict:
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
@@ -1,20 +1,329 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import faiss
 import numpy as np
 
+from information_retrieval import metrics
+from information_retrieval.data_handler import make_writable
+from information_retrieval.vector_search.index_factory import (create_index, min_training_points, rebuild_into,
+                                                               search_among, train, with_id_map, without_ids)
+
+# Share of the index that may be taken up by vectors of deleted templates before it is rebuilt without them.
+TOMBSTONE_COMPACT_RATIO = float(os.environ.get("TOMBSTONE_COMPACT_RATIO", "0.2"))
+# A template stored as several chunk vectors gets one score from those of its chunks among the nearest vectors:
+# "max" keeps its best chunk's, "sum" adds them up, favouring templates that match in several places.
+CHUNK_POOLING = os.environ.get("CHUNK_POOLING", "max")
+# Vectors fetched per requested template, leaving room for several chunks of the same template.
+CHUNK_SEARCH_FACTOR = int(os.environ.get("CHUNK_SEARCH_FACTOR", "4"))
+
+# Writers never modify the index that searches are using. They change a spare copy of it and publish that by
+# rebinding `index`; once the last search still using the index it replaced is done, the same changes are made to
+# that one, which becomes the next spare. Inserts and deletes thus cost their own work twice rather than a copy of
+# the whole index, for keeping two copies in memory, and a search never waits for a write.
+# Names are stored before the vectors are published and removed only after, so every id a search can return has
+# its name. Index types that cannot remove vectors in place keep the vectors of deleted templates (ids without a
+# name) until there are enough of them to rebuild the index.
 index, store = None, {}
+changes = []  # (id, name, vector) inserts and (id, None, None) deletes not yet handed to data_handler.persist
+write_lock = threading.Lock()  # serialises writers, so that concurrent inserts never pick the same id
+generation = 0  # bumped whenever a new index is published, so that cached search results can be told apart
+_spare, _spare_of = None, None  # the spare copy and the index it is a copy of; no search uses the spare
+# Vectors stored before there are enough to train the index (IVF, SQ8) wait in a flat index, which is searched
+# exactly, and are moved into the trained index once there are enough of them.
+_untrained, _staging = None, None  # an empty index of the type to move them into, and the flat index they wait in
+_readers = threading.Condition()  # guards _searches and the publishing of `index`
+_searches = {}  # id of an index -> number of searches using it
+# Ids are never reused: an index that keeps the vectors of deleted templates would otherwise return them under
+# the new template's name. next_id stays past every id this process has handed out; it is worked out again from
+# the index's ids (which include those of kept vectors) and the mappings whenever another index is loaded.
+next_id = 0
+_numbered = None  # the index next_id was last brought past
+# Filtered searches find the ids of the allowed names here rather than by going through `store`, which writers
+# change while searches run. Each name's entry is replaced whole, once the index holding its new ids is published.
+ids_by_name = {}
+_named = None  # the store ids_by_name was built from
+
+def semantic_search(embedding: list, top_k: int, allowed: set[str] = None):
+    """Returns the names of the top_k nearest templates, only considering the `allowed` names if given."""
+    return [name for name, _ in scored_search(embedding, top_k, allowed)]
+
+def scored_search(embedding: list, top_k: int, allowed: set[str] = None) -> list[tuple[str, float]]:
+    """
+    Returns (name, score) pairs for the top_k nearest templates, best first. Higher scores are closer, and
+    scores from indexes of the same type can be compared, so results from several shards can be merged.
+    The chunks of a template are pooled into one score (see CHUNK_POOLING).
+    """
+    # Looked up before the search counts as using the index, as after a reload this waits for write_lock.
+    by_name = _ids_by_name() if allowed is not None else None
+    with metrics.stage("faiss_search"), _searching() as searched:
+        names = store
+        base = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        if searched.ntotal == 0:
+            return []
+        # Binary indexes rank by L2 distance, the others by inner product.
+        sign = -1.0 if searched.metric_type == faiss.METRIC_L2 else 1.0
+        if allowed is not None:
+            # Vectors of deleted templates have no name, so they are never among the selected ids.
+            ids = [idx for name in allowed for idx in by_name.get(name, ())]
+            if not ids:
+                return []
+            search, available, stale = (lambda k: search_among(searched, base, k, ids)), len(ids), 0
+        else:
+            # Fetch extra candidates to make up for vectors of deleted templates that are still in the index.
+            search, available = (lambda k: searched.search(base, k)), searched.ntotal
+            stale = max(searched.ntotal - len(names), 0)
+
+        k = min(top_k * CHUNK_SEARCH_FACTOR + stale, available)
+        while True:
+            distances, indices = search(k)
+            pooled = _pool(indices[0], distances[0] * sign, names)
+            if len(pooled) >= top_k or k >= available:
+                break
+            k = min(2 * k, available)  # the candidates were chunks of too few templates
+        return sorted(pooled.items(), key=lambda match: match[1], reverse=True)[:top_k]
 
-def semantic_search(embedding: list, top_k: int):
-    base = np.array(embedding, dtype=np.float32).reshape(1, -1)
-    if index.ntotal == 0:
-        return []
+@contextmanager
+def _searching():
+    """Yields the published index, which counts as in use by a search until the block is left."""
+    with _readers:
+        searched = index
+        _searches[id(searched)] = _searches.get(id(searched), 0) + 1
+    try:
+        yield searched
+    finally:
+        with _readers:
+            _searches[id(searched)] -= 1
+            if not _searches[id(searched)]:
+                del _searches[id(searched)]
+                _readers.notify_all()
 
-    distances, indices = index.search(base, top_k)
-    results = [store[idx] for idx in indices[0] if idx in store]
-    return results
+def _pool(indices, scores, names) -> dict[str, float]:
+    """Pools the scores of the candidate vectors, best first, into one score per template name."""
+    pooled = {}
+    for idx, score in zip(indices.tolist(), scores.tolist()):
+        name = names.get(idx)
+        if name is None:
+            continue
+        if name not in pooled:
+            pooled[name] = score
+        elif CHUNK_POOLING == "sum":
+            pooled[name] += score
+    return pooled
 
 def store_embedding(name: str, vector: np.array) -> bool:
-    if not index.is_trained:
+    return store_embeddings([name], vector.reshape(1, -1))
+
+def store_embeddings(names: list[str], vectors: np.ndarray) -> bool:
+    """
+    Stores a batch of embeddings with a single insertion into the index, replacing any stored under the same names.
+    Only the last embedding of a name repeated within the batch is kept.
+    An index that still needs training (IVF, SQ8) is trained on the batch if it is large enough; otherwise the
+    embeddings wait in a flat index until enough have been stored to train it.
+    """
+    if len(names) != len(vectors):
+        return False
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(names), -1)
+    last = {name: position for position, name in enumerate(names)}
+    return _store(list(last), vectors[list(last.values())])
+
+def store_chunk_embeddings(names: list[str], vectors: np.ndarray) -> bool:
+    """
+    Stores the embeddings of template chunks with a single insertion: each vector is one chunk of the template
+    named at the same position. All the chunks of a template replace whatever was stored under its name.
+    """
+    if len(names) != len(vectors):
         return False
-    vector = vector.reshape(1, -1)
-    index.add(vector)
-    store[len(store)] = name
-    return True
\ No newline at end of file
+    return _store(names, np.asarray(vectors, dtype=np.float32).reshape(len(names), -1))
+
+def _store(names: list[str], vectors: np.ndarray) -> bool:
+    if not names:
+        return True
+    with write_lock:
+        _index_names()
+        _write(names, vectors, None, _ids_of(set(names)))
+        return True
+
+def apply_records(records: list):
+    """
+    Applies (id, name, vector) inserts and (id, None, None) deletes that another process has logged, keeping their
+    ids. They are not added to `changes`, as they are persisted already.
+    """
+    latest = {}
+    for idx, name, vector in records:
+        latest[idx] = None if name is None else (name, vector)
+    with write_lock:
+        _index_names()
+        removed = [idx for idx, record in latest.items() if record is None and idx in store]
+        inserted = [(idx, record) for idx, record in latest.items() if record is not None and idx not in store]
+        if not removed and not inserted:
+            return
+        names = [name for _, (name, _) in inserted]
+        vectors = np.array([vector for _, (_, vector) in inserted], dtype=np.float32).reshape(len(inserted), -1)
+        _write(names, vectors, np.array([idx for idx, _ in inserted], dtype=np.int64), removed, record=False)
+
+def _write(names: list[str], vectors: np.ndarray, ids, removed: list[int], record: bool = True):
+    """
+    Adds the vectors under the names, at the given ids or new ones if None, removes the `removed` ids and publishes
+    the result. An index that cannot be trained yet is replaced by a flat one holding the vectors until it can be.
+    Inserts and deletes are recorded in `changes` unless `record` is False. The caller holds write_lock.
+    """
+    global _untrained, _staging, next_id
+    target = _untrained if _staging is index else None
+    updated, spare = _writable()
+    if names:
+        spare = spare and updated.is_trained  # the index it replaces cannot take the vectors before it is trained
+        if not train(updated, vectors):
+            target, updated = updated, faiss.IndexIDMap2(faiss.IndexFlat(updated.d, updated.metric_type))
+        elif target is None:
+            target = _configured_target(updated)
+    if ids is None:
+        ids = _new_ids(updated, len(names))
+    else:
+        _catch_up(updated)
+        next_id = max(next_id, int(ids.max()) + 1 if len(ids) else 0)
+    if names:
+        updated.add_with_ids(vectors, ids)
+        if target is not None and updated.ntotal >= min_training_points(target):
+            updated, spare, target = rebuild_into(updated, target), False, None
+            print(f"Trained the vector index on the {updated.ntotal} vectors stored so far.")
+    added = {}
+    for idx, name, vector in zip(ids.tolist(), names, vectors if names else []):
+        store[idx] = name
+        added.setdefault(name, []).append(idx)
+        if record:
+            changes.append((idx, name, vector))
+    _publish(updated, removed, added, (vectors, ids) if spare else None, record)
+    _untrained, _staging = target, index if target is not None else None
+
+def _configured_target(updated):
+    """
+    An empty index of the configured type if that needs training and `updated` is a flat index, which then holds
+    the vectors stored before there were enough to train it (e.g. the staging index of a previous run).
+    """
+    if not isinstance(faiss.downcast_index(updated.index), faiss.IndexFlat):
+        return None
+    configured = create_index(updated.d)
+    return None if configured.is_trained else configured
+
+def _new_ids(updated, count: int) -> np.ndarray:
+    """Returns `count` ids that no vector has had. The caller holds write_lock."""
+    global next_id
+    _catch_up(updated)
+    ids = np.arange(next_id, next_id + count, dtype=np.int64)
+    next_id += count
+    return ids
+
+def _catch_up(updated):
+    """Brings next_id past the ids of an index loaded since the last write, given its writable copy."""
+    global next_id
+    if index is not _numbered:
+        indexed = faiss.vector_to_array(updated.id_map)
+        next_id = max(int(indexed.max()) + 1 if indexed.size else 0, max(store, default=-1) + 1)
+
+def delete_embeddings(names: list[str]) -> int:
+    """Removes the embeddings stored under the given names. Returns how many were removed."""
+    with write_lock:
+        _index_names()
+        removed = _ids_of(set(names))
+        if removed:
+            _write([], None, np.empty(0, dtype=np.int64), removed)
+        return len(removed)
+
+def template_count() -> int:
+    """Number of templates with vectors in the store, however many chunks each has."""
+    return len(_ids_by_name()) if store is not None else 0
+
+def _ids_by_name() -> dict:
+    """Returns ids_by_name, first rebuilding it if `store` has been replaced (e.g. loaded) since it was built."""
+    if _named is not store:
+        with write_lock:
+            _index_names()
+    return ids_by_name
+
+def _index_names():
+    """Rebuilds ids_by_name if `store` has been replaced since it was built. The caller holds write_lock."""
+    global ids_by_name, _named
+    if _named is store:
+        return
+    by_name = {}
+    for idx, name in store.items():
+        by_name.setdefault(name, []).append(idx)
+    ids_by_name = {name: tuple(ids) for name, ids in by_name.items()}
+    _named = store
+
+def _ids_of(names) -> list[int]:
+    """The ids of the given names' vectors. The caller holds write_lock and has called _index_names."""
+    return [idx for name in names for idx in ids_by_name.get(name, ())]
+
+def _publish(updated, ids: list[int], added: dict[str, list[int]] = None, inserted: tuple = None,
+             record: bool = True):
+    """
+    Publishes `updated` without the given ids, and with the ids `added` under each name. The caller holds write_lock.
+    The removed ids are recorded in `changes` unless `record` is False.
+    Flat and scalar-quantized indexes drop the vectors straight away; other types keep them until the next compaction.
+    The (vectors, ids) `inserted` into `updated` are then also added to the index it replaced, which becomes the
+    spare; without them, the replaced index is not a copy of `updated` and there is no spare until the next write.
+    """
+    global index, generation, _numbered, _spare, _spare_of, _staging
+    added = added or {}
+    in_place = bool(ids) and isinstance(faiss.downcast_index(updated.index), faiss.IndexFlatCodes)
+    if in_place:
+        updated.remove_ids(np.array(ids, dtype=np.int64))
+    with _readers:
+        replaced, index = index, updated
+    if _staging is replaced:
+        _staging = index
+    generation += 1
+    for name, new_ids in added.items():
+        ids_by_name[name] = tuple(new_ids)
+    for idx in ids:
+        name = store.pop(idx)
+        if name not in added:
+            remaining = tuple(kept for kept in ids_by_name.get(name, ()) if kept != idx)
+            if remaining:
+                ids_by_name[name] = remaining
+            else:
+                ids_by_name.pop(name, None)
+        if record:
+            changes.append((idx, None, None))
+    stale = index.ntotal - len(store)
+    if stale > TOMBSTONE_COMPACT_RATIO * index.ntotal:
+        compacted = without_ids(index, [idx for idx in faiss.vector_to_array(index.id_map).tolist() if idx not in store])
+        with _readers:
+            index = compacted
+        print(f"Compacted the vector index, dropping {stale} vectors of deleted templates.")
+    _numbered = index
+    _spare = _spare_of = None
+    if inserted is None or index is not updated:
+        return
+    with _readers:
+        while _searches.get(id(replaced)):
+            _readers.wait()
+    vectors, new_ids = inserted
+    if len(new_ids):
+        replaced.add_with_ids(vectors, new_ids)
+    if in_place:
+        replaced.remove_ids(np.array(ids, dtype=np.int64))
+    _spare, _spare_of = replaced, index
+
+def _writable():
+    """
+    Returns the index a writer changes and publishes, and whether the published index can then be made a copy of it
+    to become the spare: the spare if there is one, otherwise a copy of the published index.
+    """
+    if _spare is not None and _spare_of is index:
+        return _spare, True
+    writable = make_writable(index)
+    if not isinstance(writable, faiss.IndexIDMap2):
+        return with_id_map(writable), False  # builds a new index, with ids the published one does not have
+    if writable is index:
+        return faiss.clone_index(writable), True
+    return writable, False  # an in-memory copy of a memory-mapped index, which cannot be written
+
+def drain_changes() -> list:
+    """Returns the inserts and deletes made since the last call and starts a new list."""
+    global changes
+    drained, changes = changes, []
+    return drained
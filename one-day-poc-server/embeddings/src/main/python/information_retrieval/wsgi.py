@@ -0,0 +1,9 @@
+"""
+Production entry point: gunicorn -c gunicorn.conf.py information_retrieval.wsgi:app
+
+Importing this module loads the model and the index, so each worker is warm before it accepts its first
+request; /ready reports when that is done.
+"""
+from information_retrieval.embedding_service import app, warm_up
+
+warm_up()
@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+
+from information_retrieval.vector_search.batcher import MicroBatcher
+
+
+def test_single_request_is_answered():
+    """Test that a lone request is flushed once the window closes."""
+    batcher = MicroBatcher(lambda texts: [[float(len(t))] for t in texts], window_ms=1)
+    assert batcher.embed("abc", timeout=5) == [3.0], "The embedding of the single request should be returned"
+
+
+def test_concurrent_requests_are_merged():
+    """Test that requests arriving within the window are encoded in one call."""
+    calls = []
+
+    def encode_batch(texts):
+        calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    batcher = MicroBatcher(encode_batch, window_ms=200, max_batch_size=8)
+    texts = ["a", "bb", "ccc", "dddd"]
+    results = {}
+
+    def worker(text):
+        results[text] = batcher.embed(text, timeout=5)
+
+    threads = [threading.Thread(target=worker, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1, "All concurrent requests should share a single encode call"
+    assert sorted(calls[0]) == sorted(texts), "The batch should contain every request"
+    assert all(results[text] == [float(len(text))] for text in texts), "Each request should get its own embedding"
+
+
+def test_batches_respect_max_size():
+    """Test that a batch never exceeds the configured maximum size."""
+    calls = []
+
+    def encode_batch(texts):
+        calls.append(len(texts))
+        return [[0.0] for _ in texts]
+
+    batcher = MicroBatcher(encode_batch, window_ms=50, max_batch_size=2)
+    futures = [batcher.submit(str(i)) for i in range(5)]
+    for future in futures:
+        future.result(timeout=5)
+
+    assert max(calls) <= 2, "No batch should be larger than max_batch_size"
+    assert sum(calls) == 5, "Every request should be encoded exactly once"
+
+
+def test_encoding_errors_are_propagated():
+    """Test that a failing encode call fails every request in the batch."""
+    def encode_batch(texts):
+        raise RuntimeError("model failure")
+
+    batcher = MicroBatcher(encode_batch, window_ms=1)
+    with pytest.raises(RuntimeError):
+        batcher.embed("text", timeout=5)
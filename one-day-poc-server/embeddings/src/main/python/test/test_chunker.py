@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from information_retrieval.vector_search import chunker
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """Fixture that makes chunks small enough to exercise packing and windowing."""
+    monkeypatch.setattr(chunker, "CHUNK_WORDS", 6)
+    monkeypatch.setattr(chunker, "CHUNK_OVERLAP", 2)
+    monkeypatch.setattr(chunker, "MAX_CHUNKS", 64)
+
+
+def test_fields_flatten_nested_values():
+    """Test that nested values are named by their path and @context is skipped."""
+    data = {"@context": "https://schema.org", "name": "Form", "author": {"name": "Ada"}, "keywords": ["a", "b"]}
+    assert list(chunker.fields(data)) == [("name", "Form"), ("author.name", "Ada"), ("keywords", "a"), ("keywords", "b")]
+
+
+def test_short_fields_are_packed(small_chunks):
+    """Test that consecutive fields share a chunk until it is full."""
+    data = {"name": "Login form", "category": "auth", "framework": "React"}
+    assert list(chunker.chunks(data)) == ["name: Login form\ncategory: auth", "framework: React"]
+
+
+def test_long_values_are_windowed_with_overlap(small_chunks):
+    """Test that a value longer than a chunk is split into overlapping windows, each prefixed with its path."""
+    words = [f"w{i}" for i in range(10)]
+    result = list(chunker.chunks({"description": " ".join(words)}))
+    assert result == ["description: w0 w1 w2 w3 w4 w5", "description: w4 w5 w6 w7 w8 w9"]
+
+
+def test_empty_document_yields_one_chunk(small_chunks):
+    """Test that a document without values still gets a chunk, so that it can be embedded."""
+    assert list(chunker.chunks({})) == ["{}"]
+
+
+def test_chunking_disabled(monkeypatch):
+    """Test that a CHUNK_WORDS of 0 embeds the whole document as one text."""
+    monkeypatch.setattr(chunker, "CHUNK_WORDS", 0)
+    assert list(chunker.chunks({"name": "Form"})) == ['{"name": "Form"}']
+
+
+def test_embed_documents_batches_across_documents(small_chunks, monkeypatch):
+    """Test that chunks are embedded in batches spanning documents and capped per document."""
+    batches = []
+
+    def fake_embed_batch(texts, batch_size=32):
+        batches.append(len(texts))
+        return [np.ones(3, dtype=np.float32) for _ in texts]
+
+    monkeypatch.setattr(chunker.emb, "embed_batch", fake_embed_batch)
+    monkeypatch.setattr(chunker, "MAX_CHUNKS", 2)
+    documents = [("A", {"name": "A"}), ("B", {"description": " ".join(["word"] * 30)}), ("C", {"name": "C"})]
+    names, vectors = chunker.embed_documents(documents, batch_size=3)
+
+    assert names == ["A", "B", "B", "C"], "B should be cut to MAX_CHUNKS chunks"
+    assert vectors.shape == (4, 3)
+    assert batches == [3, 1]
+
+
+def test_embed_documents_failure(monkeypatch):
+    """Test that None is returned when any chunk could not be embedded."""
+    monkeypatch.setattr(chunker.emb, "embed_batch", lambda texts, batch_size=32: [None for _ in texts])
+    assert chunker.embed_documents([("A", {"name": "A"})]) is None
@@ -0,0 +1,81 @@
+import base64
+
+import numpy as np
+import pytest
+
+from information_retrieval.vector_search.codec import decode, encode, from_bytes, to_bytes
+
+
+def unit_vector(dimension=384):
+    vector = np.random.default_rng(0).standard_normal(dimension).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_json_is_a_plain_list():
+    """Test that the default encoding keeps the embedding as a list of floats."""
+    assert encode([0.5, -0.25]) == [0.5, -0.25]
+    assert decode([0.5, -0.25]).tolist() == [0.5, -0.25]
+
+
+@pytest.mark.parametrize("encoding, tolerance, size", [
+    ("float32", 0, 4 * 384),
+    ("float16", 1e-3, 2 * 384),
+    ("int8", 1 / 254, 384),
+])
+def test_round_trip(encoding, tolerance, size):
+    """Test that each compact encoding round-trips within its precision and packs to the expected size."""
+    vector = unit_vector()
+    encoded = encode(vector, encoding)
+
+    assert isinstance(encoded, str)
+    assert len(encoded) == 4 * -(-size // 3), "base64 should take 4 characters per 3 bytes"
+    np.testing.assert_allclose(decode(encoded, encoding), vector, atol=tolerance + 1e-7)
+
+
+def test_int8_keeps_similarity_ranking():
+    """Test that int8 embeddings barely change cosine similarity between unit vectors."""
+    vectors = np.random.default_rng(1).standard_normal((50, 384)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    decoded = np.array([decode(encode(vector, "int8"), "int8") for vector in vectors])
+
+    np.testing.assert_allclose(decoded @ vectors[0], vectors @ vectors[0], atol=0.01)
+
+
+def test_unknown_encoding():
+    """Test that unknown encodings are rejected either way."""
+    with pytest.raises(ValueError):
+        encode([0.5], "float8")
+    with pytest.raises(ValueError):
+        decode("AAAA", "float8")
+
+
+def test_invalid_base64():
+    """Test that a string that is not base64 is rejected with a ValueError."""
+    with pytest.raises(ValueError):
+        decode("not base64!", "float32")
+
+
+@pytest.mark.parametrize("encoding", ["float32", "float16", "int8"])
+def test_raw_bytes_round_trip(encoding):
+    """Test that a batch packed into raw bytes unpacks into the same rows."""
+    vectors = np.stack([unit_vector(), -unit_vector()])
+    raw = to_bytes(vectors, encoding)
+
+    assert raw == b"".join(to_bytes(vector, encoding) for vector in vectors), "Rows should be packed one after the other"
+    np.testing.assert_allclose(from_bytes(raw, encoding, dimension=384), vectors, atol=1 / 254 + 1e-7)
+
+
+def test_raw_bytes_match_base64():
+    """Test that the base64 encodings are the raw bytes, so that either can be decoded from the other."""
+    vector = unit_vector()
+    assert base64.b64decode(encode(vector, "float32")) == to_bytes(vector)
+
+
+def test_raw_bytes_of_wrong_size():
+    """Test that bytes not making whole components or rows are rejected."""
+    with pytest.raises(ValueError):
+        from_bytes(b"\x00" * 6, "float32")
+    with pytest.raises(ValueError):
+        from_bytes(b"\x00" * 12, "float32", dimension=2)
+    with pytest.raises(ValueError):
+        to_bytes([0.5], "json")
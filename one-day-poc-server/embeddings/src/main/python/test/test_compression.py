@@ -0,0 +1,62 @@
+import gzip
+
+import pytest
+from flask import Flask, request
+
+from information_retrieval import compression
+
+
+@pytest.fixture
+def client():
+    """Fixture that provides a Flask app echoing request bodies behind the middleware, and compressing responses."""
+    app = Flask(__name__)
+    app.wsgi_app = compression.GzipRequests(app.wsgi_app, max_bytes=100)
+
+    @app.route("/echo", methods=["POST"])
+    def echo():
+        return request.get_data()
+
+    @app.after_request
+    def compress(response):
+        return compression.compress_response(response, request.headers.get("Accept-Encoding", ""), min_bytes=10)
+
+    return app.test_client()
+
+
+def test_inflate_limits_size():
+    """Test that a body inflating past the limit is rejected."""
+    body = gzip.compress(b"a" * 1000)
+    assert compression.inflate(body, 1000) == b"a" * 1000
+    with pytest.raises(ValueError):
+        compression.inflate(body, 999)
+
+
+def test_inflate_rejects_invalid_and_truncated_bodies():
+    """Test that bodies that are not whole gzip streams are rejected."""
+    with pytest.raises(ValueError):
+        compression.inflate(b"not gzip", 100)
+    with pytest.raises(ValueError):
+        compression.inflate(gzip.compress(b"a" * 50)[:-10], 100)
+
+
+def test_gzip_request_inflated(client):
+    """Test that the route sees the inflated body."""
+    response = client.post("/echo", data=gzip.compress(b"short"), headers={"Content-Encoding": "gzip"})
+    assert response.data == b"short"
+
+
+def test_oversized_gzip_request_rejected(client):
+    """Test that a request inflating past the limit is answered with a 400."""
+    response = client.post("/echo", data=gzip.compress(b"a" * 101), headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 400
+
+
+def test_response_compressed_only_when_accepted_and_large(client):
+    """Test that responses are compressed only for clients accepting gzip, and only past the minimum size."""
+    compressed = client.post("/echo", data=b"a" * 50, headers={"Accept-Encoding": "gzip, deflate"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed.data) == b"a" * 50
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+
+    assert "Content-Encoding" not in client.post("/echo", data=b"a" * 50).headers
+    assert "Content-Encoding" not in client.post("/echo", data=b"a", headers={"Accept-Encoding": "gzip"}).headers
@@ -1,6 +1,12 @@
+import fcntl
+
 import pytest
 import faiss
+import numpy as np
 from unittest import mock
+from information_retrieval import data_handler
+from information_retrieval.vector_search import index_factory, vector_store
+from information_retrieval.vector_search.index_factory import create_index
 from information_retrieval.data_handler import load_data, save_data, FAISS_FILE, MAPPINGS_FILE, VECTOR_DIMENSION  # Replace 'your_module'
 
 @pytest.fixture
@@ -23,7 +29,8 @@ def test_load_data_success(mock_pickle_load, mock_open, mock_faiss_read, mock_fa
 
     index, vector_store = load_data()
 
-    assert isinstance(index, faiss.IndexFlatIP), "Index should be a FAISS IndexFlatIP object"
+    assert isinstance(index, faiss.IndexIDMap2), "Index should map explicit ids"
+    assert isinstance(faiss.downcast_index(index.index), faiss.IndexFlatIP), "Index should be a FAISS IndexFlatIP object"
     assert vector_store == mock_vector_store, "Vector store should match the loaded data"
 
 @mock.patch("faiss.read_index", side_effect=Exception("FAISS Load Error"))
@@ -33,7 +40,8 @@ def test_load_data_failure(mock_pickle_load, mock_open, mock_faiss_read):
     """Test handling of missing or invalid FAISS index and mappings."""
     index, vector_store = load_data()
 
-    assert isinstance(index, faiss.IndexFlatIP), "Failed index load should create a new FAISS index"
+    assert isinstance(index, faiss.IndexIDMap2), "Index should map explicit ids"
+    assert isinstance(faiss.downcast_index(index.index), faiss.IndexFlatIP), "Failed index load should create a new FAISS index"
     assert vector_store == {}, "Failed vector store load should return an empty dictionary"
 
 @mock.patch("faiss.read_index", return_value=None)
@@ -43,7 +51,8 @@ def test_load_data_returns_none(mock_pickle_load, mock_open, mock_faiss_read):
     """Test handling when the files exist but contain None."""
     index, vector_store = load_data()
 
-    assert isinstance(index, faiss.IndexFlatIP), "If FAISS index is None, a new index should be created"
+    assert isinstance(index, faiss.IndexIDMap2), "Index should map explicit ids"
+    assert isinstance(faiss.downcast_index(index.index), faiss.IndexFlatIP), "If FAISS index is None, a new index should be created"
     assert vector_store == {}, "If the vector store is None, it should return an empty dictionary"
 
 @mock.patch("faiss.read_index", return_value=None)
@@ -53,7 +62,8 @@ def test_load_data_empty_file(mock_pickle_load, mock_open, mock_faiss_read):
     """Test handling of empty files."""
     index, vector_store = load_data()
 
-    assert isinstance(index, faiss.IndexFlatIP), "Empty FAISS file should result in a new index"
+    assert isinstance(index, faiss.IndexIDMap2), "Index should map explicit ids"
+    assert isinstance(faiss.downcast_index(index.index), faiss.IndexFlatIP), "Empty FAISS file should result in a new index"
     assert vector_store == {}, "Empty pickle file should result in an empty dictionary"
 
 @mock.patch("faiss.write_index")
@@ -67,3 +77,264 @@ def test_save_data(mock_pickle_dump, mock_open, mock_faiss_write, mock_faiss_ind
     mock_open.assert_called_once_with(MAPPINGS_FILE, "wb"), "Mapping file should be opened for writing"
     mock_pickle_dump.assert_called_once_with(mock_vector_store, mock_open()), "Vector store should be serialized"
 
+
+@pytest.fixture
+def wal_files(tmp_path, monkeypatch):
+    """Redirect all persisted files to a temporary directory and enable WAL mode."""
+    monkeypatch.setattr(data_handler, "FAISS_FILE", str(tmp_path / "faiss.index"))
+    monkeypatch.setattr(data_handler, "MAPPINGS_FILE", str(tmp_path / "mappings.pkl"))
+    monkeypatch.setattr(data_handler, "LUCENE_INDEX_DIR", str(tmp_path / "jsonld_index"))
+    monkeypatch.setattr(data_handler, "WAL_FILE", str(tmp_path / "faiss.wal"))
+    monkeypatch.setattr(data_handler, "WAL_COMPACTING_FILE", str(tmp_path / "faiss.wal.compacting"))
+    monkeypatch.setattr(data_handler, "LOCK_FILE", str(tmp_path / "faiss.lock"))
+    monkeypatch.setattr(data_handler, "PERSISTENCE_MODE", "wal")
+    monkeypatch.setattr(data_handler, "WAL_COMPACT_THRESHOLD", 1000)
+    return tmp_path
+
+
+def make_changes(start, count):
+    """Create (id, name, vector) inserts with consecutive ids."""
+    vectors = np.random.rand(count, VECTOR_DIMENSION).astype(np.float32)
+    return [(start + i, f"template_{start + i}", vectors[i]) for i in range(count)]
+
+
+def test_persist_snapshot_mode(monkeypatch, mock_faiss_index, mock_vector_store):
+    """Test that snapshot mode rewrites the whole index on persist."""
+    monkeypatch.setattr(data_handler, "PERSISTENCE_MODE", "snapshot")
+    with mock.patch.object(data_handler, "save_data") as mock_save:
+        data_handler.persist(mock_faiss_index, mock_vector_store, [])
+    mock_save.assert_called_once_with(mock_faiss_index, mock_vector_store)
+
+
+def test_wal_append_and_replay(wal_files):
+    """Test that logged inserts are recovered when no snapshot exists."""
+    changes = make_changes(0, 3)
+    index = faiss.IndexFlatIP(VECTOR_DIMENSION)
+    for _, _, vector in changes:
+        index.add(vector.reshape(1, -1))
+    data_handler.persist(index, {}, changes)
+
+    assert not (wal_files / "faiss.index").exists(), "WAL mode should not rewrite the snapshot on insert"
+    loaded_index, loaded_store = load_data()
+    assert loaded_index.ntotal == 3, "All logged vectors should be replayed"
+    assert loaded_store == {0: "template_0", 1: "template_1", 2: "template_2"}
+    assert np.allclose(loaded_index.reconstruct(1), changes[1][2]), "Vectors should survive the round trip"
+
+
+def test_wal_replays_deletes(wal_files):
+    """Test that a logged delete removes the template from both the mappings and the index on replay."""
+    data_handler.append_to_log(make_changes(0, 3))
+    data_handler.append_to_log([(1, None, None)])
+
+    loaded_index, loaded_store = load_data()
+    assert loaded_store == {0: "template_0", 2: "template_2"}
+    assert loaded_index.ntotal == 2, "The deleted vector should not be replayed into the index"
+    assert sorted(faiss.vector_to_array(loaded_index.id_map)) == [0, 2]
+
+
+def test_wal_replays_reinserted_id(wal_files):
+    """Test that an id deleted and then inserted again in the log ends up with its latest vector and name."""
+    changes = make_changes(0, 3)
+    data_handler.append_to_log(changes)
+    data_handler.append_to_log([(2, None, None)])
+    replacement = np.random.rand(VECTOR_DIMENSION).astype(np.float32)
+    data_handler.append_to_log([(2, "new", replacement)])
+
+    loaded_index, loaded_store = load_data()
+    assert loaded_store == {0: "template_0", 1: "template_1", 2: "new"}
+    assert sorted(faiss.vector_to_array(loaded_index.id_map)) == [0, 1, 2]
+    assert np.allclose(loaded_index.reconstruct(2), replacement), "The replacement vector should be indexed"
+
+
+def test_wal_round_trip_after_deleting_highest_id(wal_files):
+    """Test that a template stored after the highest one was deleted survives a restart with its vector."""
+    vectors = np.random.default_rng(0).standard_normal((4, VECTOR_DIMENSION)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    vector_store.index, vector_store.store = load_data()
+    vector_store.drain_changes()  # left by other tests
+    vector_store.store_embeddings(["a", "b", "c"], vectors[:3])
+    vector_store.delete_embeddings(["c"])
+    vector_store.store_embedding("new", vectors[3])
+    data_handler.persist(vector_store.index, vector_store.store, vector_store.drain_changes())
+
+    vector_store.index, vector_store.store = load_data()
+    assert sorted(vector_store.store.values()) == ["a", "b", "new"]
+    assert sorted(faiss.vector_to_array(vector_store.index.id_map)) == sorted(vector_store.store)
+    assert vector_store.semantic_search(vectors[3], 1) == ["new"]
+
+
+def test_wal_replayed_into_flat_index_until_trainable(wal_files, monkeypatch):
+    """Test that logged inserts too few to train the configured IVF index are replayed into a flat one."""
+    monkeypatch.setattr(index_factory, "INDEX_TYPE", "ivf_flat")
+    data_handler.append_to_log(make_changes(0, 3))
+
+    index, store = load_data()
+    assert index.ntotal == 3 and isinstance(faiss.downcast_index(index.index), faiss.IndexFlat)
+    assert sorted(store) == [0, 1, 2]
+
+
+def test_wal_torn_tail_is_truncated(wal_files):
+    """Test that a partially written record is dropped and the log stays appendable."""
+    data_handler.append_to_log(make_changes(0, 2))
+    log = wal_files / "faiss.wal"
+    with open(log, "ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    index, store = load_data()
+    assert index.ntotal == 2 and len(store) == 2, "Only complete records should be replayed"
+
+    data_handler.append_to_log(make_changes(2, 1))
+    index, store = load_data()
+    assert index.ntotal == 3, "Records appended after recovery should be readable"
+
+
+def test_read_log_since(wal_files):
+    """Test that only records appended after a position are read, and that a replaced or cut log is reported."""
+    data_handler.append_to_log(make_changes(0, 2))
+    position = data_handler.log_position()
+    data_handler.append_to_log(make_changes(2, 2) + [(0, None, None)])
+
+    records, position = data_handler.read_log_since(position)
+    assert [(idx, name) for idx, name, _ in records] == [(2, "template_2"), (3, "template_3"), (0, None)]
+    assert data_handler.read_log_since(position) == ([], position), "Nothing has been appended since"
+
+    with open(wal_files / "faiss.wal", "r+b") as f:
+        f.truncate(10)
+    assert data_handler.read_log_since(position) is None, "A log cut short must be loaded again"
+
+    (wal_files / "faiss.wal").rename(wal_files / "faiss.wal.compacting")
+    data_handler.append_to_log(make_changes(4, 1))
+    assert data_handler.read_log_since(position) is None, "A log set aside for compaction must be loaded again"
+    assert data_handler.read_log_since(None) is None
+
+
+def test_wal_compaction(wal_files):
+    """Test that compaction writes a snapshot and removes the log."""
+    changes = make_changes(0, 4)
+    index = faiss.IndexFlatIP(VECTOR_DIMENSION)
+    store = {}
+    for idx, name, vector in changes:
+        index.add(vector.reshape(1, -1))
+        store[idx] = name
+    data_handler.append_to_log(changes)
+
+    data_handler.compact(index, store, background=False)
+
+    assert not (wal_files / "faiss.wal").exists() and not (wal_files / "faiss.wal.compacting").exists()
+    loaded_index, loaded_store = load_data()
+    assert loaded_index.ntotal == 4 and loaded_store == store, "The snapshot should hold every insert"
+
+
+def test_wal_compaction_triggered_by_threshold(wal_files, monkeypatch):
+    """Test that persist compacts once the log reaches the threshold."""
+    monkeypatch.setattr(data_handler, "WAL_COMPACT_THRESHOLD", 2)
+    with mock.patch.object(data_handler, "compact") as mock_compact:
+        data_handler.persist(None, {}, make_changes(0, 1))
+        mock_compact.assert_not_called()
+        data_handler.persist(None, {}, make_changes(1, 1))
+        mock_compact.assert_called_once()
+
+
+def test_wal_replay_is_idempotent(wal_files):
+    """Test that records already in the snapshot index are not added twice."""
+    changes = make_changes(0, 3)
+    index = faiss.IndexFlatIP(VECTOR_DIMENSION)
+    for _, _, vector in changes:
+        index.add(vector.reshape(1, -1))
+    # Simulate a crash after the index was replaced but before the mappings and the log were cleaned up.
+    faiss.write_index(index, data_handler.FAISS_FILE)
+    data_handler.append_to_log(changes)
+
+    loaded_index, loaded_store = load_data()
+    assert loaded_index.ntotal == 3, "Vectors already in the snapshot should not be duplicated"
+    assert len(loaded_store) == 3, "Missing mappings should be restored from the log"
+
+
+def test_mmap_mode_round_trip(wal_files, monkeypatch):
+    """Test that mmap mode persists a name table and loads it back without a pickle."""
+    monkeypatch.setattr(data_handler, "NAMES_FILE", str(wal_files / "mappings.names"))
+    monkeypatch.setattr(data_handler, "INDEX_MMAP", True)
+    vectors = np.random.rand(3, VECTOR_DIMENSION).astype(np.float32)
+    index = faiss.IndexFlatIP(VECTOR_DIMENSION)
+    index.add(vectors)
+    save_data(index, {0: "a", 1: "b", 2: "c"})
+
+    assert not (wal_files / "mappings.pkl").exists(), "Mappings should not be pickled in mmap mode"
+    loaded_index, loaded_store = load_data()
+    assert isinstance(loaded_store, data_handler.NameTable), "Mappings should be memory-mapped"
+    assert loaded_index.ntotal == 3 and dict(loaded_store) == {0: "a", 1: "b", 2: "c"}
+
+
+def test_make_writable_copies_mapped_index(wal_files, monkeypatch):
+    """Test that a memory-mapped index is swapped for an in-memory copy before the first insert."""
+    monkeypatch.setattr(data_handler, "NAMES_FILE", str(wal_files / "mappings.names"))
+    monkeypatch.setattr(data_handler, "INDEX_MMAP", True)
+    index = create_index(VECTOR_DIMENSION, "flat")
+    index.add_with_ids(np.random.rand(2, VECTOR_DIMENSION).astype(np.float32), np.arange(2))
+    save_data(index, {0: "a", 1: "b"})
+
+    mapped, _ = load_data()
+    writable = data_handler.make_writable(mapped)
+    assert writable is not mapped, "A mapped index should be replaced by a copy"
+    writable.add_with_ids(np.random.rand(1, VECTOR_DIMENSION).astype(np.float32), np.array([2]))
+    assert writable.ntotal == 3
+    assert data_handler.make_writable(writable) is writable, "An in-memory index should be returned as is"
+
+
+def test_data_version_changes_on_write(wal_files):
+    """Test that writing to the persisted files changes the data version other processes compare against."""
+    before = data_handler.data_version()
+    data_handler.append_to_log(make_changes(0, 1))
+
+    assert data_handler.data_version() != before
+    assert data_handler.data_version() == data_handler.data_version()
+
+
+def test_data_lock_is_exclusive_across_open_files(wal_files):
+    """Test that a writer's lock keeps other holders of the lock file (other processes) out until released."""
+    with data_handler.data_lock(exclusive=True):
+        with open(data_handler.LOCK_FILE) as other:
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(other, fcntl.LOCK_SH | fcntl.LOCK_NB)
+
+    with open(data_handler.LOCK_FILE) as other:
+        fcntl.flock(other, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        fcntl.flock(other, fcntl.LOCK_UN)
+
+
+def test_background_compaction_waits_for_data_lock(wal_files):
+    """Test that a background compaction only writes its snapshot once it holds the data lock."""
+    changes = make_changes(0, 2)
+    index = faiss.IndexFlatIP(VECTOR_DIMENSION)
+    store = {}
+    for idx, name, vector in changes:
+        index.add(vector.reshape(1, -1))
+        store[idx] = name
+    data_handler.append_to_log(changes)
+
+    with data_handler.data_lock(exclusive=True):
+        data_handler.compact(index, store)
+        data_handler._compaction.join(timeout=0.2)
+        assert data_handler._compaction.is_alive(), "The compaction should wait for the lock"
+        assert not (wal_files / "faiss.index").exists()
+    data_handler._compaction.join(timeout=5)
+
+    assert (wal_files / "faiss.index").exists() and not (wal_files / "faiss.wal.compacting").exists()
+
+
+def test_background_compaction_gives_up_after_newer_snapshot(wal_files):
+    """Test that a background compaction does not overwrite a snapshot another process wrote in the meantime."""
+    index = faiss.IndexFlatIP(VECTOR_DIMENSION)
+    data_handler.append_to_log(make_changes(0, 1))
+
+    with data_handler.data_lock(exclusive=True):
+        data_handler.compact(index, {})
+        # Another process compacts meanwhile, folding in records this one has not seen.
+        newer = create_index(VECTOR_DIMENSION, "flat")
+        newer.add_with_ids(np.random.rand(3, VECTOR_DIMENSION).astype(np.float32), np.array([1, 2, 3]))
+        data_handler.write_snapshot(newer, {1: "a", 2: "b", 3: "c"})
+    data_handler._compaction.join(timeout=5)
+
+    loaded_index, loaded_store = load_data()
+    assert loaded_store == {0: "template_0", 1: "a", 2: "b", 3: "c"}, "The newer snapshot should be kept"
+    assert (wal_files / "faiss.wal.compacting").exists(), "The set-aside log should be kept for the next compaction"
@@ -1,16 +1,22 @@
+import os
+from types import SimpleNamespace
+
 import pytest
 import numpy as np
-from information_retrieval.vector_search.embedder import embed, normalize
+import information_retrieval.vector_search.embedder as embedder
+from information_retrieval.vector_search.embedder import embed, embed_batch, normalize
+from information_retrieval.vector_search.embedding_cache import EmbeddingCache
 
 
 def test_embed_valid_text():
-    """Test that embedding a valid text returns a non-empty list."""
+    """Test that embedding a valid text returns a unit-norm float32 vector."""
     text = "Hello, this is a test."
     embedding = embed(text)
 
     assert embedding is not None, "Embedding function should return a non-null value"
-    assert isinstance(embedding, list), "Embedding should be returned as a list"
-    assert all(isinstance(value, float) for value in embedding), "All elements should be floats"
+    assert isinstance(embedding, np.ndarray), "Embedding should be returned as an array"
+    assert embedding.dtype == np.float32 and embedding.ndim == 1, "Embedding should be a float32 vector"
+    assert np.isclose(np.linalg.norm(embedding), 1.0, atol=1e-5), "Embedding should have a unit norm"
 
 
 def test_embed_empty_string():
@@ -19,8 +25,8 @@ def test_embed_empty_string():
     embedding = embed(text)
 
     assert embedding is not None, "Embedding should return a value even for an empty string"
-    assert isinstance(embedding, list), "Embedding should be a list"
-    assert all(isinstance(value, float) for value in embedding), "All elements should be floats"
+    assert isinstance(embedding, np.ndarray), "Embedding should be an array"
+    assert embedding.dtype == np.float32, "All elements should be float32"
 
 
 def test_embed_invalid_input():
@@ -30,12 +36,148 @@ def test_embed_invalid_input():
     assert embed(["list", "of", "words"]) is None, "Embedding a list should return None"
 
 
+def test_embed_batch_matches_single_embeddings():
+    """Test that batched embeddings match embedding each text on its own."""
+    texts = ["Hello, this is a test.", "A responsive login form"]
+    embeddings = embed_batch(texts, batch_size=2)
+
+    assert len(embeddings) == len(texts), "There should be one embedding per text"
+    for text, embedding in zip(texts, embeddings):
+        assert np.allclose(embedding, embed(text), atol=1e-5), "Batched and single embeddings should agree"
+
+
+def test_embed_batch_invalid_entries():
+    """Test that non-string entries map to None while valid ones are embedded."""
+    embeddings = embed_batch(["valid text", 123])
+
+    assert isinstance(embeddings[0], np.ndarray), "Valid entries should be embedded"
+    assert embeddings[1] is None, "Invalid entries should map to None"
+    assert embed_batch("not a list") is None, "A non-list input should return None"
+
+
+def test_embed_uses_cache(monkeypatch):
+    """Test that a repeated prompt is answered from the cache without re-encoding."""
+    monkeypatch.setattr(embedder, "cache", EmbeddingCache(max_entries=8))
+    first = embed("Hello, this is a test.")
+    monkeypatch.setattr(embedder.get_model(), "encode", lambda *args, **kwargs: pytest.fail("Cached text was re-encoded"))
+
+    assert embed("Hello,  this is a test.") is first
+    assert embed_batch(["Hello, this is a test."])[0] is first
+    assert embedder.cache.stats()["hits"] == 2
+
+
+def test_lowercases_follows_tokenizer():
+    """Test that only models whose tokenizer lower-cases their input are treated as uncased."""
+    assert embedder.lowercases(SimpleNamespace(tokenizer=SimpleNamespace(do_lower_case=True)))
+    assert not embedder.lowercases(SimpleNamespace(tokenizer=SimpleNamespace(do_lower_case=False)))
+    assert not embedder.lowercases(SimpleNamespace(tokenizer=SimpleNamespace()))
+
+
+def test_save_cache_writes_configured_file(monkeypatch, tmp_path):
+    """Test that the cache is persisted only when a cache file is configured."""
+    path = tmp_path / "embeddings.cache"
+    monkeypatch.setattr(embedder, "cache", EmbeddingCache(max_entries=8))
+    embedder.cache.put("prompt", [1.0, 0.0])
+
+    monkeypatch.setattr(embedder, "EMBED_CACHE_FILE", None)
+    embedder.save_cache()
+    assert not path.exists()
+
+    monkeypatch.setattr(embedder, "EMBED_CACHE_FILE", str(path))
+    embedder.save_cache()
+    assert path.exists()
+
+
+def test_embeddings_are_read_only():
+    """Test that returned embeddings, which the cache shares between callers, cannot be modified."""
+    embedding = embed("A responsive login form")
+    with pytest.raises(ValueError):
+        embedding[0] = 0.0
+    assert not embed_batch(["A pricing table"])[0].flags.writeable
+
+
+def test_embed_batch_rows_share_one_matrix(monkeypatch):
+    """Test that a batch is normalised as one matrix and its rows are returned without copying."""
+    monkeypatch.setattr(embedder, "cache", EmbeddingCache(max_entries=0))
+    first, second = embed_batch(["A login form", "A dashboard"])
+
+    assert first.base is not None and first.base is second.base, "Rows should be views of the same batch"
+
+
+def test_normalize_matrix_rows():
+    """Test that every row of a matrix is normalised independently and zero rows are kept."""
+    normalized = normalize(np.array([[3.0, 4.0], [0.0, 0.0], [-1.0, 0.0]]))
+
+    assert normalized.dtype == np.float32
+    np.testing.assert_allclose(normalized, [[0.6, 0.8], [0.0, 0.0], [-1.0, 0.0]], rtol=1e-6)
+
+
+def test_model_is_loaded_once_on_first_use(monkeypatch):
+    """Test that the model is not loaded until it is needed, and then only once."""
+    loads = []
+    monkeypatch.setattr(embedder, "model", None)
+    monkeypatch.setattr(embedder, "load_model", lambda: loads.append(1) or "model")
+
+    assert embedder.get_model() == "model"
+    assert embedder.get_model() == "model"
+    assert len(loads) == 1
+
+
+def test_model_is_saved_to_and_loaded_from_local_dir(monkeypatch, tmp_path):
+    """Test that the model is saved to EMBED_MODEL_DIR on first load and loaded from there afterwards."""
+    loaded_from = []
+
+    class FakeSentenceTransformer:
+        def __init__(self, name_or_path):
+            loaded_from.append(name_or_path)
+
+        def save(self, path):
+            os.makedirs(path)
+
+    model_dir = str(tmp_path / "model")
+    monkeypatch.setattr("sentence_transformers.SentenceTransformer", FakeSentenceTransformer)
+    monkeypatch.setattr(embedder, "EMBED_MODEL_DIR", model_dir)
+
+    embedder.load_model()
+    embedder.load_model()
+    assert loaded_from == [embedder.EMBED_MODEL, model_dir]
+    assert os.listdir(tmp_path) == ["model"], "The temporary copy should have been renamed into place"
+
+
+# Lowest cosine similarity to the PyTorch embedding that each alternative backend must reach on every prompt.
+PARITY_THRESHOLDS = {"onnx": 0.999, "int8": 0.98}
+PARITY_PROMPTS = [
+    "A responsive login form with OAuth buttons",
+    "Dashboard showing monthly expenses as a bar chart",
+    "A chat window with live updates and dark mode",
+    '{"@context": "https://schema.org", "@type": "WebPage", "name": "Pricing table"}',
+]
+
+
+@pytest.mark.parametrize("backend", ["onnx", "int8"])
+def test_backend_parity(backend):
+    """Test that the ONNX and int8 backends embed prompts almost exactly as PyTorch does."""
+    if backend == "onnx":
+        pytest.importorskip("optimum.onnxruntime", reason="the onnx backend needs optimum[onnxruntime]")
+    reference = normalize(embedder.load_model("torch").encode(PARITY_PROMPTS))
+    candidate = normalize(embedder.load_model(backend).encode(PARITY_PROMPTS))
+
+    similarities = np.sum(reference * candidate, axis=1)
+    assert similarities.min() >= PARITY_THRESHOLDS[backend], f"Cosine similarities to PyTorch: {similarities}"
+
+
+def test_unknown_backend():
+    """Test that an unknown backend is rejected."""
+    with pytest.raises(ValueError):
+        embedder.load_model("tensorrt")
+
+
 def test_normalize_valid_vector():
     """Test normalization of a valid vector."""
     vector = [3.0, 4.0]
     normalized = normalize(vector)
 
-    assert isinstance(normalized, list), "Normalized output should be a list"
+    assert isinstance(normalized, np.ndarray), "Normalized output should be an array"
     assert len(normalized) == len(vector), "Normalized vector should have the same length"
     assert np.isclose(np.linalg.norm(normalized), 1.0), "Normalized vector should have a unit norm"
 
@@ -45,7 +187,7 @@ def test_normalize_zero_vector():
     vector = [0.0, 0.0, 0.0]
     normalized = normalize(vector)
 
-    assert isinstance(normalized, list), "Output should be a list"
+    assert isinstance(normalized, np.ndarray), "Output should be an array"
     assert np.allclose(normalized, vector), "Zero vector should remain unchanged"
 
 
@@ -54,7 +196,7 @@ def test_normalize_negative_values():
     vector = [-1.0, -2.0, -3.0]
     normalized = normalize(vector)
 
-    assert isinstance(normalized, list), "Output should be a list"
+    assert isinstance(normalized, np.ndarray), "Output should be an array"
     assert np.isclose(np.linalg.norm(normalized), 1.0), "Normalized vector should have a unit norm"
 
 
@@ -63,7 +205,7 @@ def test_normalize_large_values():
     vector = [1e6, 2e6, 3e6]
     normalized = normalize(vector)
 
-    assert isinstance(normalized, list), "Output should be a list"
+    assert isinstance(normalized, np.ndarray), "Output should be an array"
     assert np.isclose(np.linalg.norm(normalized), 1.0), "Normalized vector should have a unit norm"
 
 
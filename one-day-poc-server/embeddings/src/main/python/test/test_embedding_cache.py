@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from information_retrieval.vector_search.embedding_cache import EmbeddingCache, cache_key
+
+
+def test_cache_key_normalizes_case_and_whitespace():
+    """Test that texts differing only in whitespace share a key, and only share one across case for uncased models."""
+    assert cache_key("  a login   form\n") == cache_key("a login form")
+    assert cache_key("A login Form") != cache_key("a login form"), "A cased model may embed these differently"
+    assert cache_key("  A login   Form\n", lowercase=True) == cache_key("a login form", lowercase=True)
+    assert cache_key("a login form") != cache_key("a signup form")
+
+
+def test_get_counts_hits_and_misses():
+    """Test that lookups are counted and a hit returns the cached embedding."""
+    cache = EmbeddingCache(max_entries=2, lowercase=True)
+    assert cache.get("prompt") is None
+    cache.put("prompt", [0.6, 0.8])
+
+    assert cache.get("Prompt ").tolist() == pytest.approx([0.6, 0.8])
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_cached_embeddings_are_read_only():
+    """Test that the cached embedding is shared without copying but cannot be modified through it."""
+    cache = EmbeddingCache()
+    embedding = np.array([0.6, 0.8], dtype=np.float32)
+    cache.put("prompt", embedding)
+    embedding[0] = 0.0
+
+    cached = cache.get("prompt")
+    assert cached is cache.get("prompt"), "Hits should not copy the embedding"
+    assert cached.tolist() == pytest.approx([0.6, 0.8]), "Changing the stored array should not change the cache"
+    with pytest.raises(ValueError):
+        cached[0] = 0.0
+
+
+def test_put_evicts_least_recently_used():
+    """Test that the least recently used entry is evicted once the cache is full."""
+    cache = EmbeddingCache(max_entries=2)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    cache.get("a")
+    cache.put("c", [3.0])
+
+    assert cache.get("b") is None
+    assert cache.get("a").tolist() == [1.0]
+    assert cache.get("c").tolist() == [3.0]
+
+
+def test_zero_size_disables_cache():
+    """Test that a cache with no capacity never stores anything."""
+    cache = EmbeddingCache(max_entries=0)
+    cache.put("a", [1.0])
+
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_save_and_load_round_trip(tmp_path):
+    """Test that a saved cache restores its entries and LRU order."""
+    path = str(tmp_path / "embeddings.cache")
+    cache = EmbeddingCache(max_entries=3)
+    cache.put("a", [1.0, 0.0])
+    cache.put("b", [0.0, 1.0])
+    cache.get("a")
+    cache.save(path)
+
+    restored = EmbeddingCache(max_entries=3)
+    assert restored.load(path)
+    assert restored.get("a").tolist() == [1.0, 0.0]
+    restored.put("c", [0.5, 0.5])
+    restored.put("d", [0.1, 0.1])
+    assert restored.get("b") is None, "The least recently used entry should be evicted first after loading"
+
+
+def test_load_missing_or_corrupt_file(tmp_path):
+    """Test that a missing or unreadable cache file is ignored."""
+    cache = EmbeddingCache()
+    assert not cache.load(str(tmp_path / "missing.cache"))
+
+    corrupt = tmp_path / "corrupt.cache"
+    corrupt.write_bytes(b"not a cache")
+    assert not cache.load(str(corrupt))
+
+
+def test_load_ignores_file_of_another_model(tmp_path):
+    """Test that a cache saved for another model is not loaded, and that an uncased cache stays uncased."""
+    path = str(tmp_path / "embeddings.cache")
+    cache = EmbeddingCache(namespace="all-MiniLM-L6-v2:torch", lowercase=True)
+    cache.put("Prompt", [0.6, 0.8])
+    cache.save(path)
+
+    other = EmbeddingCache(namespace="all-mpnet-base-v2:torch")
+    assert not other.load(path)
+    assert other.stats()["entries"] == 0
+
+    same = EmbeddingCache(namespace="all-MiniLM-L6-v2:torch")
+    assert same.load(path)
+    assert same.get("prompt").tolist() == pytest.approx([0.6, 0.8])
@@ -1,19 +1,31 @@
+import fcntl
+import gzip
+import json
+import threading
+
+import numpy as np
 import pytest
+from unittest import mock
 
 import information_retrieval.embedding_service
 from information_retrieval.embedding_service import app
 import information_retrieval.embedding_service as es
 import information_retrieval.data_handler as dh
+from information_retrieval.result_cache import ResultCache
+from information_retrieval.vector_search import codec
+from information_retrieval.vector_search.embedding_cache import EmbeddingCache
 
 @pytest.fixture
-def client(monkeypatch):
+def client(monkeypatch, tmp_path):
     """
     Creates a Flask test client and patches certain functions so that
     the 'before_request' hook and other external dependencies don't
     interfere with tests.
     """
     monkeypatch.setattr(es, "first_request", True)
+    monkeypatch.setattr(es, "search_cache", ResultCache(max_entries=16))
     monkeypatch.setattr(dh, "load_data", lambda: (None, None))
+    monkeypatch.setattr(dh, "LOCK_FILE", str(tmp_path / "faiss.lock"))
     app.config["TESTING"] = True
     return app.test_client()
 
@@ -44,7 +56,7 @@ def test_embed_fail(client, monkeypatch):
     """
     Test the /embed route with an error response.
     """
-    monkeypatch.setattr(information_retrieval.embedding_service.emb, "embed", lambda text: [])
+    monkeypatch.setattr(information_retrieval.embedding_service.emb, "embed", lambda text: None)
 
     payload = {"text": "test prompt"}
     response = client.post("/embed", json=payload)
@@ -54,6 +66,57 @@ def test_embed_fail(client, monkeypatch):
     assert data["message"] == "Error embedding: test prompt"
 
 
+def test_embed_uses_batcher(client, monkeypatch):
+    """
+    Test the /embed route when a micro-batching window is configured.
+    """
+    monkeypatch.setattr(information_retrieval.embedding_service.emb, "embed_batch",
+                        lambda texts, batch_size=32: [[0.1, 0.2, 0.3] for _ in texts])
+    monkeypatch.setattr(es, "batcher", es.MicroBatcher(
+        lambda texts: es.emb.embed_batch(texts), window_ms=1))
+
+    response = client.post("/embed", json={"text": "test prompt"})
+    data = response.get_json()
+    assert data["status"] == "success"
+    assert data["embedding"] == [0.1, 0.2, 0.3]
+
+
+def test_embed_batch_no_texts(client):
+    """
+    Test the /embed/batch route with no "texts" list in the payload.
+    """
+    response = client.post("/embed/batch", json={"texts": "not a list"})
+    data = response.get_json()
+    assert data["status"] == "error"
+    assert data["message"] == "No prompts provided"
+
+
+def test_embed_batch_success(client, monkeypatch):
+    """
+    Test the /embed/batch route returns one embedding per input text.
+    """
+    monkeypatch.setattr(information_retrieval.embedding_service.emb, "embed_batch",
+                        lambda texts, batch_size=32: [[float(i)] for i, _ in enumerate(texts)])
+
+    response = client.post("/embed/batch", json={"texts": ["first", "second"]})
+    data = response.get_json()
+    assert data["status"] == "success"
+    assert data["embeddings"] == [[0.0], [1.0]]
+
+
+def test_embed_batch_partial_failure(client, monkeypatch):
+    """
+    Test the /embed/batch route reports which inputs could not be embedded.
+    """
+    monkeypatch.setattr(information_retrieval.embedding_service.emb, "embed_batch",
+                        lambda texts, batch_size=32: [[0.1], None])
+
+    response = client.post("/embed/batch", json={"texts": ["first", 2]})
+    data = response.get_json()
+    assert data["status"] == "error"
+    assert data["message"] == "Error embedding prompts at positions: [1]"
+
+
 def test_new_no_text(client):
     """
     Test the /new route when "text" is missing from the payload.
@@ -68,41 +131,40 @@ def test_new_no_text(client):
 def test_new_success(client, monkeypatch):
     """
     Test the /new route when everything works as expected:
-    - embed() returns a valid vector
-    - vector_store.store_embedding() returns True
+    - every chunk of the annotation is embedded
+    - vector_store.store_chunk_embeddings() returns True
     - pyserini_indexer.store_jsonld() returns True
     """
-    def fake_embed(text):
-        return [0.1, 0.2, 0.3]
-
-    monkeypatch.setattr(information_retrieval.embedding_service.emb, "embed", fake_embed)
+    stored = {}
+    monkeypatch.setattr(information_retrieval.embedding_service.emb, "embed_batch",
+                        lambda texts, batch_size=32: [np.ones(3, dtype=np.float32) for _ in texts])
     monkeypatch.setattr(information_retrieval.embedding_service.vs,
-                        "store_embedding", lambda name, vector: True)
+                        "store_chunk_embeddings", lambda names, vectors: stored.setdefault("names", names) and True)
     monkeypatch.setattr(information_retrieval.embedding_service.pi,
                         "store_jsonld", lambda name, jsonld: True)
-
+    monkeypatch.setattr(information_retrieval.embedding_service, "persist", lambda index, store, changes: None)
+    monkeypatch.setattr(information_retrieval.embedding_service.chunker, "CHUNK_WORDS", 4)
 
     payload = {
-        "text": {"name": "LoginForm", "description": "desc"},
+        "text": {"name": "LoginForm", "description": "A login form with OAuth and dark mode"},
         "name": "LoginForm"
     }
     response = client.post("/new", json=payload)
     data = response.get_json()
     assert data["status"] == "success"
     assert data["message"] == "New template stored successfully!"
+    assert len(stored["names"]) > 1 and set(stored["names"]) == {"LoginForm"}
 
 
 def test_new_vector_failure(client, monkeypatch):
     """
-    Test the /new route when vector_store.store_embedding() fails
+    Test the /new route when vector_store.store_chunk_embeddings() fails
     but pyserini_indexer.store_jsonld() succeeds.
     """
-    def fake_embed(text):
-        return [0.1, 0.2, 0.3]
-
-    monkeypatch.setattr(information_retrieval.embedding_service.emb, "embed", fake_embed)
+    monkeypatch.setattr(information_retrieval.embedding_service.emb, "embed_batch",
+                        lambda texts, batch_size=32: [np.ones(3, dtype=np.float32) for _ in texts])
     monkeypatch.setattr(information_retrieval.embedding_service.vs,
-                        "store_embedding", lambda name, vector: False)
+                        "store_chunk_embeddings", lambda names, vectors: False)
     monkeypatch.setattr(information_retrieval.embedding_service.pi,
                         "store_jsonld", lambda name, jsonld: True)
 
@@ -116,6 +178,167 @@ def test_new_vector_failure(client, monkeypatch):
     assert data["message"] == "Failed to store template: Vector DB: False, Keyword DB: True"
 
 
+def test_new_invalid_annotation(client):
+    """
+    Test the /new route rejects an annotation that is not a JSON object.
+    """
+    data = client.post("/new", json={"text": "[1, 2]", "name": "LoginForm"}).get_json()
+    assert data["status"] == "error"
+    assert data["message"] == "The template annotation is not a JSON object"
+
+
+def test_new_async_queues_template(client, monkeypatch):
+    """
+    Test that an asynchronous /new answers with a job, which is done once the template has been indexed.
+    """
+    indexed = []
+
+    def ingest_batch(records):
+        indexed.extend(records)
+        return [name for name, _ in records], []
+
+    monkeypatch.setattr(es, "ingest_queue", es.IngestQueue(ingest_batch, window_ms=0))
+
+    response = client.post("/new", json={"text": {"name": "LoginForm"}, "name": "LoginForm", "async": True})
+    assert response.status_code == 202
+    job = response.get_json()["job"]
+    assert es.ingest_queue.join(timeout=5)
+
+    data = client.get(f"/jobs/{job}").get_json()
+    assert data["job"]["status"] == "done" and data["job"]["name"] == "LoginForm"
+    assert indexed == [("LoginForm", {"name": "LoginForm"})]
+
+
+def test_queued_templates_embedded_outside_data_lock(client, monkeypatch):
+    """
+    Test that the ingest queue embeds a batch without holding the data lock, and stores it while holding it.
+    """
+    def lock_is_free():
+        with open(dh.LOCK_FILE, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            fcntl.flock(f, fcntl.LOCK_UN)
+            return True
+
+    seen = {}
+
+    def fake_embed_batch(texts, batch_size=32):
+        seen["embedding"] = lock_is_free()
+        return [np.ones(3, dtype=np.float32) for _ in texts]
+
+    def fake_store_chunk_embeddings(names, vectors):
+        seen["storing"] = lock_is_free()
+        return True
+
+    monkeypatch.setattr(es.ingest.chunker.emb, "embed_batch", fake_embed_batch)
+    monkeypatch.setattr(es.vs, "store_chunk_embeddings", fake_store_chunk_embeddings)
+    monkeypatch.setattr(es.pi, "store_jsonld_batch", lambda documents: True)
+    monkeypatch.setattr(es.ingest, "persist", lambda index, store, changes: None)
+
+    assert es.ingest_queued([("A", {"name": "A"})]) == (["A"], [])
+    assert seen == {"embedding": True, "storing": False}
+
+
+def test_new_async_queue_full(client, monkeypatch):
+    """
+    Test that an asynchronous /new is turned away with a 503 while the queue is full.
+    """
+    monkeypatch.setattr(es, "ingest_queue", es.IngestQueue(lambda records: ([], []), max_pending=0))
+    response = client.post("/new", json={"text": {"name": "LoginForm"}, "name": "LoginForm", "async": True})
+    assert response.status_code == 503
+    assert response.get_json()["status"] == "error"
+
+
+def test_unknown_job(client):
+    """
+    Test that polling a job this process does not know is answered with a 404.
+    """
+    response = client.get("/jobs/missing")
+    assert response.status_code == 404
+    assert response.get_json()["status"] == "error"
+
+
+def test_new_batch_no_templates(client):
+    """
+    Test the /new/batch route when no templates are provided.
+    """
+    response = client.post("/new/batch", json={"templates": []})
+    data = response.get_json()
+    assert data["status"] == "error"
+    assert data["message"] == "No templates provided"
+
+
+def test_new_batch_missing_fields(client):
+    """
+    Test the /new/batch route when a template lacks a name or text.
+    """
+    response = client.post("/new/batch", json={"templates": [{"name": "LoginForm"}]})
+    data = response.get_json()
+    assert data["status"] == "error"
+    assert data["message"] == "Every template needs a name and a text"
+
+
+def test_new_batch_success(client, monkeypatch):
+    """
+    Test the /new/batch route embeds every template in one call, and stores them while holding the data lock.
+    """
+    received, stored = [], []
+
+    def fake_embed_records(records, batch_size=32):
+        received.extend(records)
+        return [(name, {}) for name, _ in received], "embeddings", []
+
+    def fake_store_embedded(documents, embedded):
+        stored.append((documents, embedded))
+        return [name for name, _ in documents], []
+
+    monkeypatch.setattr(es.ingest, "embed_records", fake_embed_records)
+    monkeypatch.setattr(es.ingest, "store_embedded", fake_store_embedded)
+
+    payload = {"templates": [{"name": "A", "text": "{}"}, {"name": "B", "text": "{}"}]}
+    response = client.post("/new/batch", json=payload)
+    data = response.get_json()
+    assert data["status"] == "success"
+    assert data["message"] == "2 templates stored successfully!"
+    assert received == [("A", "{}"), ("B", "{}")]
+    assert stored == [([("A", {}), ("B", {})], "embeddings")]
+
+
+def test_new_batch_rejected(client, monkeypatch):
+    """
+    Test the /new/batch route reports templates that could not be stored.
+    """
+    monkeypatch.setattr(es.ingest, "embed_records", lambda records, batch_size=32: ([("A", {})], "embeddings", ["B"]))
+    monkeypatch.setattr(es.ingest, "store_embedded", lambda documents, embedded: (["A"], []))
+
+    payload = {"templates": [{"name": "A", "text": "{}"}, {"name": "B", "text": "oops"}]}
+    response = client.post("/new/batch", json=payload)
+    data = response.get_json()
+    assert data["status"] == "error"
+    assert data["message"] == "Failed to store templates: ['B']"
+    assert data["stored"] == ["A"]
+
+
+def test_requests_skip_data_lock_when_files_unchanged(client, monkeypatch):
+    """
+    Test that requests only take the data lock when the files have changed since they were loaded.
+    """
+    locks = []
+    real_data_lock = es.data_lock
+    monkeypatch.setattr(es, "data_lock", lambda exclusive=False: locks.append(exclusive) or real_data_lock(exclusive))
+    monkeypatch.setattr(es, "first_request", False)
+    monkeypatch.setattr(es, "loaded_version", es.data_version())
+
+    client.get("/stats")
+    assert locks == []
+
+    monkeypatch.setattr(es, "loaded_version", None)
+    client.get("/stats")
+    assert locks == [False]
+
+
 def test_search_no_embedding(client):
     """
     Test the /search route when "embedding" is missing.
@@ -141,9 +364,9 @@ def test_search_success(client, monkeypatch):
     Test the /search route when both semantic_search and keyword_search return results.
     """
     monkeypatch.setattr(information_retrieval.embedding_service.vs,
-                        "semantic_search", lambda embb, top_k=5: ["doc1"])
+                        "semantic_search", lambda embb, top_k=5, allowed=None: ["doc1"])
     monkeypatch.setattr(information_retrieval.embedding_service.pi,
-                        "keyword_search", lambda q, top_k=5: ["doc2"])
+                        "keyword_search", lambda q, top_k=5, allowed=None: ["doc2"])
 
     payload = {"embedding": [0.1, 0.2, 0.3], "query": "test", "top_k": 5}
     response = client.post("/search", json=payload)
@@ -152,3 +375,523 @@ def test_search_success(client, monkeypatch):
     assert set(data["matches"]) == {"doc1", "doc2"}
 
 
+
+
+def test_embed_compact_encoding(client, monkeypatch):
+    """
+    Test that /embed returns a base64 embedding when a compact encoding is requested.
+    """
+    monkeypatch.setattr(information_retrieval.embedding_service.emb, "embed", lambda text: [0.5, -0.25])
+
+    data = client.post("/embed", json={"text": "test prompt", "encoding": "float16"}).get_json()
+    assert data["status"] == "success"
+    assert data["encoding"] == "float16"
+    assert codec.decode(data["embedding"], "float16").tolist() == [0.5, -0.25]
+
+def test_embed_unknown_encoding(client):
+    """
+    Test that /embed rejects an unknown encoding.
+    """
+    data = client.post("/embed", json={"text": "test prompt", "encoding": "float8"}).get_json()
+    assert data["status"] == "error"
+    assert data["message"] == "Unknown encoding: float8"
+
+def test_search_accepts_encoded_embedding(client, monkeypatch):
+    """
+    Test that /search decodes an embedding sent in a compact encoding.
+    """
+    received = []
+    monkeypatch.setattr(information_retrieval.embedding_service.vs, "semantic_search",
+                        lambda embb, top_k=5, allowed=None: received.append(list(embb)) or ["doc1"])
+    monkeypatch.setattr(information_retrieval.embedding_service.pi, "keyword_search", lambda q, top_k=5, allowed=None: [])
+
+    payload = {"embedding": codec.encode([1.0, -1.0], "int8"), "encoding": "int8", "query": "test"}
+    data = client.post("/search", json=payload).get_json()
+    assert data["status"] == "success"
+    assert received == [[1.0, -1.0]]
+
+def test_search_invalid_encoded_embedding(client):
+    """
+    Test that /search rejects an embedding that does not decode.
+    """
+    data = client.post("/search", json={"embedding": "not base64!", "encoding": "float32", "query": "test"}).get_json()
+    assert data["status"] == "error"
+    assert data["message"].startswith("Invalid embedding")
+
+def test_embed_raw_response(client, monkeypatch):
+    """
+    Test that /embed answers with the packed embedding when the client accepts raw bytes.
+    """
+    monkeypatch.setattr(information_retrieval.embedding_service.emb, "embed", lambda text: np.array([0.5, -0.25]))
+
+    response = client.post("/embed", json={"text": "test prompt"}, headers={"Accept": codec.RAW_CONTENT_TYPE})
+    assert response.mimetype == codec.RAW_CONTENT_TYPE
+    assert response.headers["X-Embedding-Encoding"] == "float32"
+    assert response.headers["X-Embedding-Shape"] == "2"
+    assert codec.from_bytes(response.data).tolist() == [0.5, -0.25]
+
+def test_embed_batch_raw_response(client, monkeypatch):
+    """
+    Test that /embed/batch packs its embeddings one after the other, in the requested encoding.
+    """
+    monkeypatch.setattr(information_retrieval.embedding_service.emb, "embed_batch",
+                        lambda texts, batch_size=32: [np.full(4, i / 4, dtype=np.float32) for i in range(len(texts))])
+
+    response = client.post("/embed/batch", json={"texts": ["a", "b", "c"], "encoding": "float16"},
+                           headers={"Accept": codec.RAW_CONTENT_TYPE})
+    assert response.headers["X-Embedding-Shape"] == "3,4"
+    vectors = codec.from_bytes(response.data, "float16", dimension=4)
+    assert vectors[:, 0].tolist() == [0, 0.25, 0.5]
+
+def test_search_accepts_raw_embedding(client, monkeypatch):
+    """
+    Test that /search reads a raw embedding from the body and the other fields from the query string.
+    """
+    received = []
+    monkeypatch.setattr(information_retrieval.embedding_service.vs, "semantic_search",
+                        lambda embb, top_k=5, allowed=None: received.append((list(embb), top_k)) or ["doc1"])
+    monkeypatch.setattr(information_retrieval.embedding_service.pi, "keyword_search", lambda q, top_k=5, allowed=None: [])
+
+    response = client.post("/search?query=test&top_k=3", data=codec.to_bytes([1.0, -1.0]),
+                           content_type=codec.RAW_CONTENT_TYPE)
+    assert response.get_json()["matches"] == ["doc1"]
+    assert received == [([1.0, -1.0], 3)]
+
+def test_search_rejects_truncated_raw_embedding(client):
+    """
+    Test that /search rejects a raw body that is not a whole number of components.
+    """
+    data = client.post("/search?query=test", data=b"\x00\x00\x80", content_type=codec.RAW_CONTENT_TYPE).get_json()
+    assert data["status"] == "error"
+    assert data["message"].startswith("Invalid embedding")
+
+def test_gzip_request_and_response(client, monkeypatch):
+    """
+    Test that a gzip request body is inflated, and that a large response is compressed for clients accepting gzip.
+    """
+    monkeypatch.setattr(information_retrieval.embedding_service.emb, "embed_batch",
+                        lambda texts, batch_size=32: [np.full(384, 0.1, dtype=np.float32) for _ in texts])
+    body = gzip.compress(json.dumps({"texts": ["a"] * 10}).encode())
+
+    response = client.post("/embed/batch", data=body, content_type="application/json",
+                           headers={"Content-Encoding": "gzip", "Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert len(json.loads(gzip.decompress(response.data))["embeddings"]) == 10
+
+    response = client.post("/embed/batch", json={"texts": ["a"]})
+    assert "Content-Encoding" not in response.headers
+
+def test_invalid_gzip_request(client):
+    """
+    Test that a request claiming to be gzip but not decompressing is rejected.
+    """
+    response = client.post("/embed", data=b"not gzip", content_type="application/json",
+                           headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 400
+    assert response.get_json()["status"] == "error"
+
+def test_search_filters_both_retrievers(client, monkeypatch):
+    """
+    Test that /search passes the templates matching the filters to both retrievers.
+    """
+    received = {}
+    monkeypatch.setattr(es.facets, "matching",
+                        lambda filters: {"LoginForm"} if filters == {"framework": ["react"]} else set())
+    monkeypatch.setattr(es.vs, "semantic_search",
+                        lambda embb, top_k=5, allowed=None: received.setdefault("semantic", allowed) and ["LoginForm"])
+    monkeypatch.setattr(es.pi, "keyword_search",
+                        lambda q, top_k=5, allowed=None: received.setdefault("keyword", allowed) and [])
+
+    payload = {"embedding": [0.1, 0.2], "query": "login", "filters": {"framework": "React"}}
+    data = client.post("/search", json=payload).get_json()
+    assert data["status"] == "success"
+    assert data["matches"] == ["LoginForm"]
+    assert received == {"semantic": {"LoginForm"}, "keyword": {"LoginForm"}}
+
+def test_search_invalid_filters(client):
+    """
+    Test that /search rejects filters on unknown facets.
+    """
+    payload = {"embedding": [0.1, 0.2], "query": "login", "filters": {"author": "me"}}
+    data = client.post("/search", json=payload).get_json()
+    assert data["status"] == "error"
+    assert data["message"].startswith("Invalid filters")
+
+def test_stats_reports_embedding_cache(client, monkeypatch):
+    """
+    Test the /stats route exposes the embedding cache counters.
+    """
+    cache = EmbeddingCache(max_entries=4)
+    cache.put("prompt", [1.0])
+    cache.get("prompt")
+    cache.get("other prompt")
+    monkeypatch.setattr(information_retrieval.embedding_service.emb, "cache", cache)
+
+    data = client.get("/stats").get_json()
+    assert data["status"] == "success"
+    assert data["embedding_cache"]["hits"] == 1
+    assert data["embedding_cache"]["misses"] == 1
+    assert data["embedding_cache"]["entries"] == 1
+
+
+def test_retrieve_no_query(client):
+    """
+    Test the /retrieve route when "query" is missing.
+    """
+    response = client.post("/retrieve", json={})
+    data = response.get_json()
+    assert data["status"] == "error"
+    assert data["message"] == "No query provided for retrieval!"
+
+
+def test_retrieve_success(client, monkeypatch):
+    """
+    Test the /retrieve route embeds the query and merges semantic and keyword matches.
+    """
+    searched = {}
+    monkeypatch.setattr(information_retrieval.embedding_service.emb, "embed", lambda text: [0.1, 0.2, 0.3])
+    def semantic_search(embedding, top_k=5, allowed=None):
+        searched["embedding"], searched["top_k"] = embedding, top_k
+        return ["doc1"]
+    monkeypatch.setattr(information_retrieval.embedding_service.vs, "semantic_search", semantic_search)
+    monkeypatch.setattr(information_retrieval.embedding_service.pi,
+                        "keyword_search", lambda q, top_k=5, allowed=None: ["doc1", "doc2"])
+
+    response = client.post("/retrieve", json={"query": "test", "top_k": 3})
+    data = response.get_json()
+    assert data["status"] == "success"
+    assert set(data["matches"]) == {"doc1", "doc2"}
+    assert searched == {"embedding": [0.1, 0.2, 0.3], "top_k": 3}
+
+
+def test_retrieve_embedding_failure(client, monkeypatch):
+    """
+    Test the /retrieve route when the query cannot be embedded.
+    """
+    monkeypatch.setattr(information_retrieval.embedding_service.emb, "embed", lambda text: None)
+
+    response = client.post("/retrieve", json={"query": "test"})
+    data = response.get_json()
+    assert data["status"] == "error"
+    assert data["message"] == "Error embedding: test"
+
+
+def test_search_runs_retrievers_concurrently(client, monkeypatch):
+    """
+    Test the /search route runs both retrievers at the same time rather than one after the other.
+    """
+    both_started = threading.Barrier(2, timeout=1)
+    def semantic_search(embedding, top_k=5, allowed=None):
+        both_started.wait()
+        return ["doc1"]
+    def keyword_search(query, top_k=5, allowed=None):
+        both_started.wait()
+        return ["doc2"]
+    monkeypatch.setattr(information_retrieval.embedding_service.vs, "semantic_search", semantic_search)
+    monkeypatch.setattr(information_retrieval.embedding_service.pi, "keyword_search", keyword_search)
+
+    data = client.post("/search", json={"embedding": [0.1, 0.2, 0.3], "query": "test"}).get_json()
+    assert set(data["matches"]) == {"doc1", "doc2"}
+    assert data["timed_out"] == []
+
+
+def test_search_reports_timed_out_retriever(client, monkeypatch):
+    """
+    Test the /search route returns the matches that arrived in time and names the retriever that did not.
+    """
+    release = threading.Event()
+    monkeypatch.setattr(information_retrieval.embedding_service, "SEARCH_TIMEOUT_MS", 50)
+    monkeypatch.setattr(information_retrieval.embedding_service.vs,
+                        "semantic_search", lambda embb, top_k=5, allowed=None: ["doc1"])
+    monkeypatch.setattr(information_retrieval.embedding_service.pi,
+                        "keyword_search", lambda q, top_k=5, allowed=None: release.wait(1) and ["doc2"])
+
+    data = client.post("/search", json={"embedding": [0.1, 0.2, 0.3], "query": "test"}).get_json()
+    release.set()
+    assert data["status"] == "success"
+    assert data["matches"] == ["doc1"]
+    assert data["timed_out"] == ["keyword"]
+
+
+def test_search_fuses_and_truncates_results(client, monkeypatch):
+    """
+    Test the /search route returns at most top_k fused matches, best first, with their scores.
+    """
+    monkeypatch.setattr(information_retrieval.embedding_service.vs,
+                        "semantic_search", lambda embb, top_k=5, allowed=None: ["doc1", "doc2"])
+    monkeypatch.setattr(information_retrieval.embedding_service.pi,
+                        "keyword_search", lambda q, top_k=5, allowed=None: ["doc3", "doc2"])
+
+    data = client.post("/search", json={"embedding": [0.1, 0.2, 0.3], "query": "test", "top_k": 2}).get_json()
+    assert data["matches"] == ["doc2", "doc1"]
+    assert len(data["scores"]) == 2
+    assert data["scores"][0] > data["scores"][1]
+
+
+def test_search_results_cached(client, monkeypatch):
+    """
+    Test a repeated /search is answered from the result cache until an index is written to.
+    """
+    calls = []
+    def semantic_search(embedding, top_k=5, allowed=None):
+        calls.append("semantic")
+        return ["doc1"]
+    monkeypatch.setattr(information_retrieval.embedding_service.vs, "semantic_search", semantic_search)
+    monkeypatch.setattr(information_retrieval.embedding_service.pi,
+                        "keyword_search", lambda q, top_k=5, allowed=None: ["doc2"])
+    payload = {"embedding": [0.1, 0.2, 0.3], "query": "test"}
+
+    first = client.post("/search", json=payload).get_json()
+    second = client.post("/search", json=payload).get_json()
+    assert second["matches"] == first["matches"] and second["scores"] == first["scores"]
+    assert calls == ["semantic"]
+
+    client.post("/search", json={**payload, "top_k": 1})
+    assert len(calls) == 2
+
+    monkeypatch.setattr(information_retrieval.embedding_service.pi, "generation",
+                        information_retrieval.embedding_service.pi.generation + 1)
+    client.post("/search", json=payload)
+    assert len(calls) == 3
+
+    stats = client.get("/stats").get_json()["search_cache"]
+    assert stats["hits"] == 1
+    assert stats["stale"] == 1
+
+
+def test_search_timed_out_results_not_cached(client, monkeypatch):
+    """
+    Test results missing a retriever that timed out are not reused for the next identical /search.
+    """
+    release = threading.Event()
+    monkeypatch.setattr(information_retrieval.embedding_service, "SEARCH_TIMEOUT_MS", 50)
+    monkeypatch.setattr(information_retrieval.embedding_service.vs,
+                        "semantic_search", lambda embb, top_k=5, allowed=None: ["doc1"])
+    monkeypatch.setattr(information_retrieval.embedding_service.pi,
+                        "keyword_search", lambda q, top_k=5, allowed=None: release.wait(1) and ["doc2"])
+    payload = {"embedding": [0.1, 0.2, 0.3], "query": "test"}
+
+    assert client.post("/search", json=payload).get_json()["timed_out"] == ["keyword"]
+    release.set()
+    data = client.post("/search", json=payload).get_json()
+    assert data["timed_out"] == []
+    assert set(data["matches"]) == {"doc1", "doc2"}
+
+
+@pytest.mark.parametrize("propagate", [False, True])
+def test_raising_request_counted_once(client, monkeypatch, propagate):
+    """Test that a request whose route raises is counted once as a request and once as an error."""
+    monkeypatch.setitem(app.config, "PROPAGATE_EXCEPTIONS", propagate)
+    monkeypatch.setattr(es.emb.cache, "stats", lambda: 1 / 0)
+    requests, errors = es.REQUESTS.value(route="/stats"), es.ERRORS.value(route="/stats")
+
+    if propagate:
+        with pytest.raises(ZeroDivisionError):
+            client.get("/stats")
+    else:
+        assert client.get("/stats").status_code == 500
+
+    assert es.REQUESTS.value(route="/stats") == requests + 1
+    assert es.ERRORS.value(route="/stats") == errors + 1
+
+
+def test_metrics_report_stages_and_errors(client, monkeypatch):
+    """
+    Test the /metrics route exposes the stage timings of a search and counts requests that failed.
+    """
+    monkeypatch.setattr(information_retrieval.embedding_service.vs,
+                        "semantic_search", lambda embb, top_k=5, allowed=None: ["doc1"])
+    monkeypatch.setattr(information_retrieval.embedding_service.pi,
+                        "keyword_search", lambda q, top_k=5, allowed=None: ["doc2"])
+    merges = es.metrics.STAGE_SECONDS.value(stage="merge")
+    errors = es.ERRORS.value(route="/search")
+
+    client.post("/search", json={"embedding": [0.1, 0.2, 0.3], "query": "metrics"})
+    client.post("/search", json={"query": "metrics"})
+    response = client.get("/metrics")
+
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    assert es.metrics.STAGE_SECONDS.value(stage="merge") == merges + 1
+    assert es.ERRORS.value(route="/search") == errors + 1
+    lines = response.get_data(as_text=True).splitlines()
+    assert "# TYPE retrieval_stage_seconds histogram" in lines
+    assert any(line.startswith('retrieval_stage_seconds_count{stage="decode"}') for line in lines)
+    assert any(line.startswith('retrieval_request_seconds_count{route="/search"}') for line in lines)
+
+
+def test_trace_timing_header_on_request(client, monkeypatch):
+    """
+    Test the stage timings of a request are returned in a Server-Timing header only when asked for.
+    """
+    monkeypatch.setattr(information_retrieval.embedding_service.vs,
+                        "semantic_search", lambda embb, top_k=5, allowed=None: ["doc1"])
+    monkeypatch.setattr(information_retrieval.embedding_service.pi,
+                        "keyword_search", lambda q, top_k=5, allowed=None: ["doc2"])
+    payload = {"embedding": [0.1, 0.2, 0.3], "query": "trace"}
+
+    assert "Server-Timing" not in client.post("/search", json=payload).headers
+    timing = client.post("/search", json={**payload, "top_k": 2}, headers={"X-Trace-Timing": "1"}).headers["Server-Timing"]
+    assert {entry.split(";")[0] for entry in timing.split(", ")} >= {"decode", "merge"}
+
+
+def test_ready_only_after_warm_up(client, monkeypatch):
+    """
+    Test the /ready route reports 503 until the model and index have been loaded.
+    """
+    monkeypatch.setattr(es, "ready", False)
+    monkeypatch.setattr(es, "load_data", lambda: ("index", {}))
+    monkeypatch.setattr(es.emb, "embed", lambda text: [0.1])
+    monkeypatch.setattr(es.pi, "load_lucene", lambda: None)
+
+    assert client.get("/ready").status_code == 503
+    es.warm_up()
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "ready"
+
+
+def test_warm_up_loads_components_side_by_side(client, monkeypatch):
+    """
+    Test that warm-up loads the index and the model while the JVM starts, rather than one after the other.
+    """
+    both_started = threading.Barrier(3, timeout=5)
+
+    def load(*args):
+        both_started.wait()
+        return ("index", {}) if not args else [0.1]
+
+    monkeypatch.setattr(es, "ready", False)
+    monkeypatch.setattr(es, "load_data", load)
+    monkeypatch.setattr(es.emb, "embed", load)
+    monkeypatch.setattr(es.pi, "load_lucene", load)
+
+    es.warm_up()
+    assert es.ready
+
+
+def test_index_reloaded_when_files_change(client, monkeypatch):
+    """
+    Test that a request reloads the index only when another process has written a new snapshot.
+    """
+    loads = []
+    version = ["v1"]
+    monkeypatch.setattr(es, "load_data", lambda: loads.append(1) or ("index", {}))
+    monkeypatch.setattr(es, "data_version", lambda: version[0])
+    monkeypatch.setattr(es, "snapshot_version", lambda: version[0])
+
+    client.get("/stats")
+    client.get("/stats")
+    assert len(loads) == 1, "The index should only be loaded once while the files are unchanged"
+
+    version[0] = "v2"
+    client.get("/stats")
+    assert len(loads) == 2, "A change to the files should trigger a reload"
+
+
+def test_log_appends_applied_without_reloading(monkeypatch, tmp_path):
+    """
+    Test that records another process appends to the write-ahead log are applied from where this process left off,
+    and that the files are only loaded again once a new snapshot has been written.
+    """
+    for name, file in (("FAISS_FILE", "faiss.index"), ("MAPPINGS_FILE", "mappings.pkl"),
+                       ("NAMES_FILE", "mappings.names"), ("WAL_FILE", "faiss.wal"),
+                       ("WAL_COMPACTING_FILE", "faiss.wal.compacting"), ("LUCENE_INDEX_DIR", "jsonld_index")):
+        monkeypatch.setattr(dh, name, str(tmp_path / file))
+    monkeypatch.setattr(dh, "PERSISTENCE_MODE", "wal")
+    loads = []
+    monkeypatch.setattr(es, "load_data", lambda: loads.append(1) or dh.load_data())
+    monkeypatch.setattr(es.vs, "index", None)
+    monkeypatch.setattr(es.vs, "store", {})
+    monkeypatch.setattr(es, "first_request", True)
+    vectors = np.eye(3, dh.VECTOR_DIMENSION, dtype=np.float32)
+    dh.append_to_log([(0, "first", vectors[0])])
+    es.reload_if_stale()
+    assert len(loads) == 1 and es.vs.store == {0: "first"}
+
+    dh.append_to_log([(1, "second", vectors[1]), (2, "second", vectors[2]), (0, None, None)])
+    es.reload_if_stale()
+    assert len(loads) == 1, "Appends to the log should be applied without loading the files again"
+    assert es.vs.store == {1: "second", 2: "second"}
+    assert es.vs.semantic_search(vectors[2], 1) == ["second"]
+    es.reload_if_stale()
+    assert es.vs.store == {1: "second", 2: "second"}, "Records should only be applied once"
+
+    dh.compact(es.vs.index, es.vs.store, background=False)
+    es.reload_if_stale()
+    assert len(loads) == 2, "A new snapshot should be loaded again"
+    assert es.vs.store == {1: "second", 2: "second"}
+    es.vs.drain_changes()
+
+
+def test_shutdown_skips_stale_index(monkeypatch, tmp_path):
+    """
+    Test that shutdown does not overwrite files that another process has written since this one loaded them.
+    """
+    monkeypatch.setattr(dh, "LOCK_FILE", str(tmp_path / "faiss.lock"))
+    monkeypatch.setattr(es.vs, "index", "index")
+    monkeypatch.setattr(es, "loaded_version", "v1")
+    monkeypatch.setattr(es, "data_version", lambda: "v2")
+    monkeypatch.setattr(es.emb, "save_cache", lambda: None)
+    with mock.patch.object(es, "checkpoint") as mock_checkpoint:
+        es.shutdown()
+        mock_checkpoint.assert_not_called()
+
+        monkeypatch.setattr(es, "loaded_version", "v2")
+        es.shutdown()
+        mock_checkpoint.assert_called_once_with("index", es.vs.store)
+
+
+def test_delete_no_name(client):
+    """
+    Test the /delete route when no template name is given.
+    """
+    data = client.post("/delete", json={}).get_json()
+    assert data["status"] == "error"
+    assert data["message"] == "No template name provided"
+
+
+def test_delete_success(client, monkeypatch):
+    """
+    Test the /delete route removes the template from both indexes and persists the change.
+    """
+    deleted = {}
+    monkeypatch.setattr(information_retrieval.embedding_service.vs, "delete_embeddings",
+                        lambda names: deleted.setdefault("vector", names) and 1)
+    monkeypatch.setattr(information_retrieval.embedding_service.pi, "delete_documents",
+                        lambda names: deleted.setdefault("keyword", names) and True)
+    monkeypatch.setattr(information_retrieval.embedding_service, "persist", lambda index, store, changes: None)
+
+    data = client.post("/delete", json={"name": "LoginForm"}).get_json()
+    assert data["status"] == "success"
+    assert deleted == {"vector": ["LoginForm"], "keyword": ["LoginForm"]}
+
+
+def test_delete_unknown_template(client, monkeypatch):
+    """
+    Test the /delete route reports a name that is not stored.
+    """
+    monkeypatch.setattr(information_retrieval.embedding_service.vs, "delete_embeddings", lambda names: 0)
+    monkeypatch.setattr(information_retrieval.embedding_service.pi, "delete_documents", lambda names: True)
+    monkeypatch.setattr(information_retrieval.embedding_service, "persist", lambda index, store, changes: None)
+
+    data = client.post("/delete", json={"name": "Missing"}).get_json()
+    assert data["status"] == "error"
+    assert data["message"] == "No template named 'Missing'"
+
+
+def test_sharded_mode_uses_shards(client, monkeypatch):
+    """
+    Test that with shards configured, searches and deletes go to the shards and the local index is not persisted.
+    """
+    monkeypatch.setattr(es.shards, "SHARD_URLS", ["http://shard-0", "http://shard-1"])
+    monkeypatch.setattr(es.shards, "semantic_search", lambda embedding, top_k=5, allowed=None: ["sharded"])
+    monkeypatch.setattr(es.shards, "delete_embeddings", lambda names: 1)
+    monkeypatch.setattr(es.vs, "semantic_search", lambda embedding, top_k=5, allowed=None: ["local"])
+    monkeypatch.setattr(es.pi, "keyword_search", lambda q, top_k=5, allowed=None: [])
+    monkeypatch.setattr(es.pi, "delete_documents", lambda names: True)
+    persisted = []
+    monkeypatch.setattr(es, "persist", lambda index, store, changes: persisted.append(changes))
+
+    assert client.post("/search", json={"embedding": [0.1, 0.2], "query": "shards"}).get_json()["matches"] == ["sharded"]
+    assert client.post("/delete", json={"name": "LoginForm"}).get_json()["status"] == "success"
+    assert persisted == []
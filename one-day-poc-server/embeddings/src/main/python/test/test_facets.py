@@ -0,0 +1,67 @@
+import pytest
+
+from information_retrieval import facets
+
+LOGIN_FORM = {
+    "@type": "SoftwareSourceCode",
+    "name": "LoginForm",
+    "framework": {"@type": "SoftwareApplication", "name": "React"},
+    "programmingLanguage": {"@type": "ComputerLanguage", "name": "TypeScript"},
+    "applicationCategory": "User Interface Component",
+    "keywords": ["login", "Form", 3],
+}
+
+
+@pytest.fixture(autouse=True)
+def facets_file(monkeypatch, tmp_path):
+    """Keeps the facet table of each test in its own file."""
+    monkeypatch.setattr(facets, "FACETS_FILE", str(tmp_path / "facets.json"))
+    monkeypatch.setattr(facets, "table", {})
+    monkeypatch.setattr(facets, "_loaded_version", None)
+
+
+def test_extract_takes_names_of_objects_and_entries_of_lists():
+    """Test that objects contribute their name, lists each string entry, and values are lower-cased."""
+    assert facets.extract(LOGIN_FORM) == {
+        "applicationCategory": ["user interface component"],
+        "framework": ["react"],
+        "programmingLanguage": ["typescript"],
+        "keywords": ["login", "form"],
+    }
+
+
+def test_validate_normalises_values():
+    """Test that single values become lists and every value is lower-cased."""
+    assert facets.validate({"framework": "React", "keywords": ["Chat", "form"]}) == {
+        "framework": ["react"], "keywords": ["chat", "form"]}
+    assert facets.validate(None) == {}
+
+
+@pytest.mark.parametrize("filters", [["framework"], {"author": "me"}, {"framework": []}, {"framework": 1}])
+def test_validate_rejects_malformed_filters(filters):
+    """Test that filters must map known facets to strings or lists of strings."""
+    with pytest.raises(ValueError):
+        facets.validate(filters)
+
+
+def test_matching_requires_every_facet_and_any_value():
+    """Test that a template must match each filtered facet, by at least one of its values."""
+    facets.update([("LoginForm", LOGIN_FORM), ("Chart", {"framework": {"name": "Vue"}, "keywords": ["chart"]})])
+
+    assert facets.matching({"framework": ["react", "vue"]}) == {"LoginForm", "Chart"}
+    assert facets.matching({"framework": ["react", "vue"], "keywords": ["chart"]}) == {"Chart"}
+    assert facets.matching({"programmingLanguage": ["python"]}) == set()
+
+
+def test_changes_are_seen_by_other_processes(monkeypatch):
+    """Test that the table is written out and reloaded when another process has changed the file."""
+    facets.update([("LoginForm", LOGIN_FORM)])
+    written = facets.table
+
+    monkeypatch.setattr(facets, "table", {})
+    monkeypatch.setattr(facets, "_loaded_version", None)  # as in a process that has not read the file yet
+    assert facets.matching({"framework": ["react"]}) == {"LoginForm"}
+    assert facets.table == written
+
+    facets.remove(["LoginForm"])
+    assert facets.matching({"framework": ["react"]}) == set()
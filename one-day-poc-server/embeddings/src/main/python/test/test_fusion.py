@@ -0,0 +1,40 @@
+import pytest
+
+from information_retrieval.fusion import reciprocal_rank_fusion
+
+
+def test_ids_found_by_both_retrievers_rank_first():
+    """Test that an id ranked by both retrievers beats ids ranked highly by only one."""
+    fused = reciprocal_rank_fusion({"semantic": ["a", "b"], "keyword": ["c", "b"]}, top_k=3, k=60)
+
+    assert [doc_id for doc_id, _ in fused] == ["b", "a", "c"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 62)
+    assert fused[1][1] == pytest.approx(1 / 61)
+
+
+def test_results_are_truncated_to_top_k():
+    """Test that at most top_k results are returned."""
+    fused = reciprocal_rank_fusion({"semantic": ["a", "b", "c"], "keyword": ["d", "e", "f"]}, top_k=2)
+
+    assert len(fused) == 2
+
+
+def test_weights_favour_a_retriever():
+    """Test that a heavier weight lets a retriever's top result win."""
+    rankings = {"semantic": ["a"], "keyword": ["b"]}
+    fused = reciprocal_rank_fusion(rankings, top_k=2, weights={"semantic": 0.5, "keyword": 2.0})
+
+    assert [doc_id for doc_id, _ in fused] == ["b", "a"]
+
+
+def test_repeated_ids_count_once_per_retriever():
+    """Test that an id repeated within one ranking is only scored at its best rank."""
+    fused = reciprocal_rank_fusion({"semantic": ["a", "a", "b"]}, top_k=2, k=60)
+
+    assert dict(fused) == pytest.approx({"a": 1 / 61, "b": 1 / 63})
+
+
+def test_empty_rankings():
+    """Test that fusing nothing returns nothing."""
+    assert reciprocal_rank_fusion({}, top_k=5) == []
+    assert reciprocal_rank_fusion({"semantic": [], "keyword": []}, top_k=5) == []
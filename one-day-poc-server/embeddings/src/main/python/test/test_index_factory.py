@@ -0,0 +1,150 @@
+import faiss
+import numpy as np
+import pytest
+
+from information_retrieval.vector_search import index_factory
+from information_retrieval.vector_search.index_factory import create_index, min_training_points, rebuild, train, with_id_map
+
+DIMENSION = 384
+
+
+@pytest.fixture
+def small_lists(monkeypatch):
+    """Keep IVF indexes small enough to train on a few hundred vectors."""
+    monkeypatch.setattr(index_factory, "IVF_NLIST", 4)
+    monkeypatch.setattr(index_factory, "IVF_NPROBE", 4)
+
+
+def inner(index):
+    """The index wrapped by an IndexIDMap2."""
+    assert isinstance(index, faiss.IndexIDMap2), "Indexes should be id-mapped"
+    return faiss.downcast_index(index.index)
+
+
+def random_vectors(n):
+    vectors = np.random.rand(n, DIMENSION).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_flat_is_default():
+    """Test that the default index is an exact inner-product index."""
+    assert isinstance(inner(create_index(DIMENSION, "flat")), faiss.IndexFlatIP)
+
+
+@pytest.mark.parametrize("index_type, expected", [
+    ("hnsw", faiss.IndexHNSWFlat),
+    ("ivf_flat", faiss.IndexIVFFlat),
+    ("ivf_pq", faiss.IndexIVFPQ),
+    ("sq_fp16", faiss.IndexScalarQuantizer),
+    ("sq_int8", faiss.IndexScalarQuantizer),
+])
+def test_create_index_types(small_lists, index_type, expected):
+    """Test that each configured type builds the matching FAISS index with inner-product metric."""
+    index = create_index(DIMENSION, index_type)
+    assert isinstance(inner(index), expected)
+    assert index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+
+def test_unknown_index_type():
+    """Test that an unknown type is rejected."""
+    with pytest.raises(ValueError):
+        create_index(DIMENSION, "lsh")
+
+
+def test_search_parameters_applied(small_lists):
+    """Test that nprobe and efSearch are taken from configuration."""
+    assert inner(create_index(DIMENSION, "ivf_flat")).nprobe == 4
+    assert inner(create_index(DIMENSION, "hnsw")).hnsw.efSearch == index_factory.HNSW_EF_SEARCH
+
+
+def test_binary_index_reranks_hamming_candidates():
+    """Test that the binary type searches sign bits and reranks the best candidates on float16 vectors."""
+    index = create_index(DIMENSION, "binary")
+    refine = inner(index)
+    assert isinstance(refine, faiss.IndexRefine)
+    assert isinstance(faiss.downcast_index(refine.base_index), faiss.IndexLSH)
+    assert refine.k_factor == index_factory.BINARY_RERANK_FACTOR
+
+    vectors = random_vectors(200)
+    index.add_with_ids(vectors, np.arange(100, 300, dtype=np.int64))
+    _, ids = index.search(vectors[:5], 1)
+    assert ids[:, 0].tolist() == list(range(100, 105)), "Each vector should be its own nearest neighbour"
+
+
+@pytest.mark.parametrize("index_type", ["sq_fp16", "sq_int8", "binary"])
+def test_reduced_precision_types_take_less_memory(index_type):
+    """Test that the quantized types store the vectors in fewer bytes than the flat index."""
+    vectors = random_vectors(2000)  # enough for the binary type's rotation matrix to pay for itself
+    sizes = {}
+    for name in ("flat", index_type):
+        index = create_index(DIMENSION, name)
+        assert train(index, vectors)
+        index.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+        sizes[name] = len(faiss.serialize_index(index))
+    assert sizes[index_type] < sizes["flat"]
+
+
+def test_scalar_quantizer_needs_a_training_sample():
+    """Test that the int8 quantizer is not trained on a few vectors, whose value ranges are too narrow."""
+    index = create_index(DIMENSION, "sq_int8")
+    assert min_training_points(index) == index_factory.SQ_TRAINING_POINTS
+    assert not train(index, random_vectors(1))
+    assert train(index, random_vectors(index_factory.SQ_TRAINING_POINTS))
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf_flat", "sq_int8", "binary"])
+def test_search_among_only_returns_selected_ids(small_lists, index_type):
+    """Test that a search restricted to some ids never returns others, even when they are closer."""
+    index = create_index(DIMENSION, index_type)
+    vectors = random_vectors(400)
+    train(index, vectors)
+    index.add_with_ids(vectors, np.arange(1000, 1400, dtype=np.int64))
+
+    selected = [1100, 1200, 1300]
+    _, ids = index_factory.search_among(index, vectors[:1], 3, selected)
+    found = [idx for idx in ids[0].tolist() if idx != -1]
+    assert set(found) <= set(selected), "The query's own vector and other unselected ones should be skipped"
+    if index_type in ("flat", "sq_int8", "binary"):
+        assert sorted(found) == selected, "Exhaustive searches should find every selected vector"
+
+
+def test_train_requires_enough_points(small_lists):
+    """Test that training is refused when there are fewer vectors than clusters."""
+    index = create_index(DIMENSION, "ivf_flat")
+    assert not train(index, random_vectors(2)), "Training should fail with too few vectors"
+    assert train(index, random_vectors(min_training_points(index) * 40)), "Training should succeed"
+    assert index.is_trained and min_training_points(index) == 0
+
+
+def test_rebuild_flat_into_ivf(small_lists):
+    """Test that migrating a flat index keeps every vector at its id."""
+    vectors = random_vectors(300)
+    flat = create_index(DIMENSION, "flat")
+    flat.add_with_ids(vectors, np.arange(1000, 1300))
+
+    rebuilt = rebuild(flat, "ivf_flat")
+    assert isinstance(inner(rebuilt), faiss.IndexIVFFlat) and rebuilt.ntotal == 300
+    _, ids = rebuilt.search(vectors[[7]], 1)
+    assert ids[0][0] == 1007, "A vector should still be found under its original id"
+    assert np.allclose(rebuilt.reconstruct(1007), vectors[7], atol=1e-6)
+
+
+def test_rebuild_too_small_for_pq(small_lists):
+    """Test that migrating to IVF-PQ fails clearly when there is too little data to train on."""
+    flat = create_index(DIMENSION, "flat")
+    flat.add_with_ids(random_vectors(10), np.arange(10))
+    with pytest.raises(ValueError):
+        rebuild(flat, "ivf_pq")
+
+
+def test_with_id_map_keeps_positional_ids():
+    """Test that an index persisted before ids were explicit keeps its positions as ids."""
+    vectors = random_vectors(20)
+    legacy = faiss.IndexFlatIP(DIMENSION)
+    legacy.add(vectors)
+
+    mapped = with_id_map(legacy)
+    assert isinstance(inner(mapped), faiss.IndexFlatIP) and mapped.ntotal == 20
+    _, ids = mapped.search(vectors[[12]], 1)
+    assert ids[0][0] == 12
+    assert with_id_map(mapped) is mapped, "An id-mapped index should be returned as is"
@@ -0,0 +1,83 @@
+import json
+
+import faiss
+import numpy as np
+import pytest
+
+from information_retrieval import ingest
+from information_retrieval.vector_search import vector_store
+
+
+@pytest.fixture
+def setup_stores(monkeypatch):
+    """Fixture that provides an empty index and replaces the embedder, keyword index and persistence."""
+    vector_store.index = faiss.IndexFlatIP(384)
+    vector_store.store = {}
+    calls = {"embed": 0, "keyword": [], "save": 0}
+
+    def fake_embed_batch(texts, batch_size=32):
+        calls["embed"] += 1
+        return [np.random.rand(384).astype(np.float32).tolist() for _ in texts]
+
+    def fake_store_jsonld_batch(documents):
+        calls["keyword"].append(list(documents))
+        return True
+
+    def fake_persist(index, store, changes):
+        calls["save"] += 1
+
+    monkeypatch.setattr(ingest.chunker.emb, "embed_batch", fake_embed_batch)
+    monkeypatch.setattr(ingest.pi, "store_jsonld_batch", fake_store_jsonld_batch)
+    monkeypatch.setattr(ingest, "persist", fake_persist)
+    return calls
+
+
+def test_read_records_from_directory(tmp_path):
+    """Test that every .jsonld file in a directory becomes a record named after the file."""
+    (tmp_path / "LoginForm.jsonld").write_text('{"name": "LoginForm"}')
+    (tmp_path / "Header.jsonld").write_text('{"name": "Header"}')
+    (tmp_path / "notes.txt").write_text("ignored")
+
+    records = list(ingest.read_records(str(tmp_path)))
+    assert records == [("Header", '{"name": "Header"}'), ("LoginForm", '{"name": "LoginForm"}')]
+
+
+def test_read_records_from_jsonl(tmp_path):
+    """Test that each non-empty JSONL line becomes a record."""
+    path = tmp_path / "templates.jsonl"
+    path.write_text(json.dumps({"name": "A", "text": '{"a": 1}'}) + "\n\n" +
+                    json.dumps({"name": "B", "text": '{"b": 2}'}) + "\n")
+
+    records = list(ingest.read_records(str(path)))
+    assert records == [("A", '{"a": 1}'), ("B", '{"b": 2}')]
+
+
+def test_bulk_ingest_single_pass(setup_stores):
+    """Test that a batch is embedded, indexed and persisted exactly once."""
+    records = [(f"Template{i}", json.dumps({"name": f"Template{i}"})) for i in range(10)]
+    stored, rejected = ingest.bulk_ingest(records)
+
+    assert len(stored) == 10 and rejected == [], "Every valid record should be stored"
+    assert vector_store.index.ntotal == 10, "All vectors should be in the index"
+    assert sorted(vector_store.store.values()) == sorted(name for name, _ in records)
+    assert setup_stores["embed"] == 1, "Texts should be embedded in one batched call"
+    assert len(setup_stores["keyword"]) == 1, "Metadata should be indexed in one Lucene session"
+    assert setup_stores["save"] == 1, "Data should be persisted once"
+
+
+def test_bulk_ingest_rejects_invalid_annotations(setup_stores):
+    """Test that records whose annotation is not a JSON object are skipped."""
+    records = [("Good", '{"name": "Good"}'), ("NotJson", "not json"), ("NotObject", "[1, 2]")]
+    stored, rejected = ingest.bulk_ingest(records)
+
+    assert stored == ["Good"], "Only the valid record should be stored"
+    assert rejected == ["NotJson", "NotObject"], "Invalid records should be reported"
+    assert vector_store.index.ntotal == 1
+
+
+def test_bulk_ingest_nothing_valid(setup_stores):
+    """Test that nothing is embedded or persisted when no record is valid."""
+    stored, rejected = ingest.bulk_ingest([("Bad", "oops")])
+
+    assert stored == [] and rejected == ["Bad"]
+    assert setup_stores["embed"] == 0 and setup_stores["save"] == 0
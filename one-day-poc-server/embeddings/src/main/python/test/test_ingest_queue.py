@@ -0,0 +1,120 @@
+import queue
+import threading
+
+import pytest
+
+from information_retrieval.ingest_queue import IngestQueue
+
+
+def recording_ingest(batches, rejected=()):
+    """An ingest_batch that records its batches and stores every template but the rejected ones."""
+    def ingest_batch(records):
+        batches.append(records)
+        return [name for name, _ in records if name not in rejected], [name for name, _ in records if name in rejected]
+    return ingest_batch
+
+
+def test_jobs_finish_with_their_outcome():
+    """Test that a stored template's job is done and a rejected one's failed."""
+    batches = []
+    ingest_queue = IngestQueue(recording_ingest(batches, rejected={"bad"}), window_ms=0)
+    good, bad = ingest_queue.submit("good", {"name": "good"}), ingest_queue.submit("bad", {})
+
+    assert ingest_queue.join(timeout=5)
+    assert ingest_queue.status(good)["status"] == "done"
+    assert ingest_queue.status(bad)["status"] == "failed"
+    assert ingest_queue.status("missing") is None
+
+
+def test_templates_coalesced_into_batches():
+    """Test that templates queued while the worker is busy are indexed together, the latest upload of a name once."""
+    batches, started, release = [], threading.Event(), threading.Event()
+
+    def ingest_batch(records):
+        started.set()
+        release.wait(5)
+        return recording_ingest(batches)(records)
+
+    ingest_queue = IngestQueue(ingest_batch, window_ms=0)
+    ingest_queue.submit("first", {})
+    assert started.wait(5)
+    jobs = [ingest_queue.submit(name, {"version": i}) for i, name in enumerate(["a", "b", "a"])]
+    release.set()
+
+    assert ingest_queue.join(timeout=5)
+    assert batches[1] == [("a", {"version": 2}), ("b", {"version": 1})]
+    assert all(ingest_queue.status(job)["status"] == "done" for job in jobs)
+
+
+def test_batch_size_limit():
+    """Test that no batch holds more than max_batch_size templates."""
+    batches = []
+    ingest_queue = IngestQueue(recording_ingest(batches), window_ms=20, max_batch_size=3)
+    for i in range(7):
+        ingest_queue.submit(f"t{i}", {})
+
+    assert ingest_queue.join(timeout=5)
+    assert sum(len(batch) for batch in batches) == 7
+    assert max(len(batch) for batch in batches) <= 3
+
+
+def test_full_queue_rejects_templates():
+    """Test that templates are turned away once max_pending are waiting."""
+    release = threading.Event()
+    ingest_queue = IngestQueue(lambda records: release.wait(5) and ([], []), max_pending=1, window_ms=1000)
+    ingest_queue.submit("a", {})
+    with pytest.raises(queue.Full):
+        ingest_queue.submit("b", {})
+    release.set()
+
+
+def test_failing_batch_fails_its_jobs():
+    """Test that an exception while indexing fails every job of the batch, and the worker keeps going."""
+    calls = []
+
+    def ingest_batch(records):
+        calls.append(records)
+        if len(calls) == 1:
+            raise RuntimeError("index unavailable")
+        return [name for name, _ in records], []
+
+    ingest_queue = IngestQueue(ingest_batch, window_ms=0)
+    failed = ingest_queue.submit("a", {})
+    assert ingest_queue.join(timeout=5)
+    done = ingest_queue.submit("b", {})
+    assert ingest_queue.join(timeout=5)
+
+    assert ingest_queue.status(failed)["status"] == "failed"
+    assert ingest_queue.status(failed)["message"] == "index unavailable"
+    assert ingest_queue.status(done)["status"] == "done"
+
+
+def test_oldest_finished_jobs_forgotten():
+    """Test that only the latest max_jobs jobs are kept."""
+    ingest_queue = IngestQueue(recording_ingest([]), window_ms=0, max_jobs=2)
+    jobs = []
+    for name in ["a", "b", "c"]:
+        jobs.append(ingest_queue.submit(name, {}))
+        assert ingest_queue.join(timeout=5)
+
+    assert ingest_queue.status(jobs[0]) is None
+    assert ingest_queue.stats()["jobs"]["done"] == 2
+
+
+def test_jobs_readable_from_other_processes(tmp_path):
+    """Test that a job queued in one process can be polled from another sharing the jobs directory."""
+    release = threading.Event()
+
+    def ingest_batch(records):
+        release.wait(5)
+        return [name for name, _ in records], []
+
+    worker = IngestQueue(ingest_batch, window_ms=0, jobs_dir=str(tmp_path), owner="a1")
+    other = IngestQueue(recording_ingest([]), jobs_dir=str(tmp_path), owner="b2")
+    job = worker.submit("template", {})
+
+    assert other.status(job)["status"] in ("queued", "indexing")
+    release.set()
+    assert worker.join(timeout=5)
+    assert other.status(job)["status"] == "done"
+    assert other.status("c3-1") is None and other.status("../a1-1") is None
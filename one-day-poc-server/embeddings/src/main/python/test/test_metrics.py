@@ -0,0 +1,88 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from information_retrieval import metrics
+
+
+@pytest.fixture(autouse=True)
+def isolated_registry(monkeypatch):
+    """Keeps the metrics created by a test out of the shared registry."""
+    monkeypatch.setattr(metrics, "registry", [])
+
+
+def test_counter_renders_labelled_samples():
+    """Test that counters add up per label combination and render in the text format."""
+    counter = metrics.Counter("requests_total", "Requests served.", ("route",))
+    counter.inc(route="/search")
+    counter.inc(2, route="/search")
+    counter.inc(route="/embed")
+
+    assert counter.value(route="/search") == 3
+    assert metrics.render().splitlines() == [
+        "# HELP requests_total Requests served.",
+        "# TYPE requests_total counter",
+        'requests_total{route="/search"} 3',
+        'requests_total{route="/embed"} 1',
+    ]
+
+
+def test_gauge_reads_its_value_when_rendered():
+    """Test that a gauge with a read function reports the value at render time."""
+    size = [1]
+    metrics.Gauge("index_vectors", "Vectors.", read=lambda: size[0])
+    size[0] = 5
+
+    assert "index_vectors 5" in metrics.render().splitlines()
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test that an observation counts towards every bucket it fits in, plus the sum and count."""
+    histogram = metrics.Histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="embed")
+    histogram.observe(0.5, stage="embed")
+    histogram.observe(2.0, stage="embed")
+
+    lines = metrics.render().splitlines()
+    assert 'latency_seconds_bucket{stage="embed",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="embed",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{stage="embed",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{stage="embed"} 2.55' in lines
+    assert 'latency_seconds_count{stage="embed"} 3' in lines
+    assert histogram.value(stage="embed") == 3
+
+
+def test_label_values_are_escaped():
+    """Test that quotes and backslashes in label values cannot break the output."""
+    metrics.Counter("errors_total", "Errors.", ("route",)).inc(route='a"b\\c')
+
+    assert 'errors_total{route="a\\"b\\\\c"} 1' in metrics.render().splitlines()
+
+
+def test_stages_are_added_to_the_active_trace(monkeypatch):
+    """Test that stages feed the histogram always and the trace only while one is active."""
+    histogram = metrics.Histogram("stage_seconds", "Stages.", ("stage",))
+    monkeypatch.setattr(metrics, "STAGE_SECONDS", histogram)
+
+    _timed("embed")
+    token = metrics.start_trace()
+    _timed("embed")
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pool.submit(contextvars.copy_context().run, _timed, "lucene_search").result()
+    trace = metrics.end_trace(token)
+
+    assert histogram.value(stage="embed") == 2
+    assert set(trace) == {"embed", "lucene_search"}
+    _timed("merge")
+    assert "merge" not in trace
+
+
+def _timed(name):
+    with metrics.stage(name):
+        pass
+
+
+def test_server_timing_header():
+    """Test that stage timings are formatted in milliseconds."""
+    assert metrics.server_timing({"embed": 0.0125, "merge": 0.0001}) == "embed;dur=12.50, merge;dur=0.10"
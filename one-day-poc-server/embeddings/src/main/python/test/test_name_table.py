@@ -0,0 +1,68 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from information_retrieval.name_table import NameTable, write_name_table
+
+
+@pytest.fixture
+def table(tmp_path):
+    """Fixture that writes a small mapping to disk and opens it as a NameTable."""
+    path = tmp_path / "mappings.names"
+    write_name_table(str(path), {0: "LoginForm", 1: "Header", 2: "Ünïcødé"})
+    return NameTable(str(path))
+
+
+def test_read_entries(table):
+    """Test that every entry written to the file can be read back."""
+    assert len(table) == 3, "The table should contain every written entry"
+    assert table[0] == "LoginForm"
+    assert table[2] == "Ünïcødé", "Non-ASCII names should round-trip"
+    assert dict(table) == {0: "LoginForm", 1: "Header", 2: "Ünïcødé"}
+
+
+def test_numpy_keys(table):
+    """Test that ids returned by FAISS (numpy integers) can be used as keys."""
+    assert np.int64(1) in table, "numpy ids should be found"
+    assert table[np.int64(1)] == "Header"
+    assert -1 not in table, "FAISS' padding id should not be found"
+
+
+def test_overlay_writes(table):
+    """Test that inserts and deletions are applied on top of the file."""
+    table[len(table)] = "Footer"
+    table[0] = "SignInForm"
+    del table[1]
+
+    assert len(table) == 3, "Length should account for inserts and deletions"
+    assert table[3] == "Footer" and table[0] == "SignInForm"
+    assert 1 not in table, "Deleted entries should no longer be found"
+    with pytest.raises(KeyError):
+        table[1]
+
+    table[1] = "Header"
+    assert len(table) == 4 and table[1] == "Header", "Deleted entries can be inserted again"
+
+
+def test_write_and_reopen(table, tmp_path):
+    """Test that a modified table can be written out and reopened."""
+    table[3] = "Footer"
+    path = tmp_path / "rewritten.names"
+    write_name_table(str(path), table)
+
+    assert dict(NameTable(str(path))) == dict(table), "The rewritten table should hold the overlay entries"
+
+
+def test_pickles_as_dict(table):
+    """Test that a NameTable pickles to a plain dictionary."""
+    restored = pickle.loads(pickle.dumps(table))
+    assert isinstance(restored, dict) and restored == dict(table)
+
+
+def test_invalid_file(tmp_path):
+    """Test that a file in another format is rejected."""
+    path = tmp_path / "mappings.pkl"
+    path.write_bytes(pickle.dumps({0: "LoginForm"}))
+    with pytest.raises(ValueError):
+        NameTable(str(path))
@@ -1,12 +1,17 @@
 import os
 import pytest
 
-from information_retrieval.keyword_search.pyserini_indexer import store_jsonld, keyword_search, LUCENE_INDEX_DIR
+from information_retrieval.keyword_search import pyserini_indexer
+from information_retrieval.keyword_search.pyserini_indexer import store_jsonld, store_jsonld_batch, delete_documents, keyword_search, LUCENE_INDEX_DIR, SearcherManager
 from pyserini.index.lucene import LuceneIndexReader
+from information_retrieval import facets
 
 @pytest.fixture(autouse=True)
-def setup_index():
+def setup_index(monkeypatch, tmp_path):
     """Clears old index and sets up new test data before each test."""
+    monkeypatch.setattr(facets, "FACETS_FILE", str(tmp_path / "facets.json"))
+    monkeypatch.setattr(facets, "table", {})
+    monkeypatch.setattr(facets, "_loaded_version", None)
 
     if os.path.exists(LUCENE_INDEX_DIR):
         import shutil
@@ -43,6 +48,27 @@ def test_index_creation():
     num_docs = reader.stats()["documents"]
     assert num_docs > 0, "Lucene index should have at least one document."
 
+def test_keyword_search_among_allowed_names():
+    assert store_jsonld("SignupForm", {"description": "A signup form with Google OAuth login."})
+
+    assert set(keyword_search("Google OAuth login", top_k=5)) == {"TestID", "SignupForm"}
+    assert keyword_search("Google OAuth login", top_k=5, allowed={"SignupForm"}) == ["SignupForm"]
+    assert keyword_search("Google OAuth login", top_k=5, allowed=set()) == []
+
+def test_facets_follow_stored_and_deleted_documents():
+    assert facets.table["TestID"] == {"keywords": ["login", "authentication", "oauth"]}
+
+    assert delete_documents(["TestID"])
+    assert "TestID" not in facets.table
+
+def test_writes_bump_generation():
+    before = pyserini_indexer.generation
+    assert store_jsonld("SecondID", {"description": "Expense dashboard with charts"})
+    assert pyserini_indexer.generation > before
+    before = pyserini_indexer.generation
+    assert delete_documents(["SecondID"])
+    assert pyserini_indexer.generation == before + 1
+
 def test_store_json_ld_with_non_dict():
     os.system(f"rm -rf {LUCENE_INDEX_DIR}")
     success = store_jsonld("TestID", "Test")
@@ -91,6 +117,52 @@ def test_valid_index_searcher_close():
     assert len(results) > 0, "At least one document should be found in the index."
 
 
+def test_store_jsonld_appends_to_existing_index():
+    """Test that storing a document keeps the documents indexed before it."""
+    success = store_jsonld("SecondID", {"name": "Dashboard", "description": "Expense dashboard with charts"})
+    assert success, "Failed to store second JSON-LD data."
+
+    reader = LuceneIndexReader(LUCENE_INDEX_DIR)
+    assert reader.stats()["documents"] == 2, "Both documents should be in the index."
+    assert "TestID" in keyword_search("Google OAuth login", top_k=1), "First document should still be searchable."
+
+
+def test_store_jsonld_batch():
+    """Test that a batch of documents is indexed in one session."""
+    documents = [
+        ("BatchA", {"name": "ChatInput", "description": "Message input with send button"}),
+        ("BatchB", {"name": "FileUpload", "description": "Drag and drop file upload"}),
+    ]
+    assert store_jsonld_batch(documents), "Failed to store JSON-LD batch."
+    assert "BatchB" in keyword_search("drag drop upload", top_k=1), "Batched documents should be searchable."
+
+
+def test_store_jsonld_replaces_existing_document():
+    """Test that storing a name again replaces its document instead of adding a second one."""
+    assert store_jsonld("TestID", {"name": "Dashboard", "description": "Expense dashboard with charts"})
+
+    reader = LuceneIndexReader(LUCENE_INDEX_DIR)
+    assert reader.stats()["documents"] == 1, "The old document should have been replaced."
+    assert "TestID" in keyword_search("expense dashboard", top_k=1), "The new metadata should be searchable."
+    assert keyword_search("Google OAuth login", top_k=1) == [], "The old metadata should no longer match."
+
+
+def test_delete_documents():
+    """Test that deleted documents are no longer found and unknown names are ignored."""
+    store_jsonld("SecondID", {"name": "Dashboard", "description": "Expense dashboard with charts"})
+    assert delete_documents(["TestID", "UnknownID"]), "Deleting should succeed."
+
+    reader = LuceneIndexReader(LUCENE_INDEX_DIR)
+    assert reader.stats()["documents"] == 1, "Only the remaining document should be counted."
+    assert keyword_search("Google OAuth login", top_k=5) == [], "A deleted document should not be found."
+    assert "SecondID" in keyword_search("expense dashboard", top_k=1)
+
+
+def test_store_jsonld_batch_with_non_dict():
+    """Test that a batch containing invalid metadata is rejected."""
+    assert not store_jsonld_batch([("Good", {"a": "b"}), ("Bad", "Test")]), "Batch with a non-dict should fail."
+
+
 
 def test_invalid_index_with_subdirectory():
     """Test handling of invalid index with subdirectories."""
@@ -156,3 +228,79 @@ def test_empty_index_directory():
 
     results = keyword_search("test query", top_k=5)
     assert results == [], "Search should return an empty list for an empty index directory."
+
+
+class FakeSearcher:
+    """Stand-in for LuceneSearcher that records how often it is opened and closed."""
+    opened = 0
+
+    def __init__(self, index_dir):
+        FakeSearcher.opened += 1
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_manager(tmp_path, monkeypatch):
+    """Creates a SearcherManager over a directory holding a fake commit point."""
+    monkeypatch.setattr(pyserini_indexer, "LuceneSearcher", FakeSearcher)
+    FakeSearcher.opened = 0
+    (tmp_path / "segments_1").write_text("")
+    return SearcherManager(str(tmp_path)), tmp_path
+
+
+def test_searcher_is_reused_between_searches():
+    """Test that repeated searches share one open searcher."""
+    first = pyserini_indexer.searcher_manager.acquire()
+    pyserini_indexer.searcher_manager.release(first)
+    keyword_search("login", top_k=1)
+    second = pyserini_indexer.searcher_manager.acquire()
+    pyserini_indexer.searcher_manager.release(second)
+    assert first is second, "The searcher should only be reopened after a commit."
+
+
+def test_searcher_reopened_after_commit():
+    """Test that documents committed after the searcher was opened become visible."""
+    keyword_search("login", top_k=1)
+    store_jsonld("LateID", {"name": "Sidebar", "description": "Collapsible navigation sidebar"})
+    assert "LateID" in keyword_search("collapsible navigation sidebar", top_k=1), "New commits should be searchable."
+
+
+def test_manager_opens_once_per_commit(fake_manager):
+    """Test that the manager only opens a new searcher when the commit point changes."""
+    manager, index_dir = fake_manager
+    with manager.searcher() as first:
+        pass
+    with manager.searcher() as second:
+        pass
+    assert first is second and FakeSearcher.opened == 1, "The same commit should reuse the open searcher."
+
+    (index_dir / "segments_2").write_text("")
+    with manager.searcher() as third:
+        pass
+    assert third is not first and FakeSearcher.opened == 2, "A new commit should open a new searcher."
+    assert first.closed, "The replaced searcher should be closed."
+
+
+def test_manager_defers_close_while_in_use(fake_manager):
+    """Test that a replaced searcher stays open until its last user releases it."""
+    manager, index_dir = fake_manager
+    in_use = manager.acquire()
+    manager.invalidate()
+    with manager.searcher() as fresh:
+        assert fresh is not in_use, "Invalidation should open a fresh searcher."
+    assert not in_use.closed, "A searcher in use must not be closed."
+
+    manager.release(in_use)
+    assert in_use.closed, "The replaced searcher should close once released."
+
+
+def test_manager_without_commit(tmp_path, monkeypatch):
+    """Test that no searcher is returned for a directory without an index."""
+    monkeypatch.setattr(pyserini_indexer, "LuceneSearcher", FakeSearcher)
+    manager = SearcherManager(str(tmp_path / "missing"))
+    with manager.searcher() as searcher:
+        assert searcher is None, "A missing index should yield no searcher."
+
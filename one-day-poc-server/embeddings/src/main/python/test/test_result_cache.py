@@ -0,0 +1,78 @@
+import numpy as np
+
+from information_retrieval.result_cache import ResultCache, result_key
+
+
+def test_result_key_covers_every_parameter():
+    """Test that searches differing in query, embedding, top_k or filters get different keys."""
+    embedding = np.array([0.6, 0.8], dtype=np.float32)
+    key = result_key("login", embedding, 5, {"framework": ["react"]})
+
+    assert result_key("signup", embedding, 5, {"framework": ["react"]}) != key
+    assert result_key("login", np.array([0.8, 0.6]), 5, {"framework": ["react"]}) != key
+    assert result_key("login", embedding, 3, {"framework": ["react"]}) != key
+    assert result_key("login", embedding, 5, {"framework": ["vue"]}) != key
+    assert result_key("login", embedding, 5) != key
+
+
+def test_result_key_ignores_float_noise():
+    """Test that embeddings equal after int8 quantization share a key, whatever their type."""
+    embedding = np.array([0.6, 0.8], dtype=np.float32)
+    assert result_key("login", embedding, 5) == result_key("login", [0.6000001, 0.8], 5)
+
+
+def test_get_counts_hits_and_misses():
+    """Test that a hit returns the cached results and that lookups are counted."""
+    cache = ResultCache(max_entries=2)
+    assert cache.get("key", 0) is None
+    cache.put("key", 0, [("doc1", 0.5)])
+
+    assert cache.get("key", 0) == [("doc1", 0.5)]
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_new_generation_invalidates_entries():
+    """Test that entries computed at an older generation miss and are dropped."""
+    cache = ResultCache()
+    cache.put("key", (1, 1), [("doc1", 0.5)])
+
+    assert cache.get("key", (2, 1)) is None
+    assert cache.stats()["stale"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_entries_expire_after_ttl():
+    """Test that entries older than the time to live miss."""
+    now = [0.0]
+    cache = ResultCache(ttl_seconds=10, clock=lambda: now[0])
+    cache.put("key", 0, [("doc1", 0.5)])
+
+    now[0] = 10.0
+    assert cache.get("key", 0) == [("doc1", 0.5)]
+    now[0] = 10.5
+    assert cache.get("key", 0) is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_put_evicts_least_recently_used():
+    """Test that the least recently used entry is evicted once the cache is full."""
+    cache = ResultCache(max_entries=2)
+    cache.put("a", 0, [])
+    cache.put("b", 0, [])
+    cache.get("a", 0)
+    cache.put("c", 0, [])
+
+    assert cache.get("b", 0) is None
+    assert cache.get("a", 0) == []
+    assert cache.get("c", 0) == []
+
+
+def test_zero_size_disables_cache():
+    """Test that a cache with no capacity never stores anything."""
+    cache = ResultCache(max_entries=0)
+    cache.put("a", 0, [])
+
+    assert cache.get("a", 0) is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from information_retrieval import data_handler as dh, shard
+from information_retrieval.vector_search import codec, vector_store as vs
+
+FILES = ["FAISS_FILE", "MAPPINGS_FILE", "NAMES_FILE", "WAL_FILE", "WAL_COMPACTING_FILE", "LOCK_FILE"]
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    """A test client for a shard whose data files live in a temporary directory."""
+    for attribute in FILES:
+        monkeypatch.setattr(dh, attribute, getattr(dh, attribute))
+    monkeypatch.setattr(dh, "LUCENE_INDEX_DIR", str(tmp_path / "jsonld_index"))
+    monkeypatch.setattr(vs, "index", None)
+    monkeypatch.setattr(vs, "store", {})
+    shard.load(1, str(tmp_path / "shard-1"))
+    vs.drain_changes()
+    shard.app.config["TESTING"] = True
+    return shard.app.test_client()
+
+
+def encoded(*values):
+    vector = np.zeros(dh.VECTOR_DIMENSION, dtype=np.float32)
+    vector[:len(values)] = values
+    return codec.encode(vector / np.linalg.norm(vector), "float32")
+
+
+def test_load_uses_shard_directory(client, tmp_path):
+    """Test that the shard keeps its files in its own directory."""
+    assert dh.FAISS_FILE == str(tmp_path / "shard-1" / "faiss.index")
+    assert client.get("/ready").get_json() == {"status": "ready", "shard": 1, "templates": 0}
+
+
+def test_store_search_and_delete(client, tmp_path):
+    """Test that stored templates are searched with scores, persisted, and removed by deletes."""
+    response = client.post("/shard/store", json={"names": ["a", "b"], "embeddings": [encoded(1, 0), encoded(0, 1)],
+                                                  "encoding": "float32"}).get_json()
+    assert response == {"status": "success", "stored": 2}
+    assert (tmp_path / "shard-1" / "faiss.index").exists()
+
+    data = client.post("/shard/search", json={"embedding": encoded(1, 0.1), "encoding": "float32",
+                                              "top_k": 2}).get_json()
+    assert data["matches"] == ["a", "b"]
+    assert data["scores"][0] > data["scores"][1]
+
+    data = client.post("/shard/search", json={"embedding": encoded(1, 0.1), "encoding": "float32", "top_k": 2,
+                                              "allowed": ["b"]}).get_json()
+    assert data["matches"] == ["b"]
+
+    assert client.post("/shard/delete", json={"names": ["a", "c"]}).get_json() == {"status": "success", "removed": 1}
+    assert list(vs.store.values()) == ["b"]
+
+
+def test_store_rejects_mismatched_batch(client):
+    """Test that a store request needs one embedding per name."""
+    data = client.post("/shard/store", json={"names": ["a", "b"], "embeddings": [encoded(1)]}).get_json()
+    assert data["status"] == "error"
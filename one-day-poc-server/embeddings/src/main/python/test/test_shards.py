@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from information_retrieval.vector_search import codec, shards
+
+URLS = ["http://shard-0", "http://shard-1", "http://shard-2"]
+
+
+@pytest.fixture
+def fake_shards(monkeypatch):
+    """
+    Routes shard requests to in-memory shards that score stored vectors by inner product.
+    Returns the per-shard {name: vector} stores and the list of (url, payload) requests made.
+    """
+    stores = {url: {} for url in URLS}
+    requests = []
+
+    def post(url, payload, timeout):
+        base, path = url.rsplit("/shard/", 1)
+        requests.append((url, payload))
+        store = stores[base]
+        if path == "search":
+            embedding = codec.decode(payload["embedding"], payload["encoding"])
+            names = [name for name in store if "allowed" not in payload or name in payload["allowed"]]
+            scored = sorted(((name, float(store[name] @ embedding)) for name in names), key=lambda m: -m[1])
+            scored = scored[:payload["top_k"]]
+            return {"status": "success", "matches": [n for n, _ in scored], "scores": [s for _, s in scored]}
+        if path == "store":
+            for name, embedding in zip(payload["names"], payload["embeddings"]):
+                store[name] = codec.decode(embedding, payload["encoding"])
+            return {"status": "success", "stored": len(payload["names"])}
+        removed = [name for name in payload["names"] if store.pop(name, None) is not None]
+        return {"status": "success", "removed": len(removed)}
+
+    monkeypatch.setattr(shards, "SHARD_URLS", URLS)
+    monkeypatch.setattr(shards, "_post", post)
+    return stores, requests
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_shard_of_is_stable(monkeypatch):
+    """Test that a name always maps to the same shard within range."""
+    monkeypatch.setattr(shards, "SHARD_URLS", URLS)
+    assert shards.shard_of("LoginForm") == shards.shard_of("LoginForm")
+    assert {shards.shard_of(f"Template{i}") for i in range(100)} == {0, 1, 2}
+
+
+def test_store_sends_each_template_to_its_shard(fake_shards):
+    """Test that a batch is split so that every template lands on the shard holding its name."""
+    stores, requests = fake_shards
+    names = [f"Template{i}" for i in range(10)]
+    assert shards.store_embeddings(names, np.eye(10, 4, dtype=np.float32))
+
+    for name in names:
+        assert name in stores[URLS[shards.shard_of(name)]]
+    assert len(requests) == len({shards.shard_of(name) for name in names}), "One request per shard"
+
+
+def test_search_merges_shards_by_score(fake_shards):
+    """Test that the per-shard results are merged into one ranking, best first, truncated to top_k."""
+    names = [f"Template{i}" for i in range(12)]
+    vectors = np.stack([unit(1, i / 4) for i in range(12)])
+    shards.store_embeddings(names, vectors)
+
+    assert shards.semantic_search(unit(1, 0), top_k=3) == ["Template0", "Template1", "Template2"]
+
+
+def test_search_only_asks_shards_holding_allowed_names(fake_shards):
+    """Test that a filtered search goes to the shards holding the allowed names, with only their names."""
+    _, requests = fake_shards
+    names = [f"Template{i}" for i in range(12)]
+    shards.store_embeddings(names, np.stack([unit(1, i / 4) for i in range(12)]))
+    requests.clear()
+
+    assert shards.semantic_search(unit(1, 0), top_k=5, allowed={"Template7"}) == ["Template7"]
+    assert requests == [(f"{URLS[shards.shard_of('Template7')]}/shard/search", requests[0][1])]
+    assert requests[0][1]["allowed"] == ["Template7"]
+
+
+def test_failed_shard_is_left_out(fake_shards, monkeypatch):
+    """Test that a shard that cannot be reached does not fail the whole search."""
+    names = [f"Template{i}" for i in range(12)]
+    shards.store_embeddings(names, np.stack([unit(1, i / 4) for i in range(12)]))
+    down = URLS[shards.shard_of("Template0")]
+    post = shards._post
+    def failing_post(url, payload, timeout):
+        if url.startswith(down):
+            raise ConnectionError("refused")
+        return post(url, payload, timeout)
+    monkeypatch.setattr(shards, "_post", failing_post)
+
+    results = shards.semantic_search(unit(1, 0), top_k=12)
+    assert results and "Template0" not in results
+    assert all(shards.shard_of(name) != shards.shard_of("Template0") for name in results)
+    assert not shards.store_embeddings(["Template0"], unit(1, 0).reshape(1, -1))
+
+
+def test_delete_counts_removed_across_shards(fake_shards):
+    """Test that deletes reach the shards holding the names and report how many were removed."""
+    stores, _ = fake_shards
+    names = [f"Template{i}" for i in range(6)]
+    shards.store_embeddings(names, np.eye(6, 4, dtype=np.float32))
+    before = shards.generation
+
+    assert shards.delete_embeddings(["Template1", "Template4", "Missing"]) == 2
+    assert sum(len(store) for store in stores.values()) == 4
+    assert shards.generation == before + 1
@@ -1,9 +1,13 @@
+import sys
+import threading
+
 import pytest
 import numpy as np
 import faiss
 
-from information_retrieval.vector_search import vector_store
-from information_retrieval.vector_search.vector_store import semantic_search, store_embedding
+from information_retrieval.vector_search import index_factory, vector_store
+from information_retrieval.vector_search.index_factory import create_index
+from information_retrieval.vector_search.vector_store import semantic_search, store_embedding, store_embeddings
 
 @pytest.fixture
 def setup_faiss_index():
@@ -11,6 +15,7 @@ def setup_faiss_index():
 
     vector_store.index = faiss.IndexFlatIP(384) 
     vector_store.store = {}
+    vector_store.drain_changes()
 
 
 @pytest.fixture
@@ -44,8 +49,344 @@ def test_store_embedding_success(setup_faiss_index, sample_embedding):
 
 
 def test_store_embedding_untrained_index():
-    """Test storing an embedding when the index is untrained (should fail)."""
-    vector_store.index = faiss.IndexIVFFlat(faiss.IndexFlatL2(384), 384, 10) 
+    """Test that an embedding stored before the index can be trained waits in a flat index, where it is found."""
+    vector_store.index = faiss.IndexIVFFlat(faiss.IndexFlatL2(384), 384, 10)
+    vector_store.store = {}
     sample_vector = np.random.rand(384).astype(np.float32)
-    result = store_embedding("test_name", sample_vector)
-    assert not result, "store_embedding should return False if index is untrained"
+    assert store_embedding("test_name", sample_vector), "store_embedding should keep the vector until training"
+    assert isinstance(faiss.downcast_index(vector_store.index.index), faiss.IndexFlat)
+    assert semantic_search(sample_vector.tolist(), 1) == ["test_name"]
+
+
+def test_store_embeddings_batch(setup_faiss_index):
+    """Test storing a batch of embeddings with one call."""
+    vectors = np.random.rand(3, 384).astype(np.float32)
+    assert store_embeddings(["a", "b", "c"], vectors), "store_embeddings should return True"
+    assert vector_store.index.ntotal == 3, "All vectors should be added to the index"
+    assert vector_store.store == {0: "a", 1: "b", 2: "c"}, "Names should map to consecutive ids"
+
+    result = semantic_search(vectors[1].tolist(), 1)
+    assert result == ["b"], "Each vector should be retrievable under its own name"
+
+
+def test_store_embeddings_length_mismatch(setup_faiss_index):
+    """Test that a batch with mismatched names and vectors is rejected."""
+    vectors = np.random.rand(2, 384).astype(np.float32)
+    assert not store_embeddings(["only_one"], vectors), "store_embeddings should return False on mismatch"
+    assert vector_store.index.ntotal == 0, "Nothing should be added on failure"
+
+
+def test_drain_changes(setup_faiss_index, sample_embedding):
+    """Test that inserts are reported once for persistence."""
+    store_embedding("test_name", sample_embedding)
+    changes = vector_store.drain_changes()
+
+    assert len(changes) == 1, "The insert should be reported"
+    idx, name, vector = changes[0]
+    assert (idx, name) == (0, "test_name") and np.allclose(vector, sample_embedding)
+    assert vector_store.drain_changes() == [], "Drained inserts should not be reported again"
+
+
+def test_store_embeddings_trains_untrained_index():
+    """Test that a large enough batch trains an untrained IVF index before it is added."""
+    vector_store.index = faiss.IndexIVFFlat(faiss.IndexFlatIP(384), 384, 4, faiss.METRIC_INNER_PRODUCT)
+    vector_store.store = {}
+    vectors = np.random.rand(200, 384).astype(np.float32)
+
+    assert store_embeddings([f"name_{i}" for i in range(200)], vectors), "The batch should train the index"
+    assert vector_store.index.is_trained and vector_store.index.ntotal == 200
+    assert faiss.try_extract_index_ivf(vector_store.index) is not None
+
+
+def test_ivf_index_trained_by_single_inserts(monkeypatch):
+    """Test that an IVF index is trained once enough templates have been stored one at a time."""
+    monkeypatch.setattr(index_factory, "IVF_NLIST", 16)
+    vector_store.index = create_index(384, "ivf_flat")
+    vector_store.store = {}
+    vectors = np.random.default_rng(0).standard_normal((20, 384)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    for i in range(15):
+        assert store_embedding(f"name_{i}", vectors[i])
+    assert faiss.try_extract_index_ivf(vector_store.index) is None, "Too few vectors to train on yet"
+    assert semantic_search(vectors[3].tolist(), 1) == ["name_3"], "Waiting vectors should be searchable"
+
+    for i in range(15, 20):
+        assert store_embedding(f"name_{i}", vectors[i])
+    assert faiss.try_extract_index_ivf(vector_store.index) is not None and vector_store.index.ntotal == 20
+    faiss.try_extract_index_ivf(vector_store.index).nprobe = 16
+    assert all(semantic_search(vectors[i].tolist(), 1) == [f"name_{i}"] for i in range(20))
+
+
+
+def test_ids_are_explicit_and_never_reused(setup_faiss_index):
+    """Test that new vectors get ids after the highest stored id, even when earlier ids are missing."""
+    vector_store.store = {5: "existing"}
+    vectors = np.random.rand(2, 384).astype(np.float32)
+    assert store_embeddings(["a", "b"], vectors)
+
+    assert vector_store.store == {5: "existing", 6: "a", 7: "b"}
+    assert semantic_search(vectors[1].tolist(), 1) == ["b"], "The vector should be found under its own id"
+
+
+def test_writes_wait_for_searches_of_the_replaced_index(setup_faiss_index, sample_embedding):
+    """Test that a write publishes its changes at once but leaves the index a search is using untouched until it is done."""
+    store_embedding("first", sample_embedding)
+    store_embedding("second", sample_embedding)
+    with vector_store._searching() as searched:
+        writer = threading.Thread(target=store_embedding, args=("third", sample_embedding))
+        writer.start()
+        writer.join(0.2)
+        assert vector_store.index is not searched and vector_store.index.ntotal == 3
+        assert searched.ntotal == 2, "The index a search is using should not change under it"
+        assert semantic_search(sample_embedding.tolist(), 3, {"third"}) == ["third"], "Searches should not wait"
+    writer.join(5)
+    assert not writer.is_alive() and searched.ntotal == 3, "The replaced index should then become the spare copy"
+
+
+def test_inserts_do_not_copy_the_index(setup_faiss_index, sample_embedding, monkeypatch):
+    """Test that once there is a spare copy, inserts and replacements no longer clone the whole index."""
+    store_embedding("first", sample_embedding)
+    store_embedding("second", sample_embedding)
+    monkeypatch.setattr(faiss, "clone_index", lambda index: pytest.fail("The index was cloned"))
+    for i in range(5):
+        store_embedding(f"name_{i}", np.random.rand(384).astype(np.float32))
+    store_embedding("first", sample_embedding)
+    vector_store.delete_embeddings(["second"])
+
+    assert vector_store.index.ntotal == 6 and vector_store._spare.ntotal == 6
+
+
+def test_filtered_searches_and_writes_after_reload(setup_faiss_index):
+    """Test that filtered searches running alongside writes after the mappings were reloaded all finish."""
+    vectors = np.random.rand(200, 384).astype(np.float32)
+    store_embeddings([f"name_{i}" for i in range(200)], vectors)
+    vector_store.store = dict(vector_store.store)  # as loaded from disk, so ids_by_name has to be rebuilt
+
+    def write():
+        for i in range(20):
+            store_embedding(f"name_{i}", vectors[i])
+
+    def search():
+        for i in range(50):
+            semantic_search(vectors[i].tolist(), 1, {f"name_{i}", f"name_{i + 1}"})
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert not any(thread.is_alive() for thread in threads), "Searches and writes should never wait on each other"
+
+
+def test_concurrent_searches_and_inserts(setup_faiss_index):
+    """Test that searches running alongside inserts only ever return the name stored with the vector."""
+    vectors = np.random.rand(40, 384).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    published, mismatches = set(), []
+
+    def insert(start):
+        for i in range(start, 40, 4):
+            store_embedding(f"name_{i}", vectors[i])
+            published.add(i)
+
+    def search():
+        for _ in range(200):
+            i = np.random.randint(40)
+            was_published = i in published
+            result = semantic_search(vectors[i].tolist(), 1)
+            if was_published and result != [f"name_{i}"]:
+                mismatches.append((i, result))
+
+    threads = [threading.Thread(target=insert, args=(start,)) for start in range(4)]
+    threads += [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert vector_store.index.ntotal == 40 and len(vector_store.store) == 40, "Every insert should get its own id"
+    assert sorted(vector_store.store.values()) == sorted(f"name_{i}" for i in range(40))
+    assert mismatches == []
+
+
+def test_store_embedding_replaces_same_name(setup_faiss_index):
+    """Test that storing a name again replaces its embedding instead of adding a duplicate."""
+    old, new = np.random.rand(2, 384).astype(np.float32)
+    store_embedding("template", old)
+    store_embedding("template", new)
+
+    assert list(vector_store.store.values()) == ["template"], "The name should be stored once"
+    assert vector_store.index.ntotal == 1, "The old vector should be removed from a flat index"
+    assert np.allclose(vector_store.index.reconstruct(max(vector_store.store)), new)
+
+
+def test_store_embeddings_keeps_last_duplicate_in_batch(setup_faiss_index):
+    """Test that a name repeated within one batch is stored once, with its last embedding."""
+    vectors = np.random.rand(3, 384).astype(np.float32)
+    assert store_embeddings(["a", "b", "a"], vectors)
+
+    assert sorted(vector_store.store.values()) == ["a", "b"]
+    assert semantic_search(vectors[2].tolist(), 1) == ["a"]
+
+
+def test_delete_embeddings(setup_faiss_index):
+    """Test that deleted names are no longer found and the deletes are reported for persistence."""
+    vectors = np.random.rand(2, 384).astype(np.float32)
+    store_embeddings(["keep", "drop"], vectors)
+    vector_store.drain_changes()
+
+    assert vector_store.delete_embeddings(["drop", "missing"]) == 1
+    assert list(vector_store.store.values()) == ["keep"]
+    assert semantic_search(vectors[1].tolist(), 2) == ["keep"]
+    assert vector_store.drain_changes() == [(1, None, None)], "The delete should be reported"
+
+
+def test_scored_search_ranks_by_similarity(setup_faiss_index):
+    """Test that scored results come best first, with the inner product as the score."""
+    vectors = np.eye(3, 384, dtype=np.float32)
+    store_embeddings(["a", "b", "c"], vectors)
+    query = vectors[1] + 0.5 * vectors[2]
+
+    scored = vector_store.scored_search(query, 2)
+    assert [name for name, _ in scored] == ["b", "c"]
+    assert [score for _, score in scored] == pytest.approx([1.0, 0.5])
+    assert vector_store.scored_search(query, 2, allowed={"a"}) == [("a", pytest.approx(0.0))]
+
+
+def test_writes_bump_generation(setup_faiss_index, sample_embedding):
+    """Test that every insert and delete publishes a new generation, so that cached results are invalidated."""
+    before = vector_store.generation
+    store_embedding("a", sample_embedding)
+    assert vector_store.generation == before + 1
+    vector_store.delete_embeddings(["a"])
+    assert vector_store.generation == before + 2
+
+
+def test_deleted_vectors_are_skipped_until_compaction(setup_faiss_index, monkeypatch):
+    """Test that an index that cannot remove in place hides deleted vectors and is rebuilt once enough pile up."""
+    monkeypatch.setattr(vector_store, "TOMBSTONE_COMPACT_RATIO", 0.5)
+    vector_store.index = create_index(384, "hnsw")
+    vectors = np.random.rand(4, 384).astype(np.float32)
+    store_embeddings(["a", "b", "c", "d"], vectors)
+
+    vector_store.delete_embeddings(["a"])
+    assert vector_store.index.ntotal == 4, "The deleted vector stays in the index until compaction"
+    assert semantic_search(vectors[0].tolist(), 3) == semantic_search(vectors[0].tolist(), 4)[:3]
+    assert "a" not in semantic_search(vectors[0].tolist(), 4)
+
+    vector_store.delete_embeddings(["b", "c"])
+    assert vector_store.index.ntotal == 1, "The index should be rebuilt without the deleted vectors"
+    assert semantic_search(vectors[3].tolist(), 4) == ["d"]
+
+
+def test_scalar_quantized_index_removes_in_place(setup_faiss_index, monkeypatch):
+    """Test that a scalar-quantized index drops deleted vectors straight away, like a flat one."""
+    monkeypatch.setattr(index_factory, "SQ_TRAINING_POINTS", 3)
+    vector_store.index = create_index(384, "sq_int8")
+    vectors = np.random.rand(3, 384).astype(np.float32)
+    store_embeddings(["a", "b", "c"], vectors)
+
+    vector_store.delete_embeddings(["a"])
+    assert vector_store.index.ntotal == 2
+    assert "a" not in semantic_search(vectors[0].tolist(), 3)
+
+
+def test_scalar_quantized_index_trained_by_single_inserts(setup_faiss_index):
+    """Test that templates stored one at a time into an int8 index are still told apart once it is trained."""
+    vector_store.index = create_index(384, "sq_int8")
+    vectors = np.random.default_rng(0).standard_normal((300, 384)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    for i, vector in enumerate(vectors):
+        assert store_embedding(f"name_{i}", vector)
+
+    assert isinstance(faiss.downcast_index(vector_store.index.index), faiss.IndexScalarQuantizer)
+    hits = sum(semantic_search(vector.tolist(), 1) == [f"name_{i}"] for i, vector in enumerate(vectors))
+    assert hits / len(vectors) >= 0.95, f"Only {hits} of {len(vectors)} templates found themselves"
+
+
+def test_semantic_search_among_allowed_names(setup_faiss_index):
+    """Test that only allowed names are returned, and none if no stored template is allowed."""
+    vectors = np.random.rand(3, 384).astype(np.float32)
+    store_embeddings(["a", "b", "c"], vectors)
+    vector_store.delete_embeddings(["c"])
+
+    assert semantic_search(vectors[0].tolist(), 3, allowed={"b", "c"}) == ["b"]
+    assert semantic_search(vectors[0].tolist(), 3, allowed={"missing"}) == []
+
+
+def unit(*values):
+    vector = np.zeros(384, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector / np.linalg.norm(vector)
+
+
+def test_store_chunk_embeddings_replaces_previous_chunks(setup_faiss_index):
+    """Test that every chunk of a template is indexed, and that storing it again replaces all of them."""
+    assert vector_store.store_chunk_embeddings(["a", "a", "a", "b"], np.stack([unit(1), unit(0, 1), unit(0, 0, 1), unit(1, 1)]))
+    assert vector_store.index.ntotal == 4
+
+    assert vector_store.store_chunk_embeddings(["a"], unit(0, 0, 0, 1).reshape(1, -1))
+    assert sorted(vector_store.store.values()) == ["a", "b"], "The old chunks of a should be gone"
+    assert semantic_search(unit(0, 1).tolist(), 2) == ["b", "a"]
+
+
+def test_chunk_pooling(setup_faiss_index, monkeypatch):
+    """Test that a template scores as its best chunk by default, or as the sum of its matching chunks."""
+    vector_store.store_chunk_embeddings(["many", "many", "one"], np.stack([unit(1, 1), unit(1, 1.2), unit(1, 0.1)]))
+    query = unit(1).tolist()
+    assert semantic_search(query, 2) == ["one", "many"]
+
+    monkeypatch.setattr(vector_store, "CHUNK_POOLING", "sum")
+    assert semantic_search(query, 2) == ["many", "one"]
+
+
+def test_chunky_templates_do_not_crowd_out_others(setup_faiss_index, monkeypatch):
+    """Test that top_k distinct templates are returned even when one template owns all the nearest vectors."""
+    monkeypatch.setattr(vector_store, "CHUNK_SEARCH_FACTOR", 1)
+    vector_store.store_chunk_embeddings(["big"] * 20 + ["small"], np.stack([unit(1, i / 100) for i in range(20)] + [unit(0, 1)]))
+
+    assert semantic_search(unit(1).tolist(), 2) == ["big", "small"]
+
+
+def test_deleting_highest_id_does_not_free_it(setup_faiss_index):
+    """Test that a template stored after the one with the highest id was deleted never takes over its vector."""
+    vector_store.index = create_index(384, "hnsw")
+    vectors = np.random.default_rng(0).standard_normal((11, 384)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    store_embeddings([str(i) for i in range(10)], vectors[:10])
+
+    vector_store.delete_embeddings(["9"])
+    store_embedding("new", vectors[10])
+
+    assert 9 not in vector_store.store and "new" in vector_store.store.values()
+    assert "new" not in semantic_search(vectors[9].tolist(), 1), "The deleted vector should not resurface as 'new'"
+    assert semantic_search(vectors[10].tolist(), 1) == ["new"]
+
+
+def test_filtered_search_during_writes(setup_faiss_index):
+    """Test that filtered searches neither fail nor lose templates while other templates are stored and deleted."""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switches threads often enough to interleave the searches with the writes
+    vectors = np.random.default_rng(0).standard_normal((5010, 384)).astype(np.float32)
+    store_embeddings([f"kept_{i}" for i in range(5000)], vectors[:5000])
+    stop, errors = threading.Event(), []
+
+    def write():
+        while not stop.is_set():
+            store_embeddings([f"churn_{i}" for i in range(10)], vectors[5000:])
+            vector_store.delete_embeddings([f"churn_{i}" for i in range(10)])
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(300):
+            try:
+                assert set(semantic_search(vectors[0], 3, allowed={"kept_0", "kept_1", "kept_2", "churn_0"})) >= {"kept_0"}
+            except Exception as e:
+                errors.append(e)
+    finally:
+        stop.set()
+        writer.join()
+        sys.setswitchinterval(interval)
+    assert errors == []
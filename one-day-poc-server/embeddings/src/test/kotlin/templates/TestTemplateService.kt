@@ -7,6 +7,7 @@ import io.ktor.client.*
 import io.ktor.client.engine.mock.*
 import io.ktor.client.statement.HttpResponse
 import io.ktor.http.*
+import io.ktor.http.content.TextContent
 import io.mockk.coEvery
 import io.mockk.every
 import io.mockk.mockk
@@ -34,7 +35,7 @@ class TestTemplateService {
 
     private val semanticSearchResponseSuccessJson =
         """
-        {"status":"success", "matches":["TemplateA", "TemplateB"]}
+        {"status":"success", "matches":["TemplateA", "TemplateB"], "scores":[0.032, 0.016], "timed_out":[]}
         """.trimIndent()
 
     @BeforeEach
@@ -247,6 +248,70 @@ class TestTemplateService {
             }
         }
 
+    @Test
+    fun `Test retrieve returns expected response on success`() =
+        runBlocking {
+            val engine =
+                MockEngine { request ->
+                    when (request.url.toString()) {
+                        EmbeddingConstants.RETRIEVE_URL ->
+                            respond(
+                                content = semanticSearchResponseSuccessJson,
+                                status = HttpStatusCode.OK,
+                                headers = headersOf("Content-Type" to listOf(ContentType.Application.Json.toString())),
+                            )
+
+                        else -> error("Unhandled ${request.url}")
+                    }
+                }
+            val client = HttpClient(engine)
+            TemplateService.httpClient = client
+
+            val response = TemplateService.retrieve("Test query")
+            assertEquals("success", response.status)
+            assertEquals(listOf("TemplateA", "TemplateB"), response.matches)
+        }
+
+    @Test
+    fun `Test retrieve sends filters only when given`() =
+        runBlocking {
+            val bodies = mutableListOf<String>()
+            val engine =
+                MockEngine { request ->
+                    bodies.add((request.body as TextContent).text)
+                    respond(
+                        content = semanticSearchResponseSuccessJson,
+                        status = HttpStatusCode.OK,
+                        headers = headersOf("Content-Type" to listOf(ContentType.Application.Json.toString())),
+                    )
+                }
+            TemplateService.httpClient = HttpClient(engine)
+
+            TemplateService.retrieve("Test query")
+            TemplateService.retrieve("Test query", mapOf("framework" to listOf("React")))
+            assertEquals("""{"query":"Test query"}""", bodies[0])
+            assertEquals("""{"query":"Test query","filters":{"framework":["React"]}}""", bodies[1])
+        }
+
+    @Test
+    fun `Test retrieve throws exception if response is not formatted correctly`(): Unit =
+        runBlocking {
+            val engine =
+                MockEngine { _ ->
+                    respond(
+                        content = "invalid json",
+                        status = HttpStatusCode.OK,
+                        headers = headersOf("Content-Type" to listOf(ContentType.Application.Json.toString())),
+                    )
+                }
+            val client = HttpClient(engine)
+            TemplateService.httpClient = client
+
+            assertFailsWith<IllegalStateException> {
+                TemplateService.retrieve("Test query")
+            }
+        }
+
     @Test // For coverage only!
     fun `Test getHttpClient$embeddings function is called`() {
         val client =
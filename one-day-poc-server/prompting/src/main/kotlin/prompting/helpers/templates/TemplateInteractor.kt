@@ -6,7 +6,7 @@ import utils.environment.EnvironmentLoader
 
 /**
  * Interacts with templates by fetching and storing them.
- * Uses TemplateService for embedding and searching, and TemplateStorageUtils for file operations.
+ * Uses TemplateService for retrieval, and TemplateStorageUtils for file operations.
  */
 object TemplateInteractor {
     /**
@@ -16,8 +16,7 @@ object TemplateInteractor {
      * @return A list of template contents as strings
      */
     suspend fun fetchTemplates(prompt: String): List<String> {
-        val embedding = runCatching { TemplateService.embed(prompt, "prompt").embedding }.getOrElse { emptyList() }
-        val templateIds = runCatching { TemplateService.search(embedding, prompt).matches }.getOrElse { emptyList() }
+        val templateIds = runCatching { TemplateService.retrieve(prompt).matches }.getOrElse { emptyList() }
 
         return templateIds.mapNotNull { id ->
             getTemplateContent(id)
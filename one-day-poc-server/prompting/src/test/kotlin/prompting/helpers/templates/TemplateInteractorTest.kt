@@ -1,6 +1,5 @@
 package kcl.seg.rtt.prompting.helpers.templates
 
-import embeddings.TemplateEmbedResponse
 import embeddings.TemplateSearchResponse
 import io.mockk.*
 import kotlinx.coroutines.runBlocking
@@ -32,23 +31,15 @@ class TemplateInteractorTest {
     fun `test fetchTemplates returns content for matching templates`() =
         runBlocking {
             val prompt = "test prompt"
-            val embedding = listOf(0.1f, 0.2f, 0.3f)
             val templateIds = listOf("123e4567-e89b-12d3-a456-426614174000", "223e4567-e89b-12d3-a456-426614174000")
             val templateContent1 = "Template content 1"
             val templateContent2 = "Template content 2"
 
-            val embedResponse = mockk<TemplateEmbedResponse>()
-            every { embedResponse.embedding } returns embedding
-
             val searchResponse = mockk<TemplateSearchResponse>()
             every { searchResponse.matches } returns templateIds
 
             coEvery {
-                TemplateService.embed(prompt, "prompt")
-            } returns embedResponse
-
-            coEvery {
-                TemplateService.search(embedding, prompt)
+                TemplateService.retrieve(prompt)
             } returns searchResponse
 
             coEvery {
@@ -78,8 +69,7 @@ class TemplateInteractorTest {
             assertEquals(templateContent1, result[0])
             assertEquals(templateContent2, result[1])
             coVerify {
-                TemplateService.embed(prompt, "prompt")
-                TemplateService.search(embedding, prompt)
+                TemplateService.retrieve(prompt)
                 TemplateStorageService.getTemplateById(templateIds[0])
                 TemplateStorageService.getTemplateById(templateIds[1])
                 TemplateStorageUtils.retrieveFileContent("template1.txt")
@@ -91,20 +81,12 @@ class TemplateInteractorTest {
     fun `test fetchTemplates returns empty list when no templates match`() =
         runBlocking {
             val prompt = "test prompt"
-            val embedding = listOf(0.1f, 0.2f, 0.3f)
-
-            val embedResponse = mockk<TemplateEmbedResponse>()
-            every { embedResponse.embedding } returns embedding
 
             val searchResponse = mockk<TemplateSearchResponse>()
             every { searchResponse.matches } returns emptyList()
 
             coEvery {
-                TemplateService.embed(prompt, "prompt")
-            } returns embedResponse
-
-            coEvery {
-                TemplateService.search(embedding, prompt)
+                TemplateService.retrieve(prompt)
             } returns searchResponse
 
             val result = TemplateInteractor.fetchTemplates(prompt)
@@ -112,8 +94,7 @@ class TemplateInteractorTest {
             assertTrue(result.isEmpty())
 
             coVerify {
-                TemplateService.embed(prompt, "prompt")
-                TemplateService.search(embedding, prompt)
+                TemplateService.retrieve(prompt)
             }
             coVerify(exactly = 0) {
                 TemplateStorageService.getTemplateById(any())
@@ -186,47 +167,20 @@ class TemplateInteractorTest {
         }
 
     @Test
-    fun `test fetchTemplates when embed fails returns empty list`() =
+    fun `test fetchTemplates when retrieve fails returns empty list`() =
         runBlocking {
             val prompt = "test prompt"
 
             coEvery {
-                TemplateService.embed(prompt, "prompt")
-            } throws RuntimeException("Embedding failed")
+                TemplateService.retrieve(prompt)
+            } throws RuntimeException("Retrieval failed")
 
             val result = TemplateInteractor.fetchTemplates(prompt)
 
             assertTrue(result.isEmpty())
 
             coVerify {
-                TemplateService.embed(prompt, "prompt")
-            }
-        }
-
-    @Test
-    fun `test fetchTemplates when search fails returns empty list`() =
-        runBlocking {
-            val prompt = "test prompt"
-            val embedding = listOf(0.1f, 0.2f, 0.3f)
-
-            val embedResponse = mockk<TemplateEmbedResponse>()
-            every { embedResponse.embedding } returns embedding
-
-            coEvery {
-                TemplateService.embed(prompt, "prompt")
-            } returns embedResponse
-
-            coEvery {
-                TemplateService.search(embedding, prompt)
-            } throws RuntimeException("Search failed")
-
-            val result = TemplateInteractor.fetchTemplates(prompt)
-
-            assertTrue(result.isEmpty())
-
-            coVerify {
-                TemplateService.embed(prompt, "prompt")
-                TemplateService.search(embedding, prompt)
+                TemplateService.retrieve(prompt)
             }
             coVerify(exactly = 0) {
                 TemplateStorageService.getTemplateById(any())
@@ -238,21 +192,13 @@ class TemplateInteractorTest {
     fun `test fetchTemplates when template not found returns empty list`() =
         runBlocking {
             val prompt = "test prompt"
-            val embedding = listOf(0.1f, 0.2f, 0.3f)
             val templateId = "123e4567-e89b-12d3-a456-426614174000"
 
-            val embedResponse = mockk<TemplateEmbedResponse>()
-            every { embedResponse.embedding } returns embedding
-
             val searchResponse = mockk<TemplateSearchResponse>()
             every { searchResponse.matches } returns listOf(templateId)
 
             coEvery {
-                TemplateService.embed(prompt, "prompt")
-            } returns embedResponse
-
-            coEvery {
-                TemplateService.search(embedding, prompt)
+                TemplateService.retrieve(prompt)
             } returns searchResponse
 
             coEvery {
@@ -264,8 +210,7 @@ class TemplateInteractorTest {
             assertTrue(result.isEmpty())
 
             coVerify {
-                TemplateService.embed(prompt, "prompt")
-                TemplateService.search(embedding, prompt)
+                TemplateService.retrieve(prompt)
                 TemplateStorageService.getTemplateById(templateId)
             }
             coVerify(exactly = 0) {
@@ -277,21 +222,13 @@ class TemplateInteractorTest {
     fun `test fetchTemplates when template not found by ID returns empty list`() =
         runBlocking {
             val prompt = "test prompt"
-            val embedding = listOf(0.1f, 0.2f, 0.3f)
             val templateId = "123e4567-e89b-12d3-a456-426614174000"
 
-            val embedResponse = mockk<TemplateEmbedResponse>()
-            every { embedResponse.embedding } returns embedding
-
             val searchResponse = mockk<TemplateSearchResponse>()
             every { searchResponse.matches } returns listOf(templateId)
 
             coEvery {
-                TemplateService.embed(prompt, "prompt")
-            } returns embedResponse
-
-            coEvery {
-                TemplateService.search(embedding, prompt)
+                TemplateService.retrieve(prompt)
             } returns searchResponse
 
             coEvery {
@@ -303,8 +240,7 @@ class TemplateInteractorTest {
             assertTrue(result.isEmpty())
 
             coVerify {
-                TemplateService.embed(prompt, "prompt")
-                TemplateService.search(embedding, prompt)
+                TemplateService.retrieve(prompt)
                 TemplateStorageService.getTemplateById(templateId)
             }
             coVerify(exactly = 0) {
@@ -168,7 +168,7 @@ object TemplateLibrarySeeder {
         host: String = MICROSERVICE_HOST,
         port: Int = MICROSERVICE_PORT,
         timeoutMillis: Long = 120000,
-        pollIntervalMillis: Long = 5000,
+        pollIntervalMillis: Long = 500,
     ) {
         val startTime = System.currentTimeMillis()
         val endTime = startTime + timeoutMillis